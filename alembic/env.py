@@ -0,0 +1,78 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import Connection, create_engine
+from sqlalchemy.pool import NullPool
+
+from models import MESSAGE_DEFAULT_PARTITION, MESSAGE_PARTITION_PATTERN, Base
+from settings import get_settings, sync_database_url
+
+config = context.config
+target_metadata = Base.metadata
+# Whether a new, empty `messages` is created partitioned (revision 0006)
+config.attributes.setdefault("messages_partitioned", get_settings().messages_partitioned)
+
+# The app passes its own connection and keeps its logging as it is
+if config.config_file_name is not None and "connection" not in config.attributes:
+    fileConfig(config.config_file_name)
+
+
+def include_object(obj, name, type_, reflected, compare_to) -> bool:
+    """Leave out what the models do not declare: full-text search objects and message partitions."""
+    if type_ == "table":
+        return not (
+            "_fts" in name
+            or name == MESSAGE_DEFAULT_PARTITION
+            or MESSAGE_PARTITION_PATTERN.match(name)
+        )
+    if type_ in ("column", "index"):
+        return "search_vector" not in name
+    return True
+
+
+def database_urls() -> list:
+    """The primary and every shard, each once."""
+    settings = get_settings()
+    urls = [settings.constructed_database_url]
+    urls.extend(url for url in settings.database_shard_urls if url not in urls)
+    return [sync_database_url(url) for url in urls]
+
+
+def configure(**options) -> None:
+    context.configure(
+        target_metadata=target_metadata,
+        include_object=include_object,
+        compare_type=True,
+        **options,
+    )
+
+
+def run_migrations_offline() -> None:
+    """Emit the SQL for the primary database instead of running it."""
+    configure(url=database_urls()[0], literal_binds=True, dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_on(connection: Connection) -> None:
+    configure(connection=connection, render_as_batch=connection.dialect.name == "sqlite")
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations_on(connection)
+        return
+    for url in database_urls():
+        engine = create_engine(url, poolclass=NullPool)
+        with engine.connect() as connection:
+            run_migrations_on(connection)
+        engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
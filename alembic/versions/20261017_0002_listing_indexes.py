@@ -0,0 +1,30 @@
+"""keyset pagination indexes for conversation and message listing
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 21:16:36.120114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_conversations_updated_at_id', 'conversations', ['updated_at', 'id'], unique=False)
+    op.create_index('ix_messages_conversation_id_created_at_id', 'messages', ['conversation_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_messages_created_at_id', 'messages', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_created_at_id', table_name='messages')
+    op.drop_index('ix_messages_conversation_id_created_at_id', table_name='messages')
+    op.drop_index('ix_conversations_updated_at_id', table_name='conversations')
@@ -0,0 +1,82 @@
+"""full-text search over conversation titles and message contents
+
+PostgreSQL gets generated tsvector columns with GIN indexes; SQLite gets
+external-content FTS5 tables kept in sync by triggers, rebuilt here from the
+rows that already exist.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 21:16:36.451862
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+POSTGRESQL = [
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', title)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_conversations_search_vector "
+    "ON conversations USING GIN (search_vector)",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', prompt_content || ' ' || response_content)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+]
+
+SQLITE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5("
+    "title, content='conversations', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN "
+    "INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN "
+    "INSERT INTO conversations_fts(conversations_fts, rowid, title) "
+    "VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE OF title ON conversations BEGIN "
+    "INSERT INTO conversations_fts(conversations_fts, rowid, title) "
+    "VALUES ('delete', old.id, old.title); "
+    "INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title); END",
+    "INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "prompt_content, response_content, content='messages', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, prompt_content, response_content) "
+    "VALUES (new.id, new.prompt_content, new.response_content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, prompt_content, response_content) "
+    "VALUES ('delete', old.id, old.prompt_content, old.response_content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_au "
+    "AFTER UPDATE OF prompt_content, response_content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, prompt_content, response_content) "
+    "VALUES ('delete', old.id, old.prompt_content, old.response_content); "
+    "INSERT INTO messages_fts(rowid, prompt_content, response_content) "
+    "VALUES (new.id, new.prompt_content, new.response_content); END",
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for statement in {"postgresql": POSTGRESQL, "sqlite": SQLITE}.get(dialect, []):
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector")
+        op.execute("ALTER TABLE conversations DROP COLUMN IF EXISTS search_vector")
+    elif dialect == "sqlite":
+        for trigger in ("messages_fts_ai", "messages_fts_ad", "messages_fts_au",
+                        "conversations_fts_ai", "conversations_fts_ad", "conversations_fts_au"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS messages_fts")
+        op.execute("DROP TABLE IF EXISTS conversations_fts")
@@ -0,0 +1,70 @@
+"""per-conversation usage counters and daily usage rollups
+
+Both are backfilled from the messages that already exist.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 21:16:36.617209
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTERS = ('message_count', 'failed_message_count', 'prompt_tokens_total', 'response_tokens_total', 'total_tokens')
+
+
+def upgrade() -> None:
+    for name in COUNTERS:
+        op.add_column('conversations', sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+    op.add_column('conversations', sa.Column('last_message_at', sa.DateTime(), nullable=True))
+    op.create_table('usage_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('model_type', sa.String(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('failed_count', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+    sa.Column('response_tokens', sa.Integer(), nullable=False),
+    sa.Column('total_tokens', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'model_type')
+    )
+
+    op.execute(
+        "UPDATE conversations SET "
+        "message_count = (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.id), "
+        "failed_message_count = (SELECT COUNT(*) FROM messages m "
+        "WHERE m.conversation_id = conversations.id AND NOT m.is_success), "
+        "prompt_tokens_total = (SELECT COALESCE(SUM(m.prompt_tokens), 0) FROM messages m "
+        "WHERE m.conversation_id = conversations.id), "
+        "response_tokens_total = (SELECT COALESCE(SUM(m.response_tokens), 0) FROM messages m "
+        "WHERE m.conversation_id = conversations.id), "
+        "total_tokens = (SELECT COALESCE(SUM(m.total_tokens), 0) FROM messages m "
+        "WHERE m.conversation_id = conversations.id), "
+        "last_message_at = (SELECT MAX(m.created_at) FROM messages m "
+        "WHERE m.conversation_id = conversations.id)"
+    )
+    day = "date(m.created_at)" if op.get_bind().dialect.name == "sqlite" else "CAST(m.created_at AS DATE)"
+    op.execute(
+        "INSERT INTO usage_daily (day, model_type, message_count, failed_count, prompt_tokens, "
+        "response_tokens, total_tokens) "
+        f"SELECT {day}, c.model_type, COUNT(*), "
+        "SUM(CASE WHEN m.is_success THEN 0 ELSE 1 END), SUM(m.prompt_tokens), "
+        "SUM(m.response_tokens), SUM(m.total_tokens) "
+        "FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+        f"GROUP BY {day}, c.model_type"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('usage_daily')
+    op.drop_column('conversations', 'last_message_at')
+    for name in reversed(COUNTERS):
+        op.drop_column('conversations', name)
@@ -0,0 +1,90 @@
+"""message archive tables, and monthly partitioning of messages
+
+`messages` is recreated PARTITION BY RANGE (created_at) on PostgreSQL when
+MESSAGES_PARTITIONED is set and the table is still empty; a table holding
+rows is left as it is. The partition key must be part of the primary key, so
+the partitioned table's key is (id, created_at). The app creates the monthly
+partitions on startup; rows outside them land in the default partition.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 21:16:36.782951
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONED_MESSAGES = [
+    "DROP TABLE messages",
+    "CREATE TABLE messages ("
+    "id SERIAL NOT NULL, "
+    "conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE, "
+    "prompt_content VARCHAR NOT NULL, "
+    "response_content VARCHAR NOT NULL, "
+    "prompt_tokens INTEGER NOT NULL, "
+    "response_tokens INTEGER NOT NULL, "
+    "total_tokens INTEGER NOT NULL, "
+    "is_success BOOLEAN NOT NULL, "
+    "status_code INTEGER NOT NULL, "
+    "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "search_vector tsvector GENERATED ALWAYS AS "
+    "(to_tsvector('english', prompt_content || ' ' || response_content)) STORED, "
+    "PRIMARY KEY (id, created_at)"
+    ") PARTITION BY RANGE (created_at)",
+    "CREATE INDEX ix_messages_conversation_id_created_at_id ON messages (conversation_id, created_at, id)",
+    "CREATE INDEX ix_messages_created_at_id ON messages (created_at, id)",
+    "CREATE INDEX ix_messages_search_vector ON messages USING GIN (search_vector)",
+    "CREATE TABLE messages_default PARTITION OF messages DEFAULT",
+]
+
+
+def upgrade() -> None:
+    op.create_table('message_archives',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('partition_name', sa.String(), nullable=False),
+    sa.Column('range_start', sa.DateTime(), nullable=False),
+    sa.Column('range_end', sa.DateTime(), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('partition_name')
+    )
+    op.create_table('message_archive_segments',
+    sa.Column('archive_id', sa.Integer(), nullable=False),
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('byte_offset', sa.Integer(), nullable=False),
+    sa.Column('byte_length', sa.Integer(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['archive_id'], ['message_archives.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('archive_id', 'conversation_id')
+    )
+    op.create_index('ix_message_archive_segments_conversation_id', 'message_archive_segments', ['conversation_id'], unique=False)
+
+    if context.is_offline_mode() or not context.config.attributes.get("messages_partitioned"):
+        return
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    if bind.execute(sa.text("SELECT EXISTS (SELECT 1 FROM messages)")).scalar():
+        print("messages already holds rows and is left unpartitioned; MESSAGES_PARTITIONED is ignored.")
+        return
+    for statement in PARTITIONED_MESSAGES:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_message_archive_segments_conversation_id', table_name='message_archive_segments')
+    op.drop_table('message_archive_segments')
+    op.drop_table('message_archives')
@@ -0,0 +1,30 @@
+"""id_blocks for hi/lo conversation id allocation across shards
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 21:16:36.948370
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('id_blocks',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('next_hi', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('id_blocks')
@@ -0,0 +1,74 @@
+"""split each day and model's usage rollup over several rows
+
+Existing rollups become slot 0.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 23:02:11.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FIELDS = 'message_count, failed_count, prompt_tokens, response_tokens, total_tokens'
+
+
+def rebuild_sqlite(key: Sequence[str], select: str) -> None:
+    """SQLite cannot change a primary key in place: copy into a new table."""
+    columns = [
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('model_type', sa.String(), nullable=False),
+    ]
+    if 'slot' in key:
+        columns.append(sa.Column('slot', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('usage_daily_new',
+    *columns,
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('failed_count', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+    sa.Column('response_tokens', sa.Integer(), nullable=False),
+    sa.Column('total_tokens', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint(*key, name='usage_daily_pkey')
+    )
+    op.execute(f"INSERT INTO usage_daily_new ({', '.join(key)}, {FIELDS}) {select}")
+    op.drop_table('usage_daily')
+    op.rename_table('usage_daily_new', 'usage_daily')
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        rebuild_sqlite(
+            ['day', 'model_type', 'slot'],
+            f"SELECT day, model_type, 0, {FIELDS} FROM usage_daily",
+        )
+        return
+    op.drop_constraint('usage_daily_pkey', 'usage_daily', type_='primary')
+    op.add_column('usage_daily', sa.Column('slot', sa.Integer(), server_default='0', nullable=False))
+    op.create_primary_key('usage_daily_pkey', 'usage_daily', ['day', 'model_type', 'slot'])
+
+
+def downgrade() -> None:
+    # Fold the slots back into one row per day and model
+    sums = ", ".join(f"SUM({field}) AS {field}" for field in FIELDS.split(", "))
+    totals = f"SELECT day, model_type, {sums} FROM usage_daily GROUP BY day, model_type"
+    if op.get_bind().dialect.name == "sqlite":
+        rebuild_sqlite(['day', 'model_type'], totals)
+        return
+    op.execute(f"CREATE TEMPORARY TABLE usage_daily_totals AS {totals}")
+    op.execute("DELETE FROM usage_daily")
+    op.drop_constraint('usage_daily_pkey', 'usage_daily', type_='primary')
+    op.drop_column('usage_daily', 'slot')
+    op.create_primary_key('usage_daily_pkey', 'usage_daily', ['day', 'model_type'])
+    op.execute(
+        f"INSERT INTO usage_daily (day, model_type, {FIELDS}) SELECT * FROM usage_daily_totals"
+    )
+    op.execute("DROP TABLE usage_daily_totals")
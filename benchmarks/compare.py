@@ -0,0 +1,51 @@
+"""Compare two benchmark result files and fail on regressions.
+
+A route/concurrency pair regresses when its p95 latency grows, or its
+throughput drops, by more than the threshold.
+
+Usage: python -m benchmarks.compare baseline.json candidate.json --threshold 10
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Tuple
+
+
+def load(path: str) -> Dict[Tuple[str, int], dict]:
+    with open(path) as f:
+        report = json.load(f)
+    return {(r["route"], r["concurrency"]): r for r in report["results"]}
+
+
+def change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+    regressions = 0
+    for key in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[key], candidate[key]
+        p95 = change(before["latency_ms"]["p95"], after["latency_ms"]["p95"])
+        rps = change(before["throughput_rps"], after["throughput_rps"])
+        regressed = p95 > args.threshold or rps < -args.threshold
+        regressions += regressed
+        print(
+            f"{'REGRESSION' if regressed else 'ok':10} {key[0]:45} c={key[1]:<4} "
+            f"p95 {before['latency_ms']['p95']:.1f} -> {after['latency_ms']['p95']:.1f}ms ({p95:+.1f}%)  "
+            f"rps {before['throughput_rps']:.1f} -> {after['throughput_rps']:.1f} ({rps:+.1f}%)"
+        )
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{'missing':10} {key[0]:45} c={key[1]:<4} only in one of the files")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""A local OpenAI-compatible chat completions server for benchmarks.
+
+Streams a canned answer with a configurable time to first token (including a
+slow tail), token rate and error rate, so the app's LLM routes can be load tested without calling OpenAI.
+
+Usage: python -m benchmarks.fake_openai --port 9100 --ttft-ms 300 --tokens-per-second 60
+Then run the app with OPENAI_BASE_URL=http://127.0.0.1:9100/v1.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeLLMConfig:
+    ttft_ms: float = 300.0
+    tokens_per_second: float = 60.0
+    response_tokens: int = 60
+    error_rate: float = 0.0
+    error_status: int = 429
+    # Fraction of requests whose first token takes slow_ttft_ms instead
+    slow_rate: float = 0.0
+    slow_ttft_ms: float = 3000.0
+    seed: int = None
+
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(config.seed)
+    token_delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+
+    def chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    def tokens(prompt: str, count: int):
+        words = prompt.split() or ["token"]
+        return [f"{words[i % len(words)]} " for i in range(count)]
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake-model")
+        prompt = body["messages"][-1]["content"]
+        if rng.random() < config.error_rate:
+            await asyncio.sleep(config.ttft_ms / 1000)
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "fake_error", "code": None}},
+                status_code=config.error_status,
+            )
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        ttft = config.slow_ttft_ms if rng.random() < config.slow_rate else config.ttft_ms
+        count = min(config.response_tokens, body.get("max_tokens") or config.response_tokens)
+        if not body.get("stream"):
+            await asyncio.sleep(ttft / 1000 + token_delay * (count - 1))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens(prompt, count))},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": count,
+                          "total_tokens": len(prompt.split()) + count},
+            }
+
+        async def stream():
+            await asyncio.sleep(ttft / 1000)
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens(prompt, count)):
+                if i:
+                    await asyncio.sleep(token_delay)
+                yield chunk(completion_id, model, {"content": token})
+            yield chunk(completion_id, model, {}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of failed requests")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of slow first tokens")
+    parser.add_argument("--slow-ttft-ms", type=float, default=3000.0)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def command_line(args: argparse.Namespace, port: int) -> List[str]:
+    """Arguments that start this server as a subprocess with the options in `args`."""
+    argv = [
+        "-m", "benchmarks.fake_openai", "--port", str(port),
+        "--ttft-ms", str(args.ttft_ms), "--tokens-per-second", str(args.tokens_per_second),
+        "--response-tokens", str(args.response_tokens), "--error-rate", str(args.error_rate),
+        "--error-status", str(args.error_status), "--slow-rate", str(args.slow_rate),
+        "--slow-ttft-ms", str(args.slow_ttft_ms),
+    ]
+    if args.seed is not None:
+        argv += ["--seed", str(args.seed)]
+    return argv
+
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        slow_rate=args.slow_rate,
+        slow_ttft_ms=args.slow_ttft_ms,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,91 @@
+"""Measure how hedged requests change time to first token.
+
+Starts two fake OpenAI servers - a primary with a slow tail and a healthy
+secondary - and streams the same workload through the model router with and
+without hedging, reporting time-to-first-token percentiles and how often the
+hedge was fired and won.
+
+Usage: python -m benchmarks.hedging --requests 300 --concurrency 16 --slow-rate 0.03
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+from openai import AsyncOpenAI
+
+from benchmarks import fake_openai
+from benchmarks.load import serve, summarize
+from services.routing import Endpoint, ModelRouter, hedge_wins, hedges_fired
+
+MODEL = "gpt-3.5-turbo"
+
+
+async def run(router: ModelRouter, requests: int, concurrency: int) -> Dict[str, object]:
+    first_token: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    hedged_before = hedges_fired.value(model=MODEL)
+    secondary_before = hedge_wins.value(model=MODEL, position="1")
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            first = None
+            async for _ in router.stream(MODEL, [{"role": "user", "content": f"question {i}"}]):
+                if first is None:
+                    first = time.perf_counter() - started
+            first_token.append(first)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return {
+        "ttft_ms": summarize(first_token),
+        "hedged": hedges_fired.value(model=MODEL) - hedged_before,
+        "secondary_wins": hedge_wins.value(model=MODEL, position="1") - secondary_before,
+    }
+
+
+def router_for(ports: List[int], args: argparse.Namespace, hedge: bool) -> ModelRouter:
+    endpoints = [
+        Endpoint(f"{MODEL}[{i}]", AsyncOpenAI(api_key="benchmark", base_url=f"http://127.0.0.1:{port}/v1"), MODEL)
+        for i, port in enumerate(ports)
+    ]
+    return ModelRouter(
+        {MODEL: endpoints}, MODEL, hedge=hedge, percentile=args.percentile,
+        initial_delay=args.initial_delay_ms / 1000,
+    )
+
+
+async def compare(args: argparse.Namespace, ports: List[int]) -> None:
+    for hedge in (False, True):
+        router = router_for(ports, args, hedge)
+        # Warm up so the hedge deadline comes from measured percentiles
+        await run(router, args.warmup, args.concurrency)
+        result = await run(router, args.requests, args.concurrency)
+        ttft = result["ttft_ms"]
+        print(
+            f"hedging {'on ' if hedge else 'off'}  ttft p50={ttft['p50']:.0f}ms p95={ttft['p95']:.0f}ms "
+            f"p99={ttft['p99']:.0f}ms  hedged={result['hedged']:.0f} secondary wins={result['secondary_wins']:.0f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--percentile", type=float, default=95)
+    parser.add_argument("--initial-delay-ms", type=float, default=2000)
+    parser.add_argument("--ports", type=int, nargs=2, default=[9101, 9102])
+    fake_openai.add_arguments(parser)
+    parser.set_defaults(slow_rate=0.03, slow_ttft_ms=2000.0)
+    args = parser.parse_args()
+
+    primary = fake_openai.command_line(args, args.ports[0])
+    args.slow_rate = 0.0
+    secondary = fake_openai.command_line(args, args.ports[1])
+    with serve(primary, args.ports[0], {}), serve(secondary, args.ports[1], {}):
+        asyncio.run(compare(args, args.ports))
+
+
+if __name__ == "__main__":
+    main()
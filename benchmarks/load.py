@@ -0,0 +1,326 @@
+"""Reproducible load test of every conversation and LLM route.
+
+Starts the fake OpenAI server and the app (against a fresh SQLite file, or the
+database given with --database-url), seeds data, then drives each route at the
+requested concurrency levels. Reports p50/p95/p99 latency, throughput, errors,
+time to first byte for streams, and - from the app's /metrics - SQL statements
+per request and connection pool checkout waits. Results are written as JSON so
+runs can be compared across commits with `python -m benchmarks.compare`.
+
+Usage: python -m benchmarks.load --concurrency 1 8 32 --requests 200 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import count
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+from benchmarks import fake_openai
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: Callable[["Fixture", int], str]
+    body: Optional[Callable[["Fixture", int], Any]] = None
+    stream: bool = False
+    # Fresh conversation ids consumed by destructive scenarios
+    needs_fresh_ids: bool = False
+
+
+@dataclass
+class Fixture:
+    conversation_ids: List[int]
+    fresh_ids: List[int] = field(default_factory=list)
+
+    def conversation(self, i: int) -> int:
+        return self.conversation_ids[i % len(self.conversation_ids)]
+
+
+SCENARIOS = [
+    Scenario("GET /conversations", "GET", lambda f, i: "/conversations?limit=50"),
+    Scenario("GET /conversations/{id}", "GET", lambda f, i: f"/conversations/{f.conversation(i)}"),
+    Scenario(
+        "GET /conversations/{id}/messages", "GET",
+        lambda f, i: f"/conversations/{f.conversation(i)}/messages?limit=100",
+    ),
+    Scenario(
+        "GET /conversations/{id}/messages/stream", "GET",
+        lambda f, i: f"/conversations/{f.conversation(i)}/messages/stream", stream=True,
+    ),
+    Scenario(
+        "POST /conversations", "POST", lambda f, i: "/conversations",
+        lambda f, i: {"title": f"Benchmark {i}", "model_type": "gpt-3.5-turbo"},
+    ),
+    Scenario(
+        "PUT /conversations/{id}", "PUT", lambda f, i: f"/conversations/{f.conversation(i)}",
+        lambda f, i: {"title": f"Renamed {i}", "model_type": "gpt-3.5-turbo"},
+    ),
+    Scenario(
+        "DELETE /conversations/{id}", "DELETE", lambda f, i: f"/conversations/{f.fresh_ids[i]}",
+        needs_fresh_ids=True,
+    ),
+    Scenario(
+        "POST /llm/conversations", "POST", lambda f, i: "/llm/conversations",
+        lambda f, i: {"prompt": f"Benchmark conversation about topic {i}"},
+    ),
+    Scenario(
+        "GET /llm/conversations/{id}/title", "GET",
+        lambda f, i: f"/llm/conversations/{f.conversation(i)}/title",
+    ),
+    Scenario(
+        "POST /llm/text/generate", "POST", lambda f, i: "/llm/text/generate",
+        lambda f, i: {"prompt": f"Question {i}", "conversation_id": f.conversation(i), "use_cache": False},
+    ),
+    Scenario(
+        "POST /llm/text/generate/stream", "POST", lambda f, i: "/llm/text/generate/stream",
+        lambda f, i: {"prompt": f"Question {i}", "conversation_id": f.conversation(i), "use_cache": False},
+        stream=True,
+    ),
+]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(samples, 50) * 1000, 3),
+        "p95": round(percentile(samples, 95) * 1000, 3),
+        "p99": round(percentile(samples, 99) * 1000, 3),
+        "mean": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+@contextmanager
+def serve(args: List[str], port: int, env: Dict[str, str]) -> Iterator[subprocess.Popen]:
+    process = subprocess.Popen(
+        [sys.executable, *args], cwd=ROOT, env={**os.environ, **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+                break
+            except httpx.HTTPError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"Server {' '.join(args)} did not start")
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def db_counters(metrics: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+    statements = sum(metrics.get("db_statements_total", {}).values())
+    waits = metrics.get("db_pool_checkout_wait_seconds", {}).get("", {})
+    over_1ms = sum(v for k, v in waits.get("buckets", {}).items() if k == "+Inf" or float(k) > 0.001)
+    return {
+        "statements": statements,
+        "checkouts": waits.get("count", 0),
+        "wait_seconds": waits.get("sum", 0.0),
+        "waits_over_1ms": over_1ms,
+    }
+
+
+async def metrics_snapshot(client: httpx.AsyncClient) -> Dict[str, float]:
+    response = await client.get("/metrics", params={"format": "json"})
+    return db_counters(response.json())
+
+
+async def seed(client: httpx.AsyncClient, conversations: int, messages_per_conversation: int) -> Fixture:
+    response = await client.post(
+        "/bulk/conversations",
+        json=[{"title": f"Seed {i}", "model_type": "gpt-3.5-turbo"} for i in range(conversations)],
+    )
+    response.raise_for_status()
+    ids = response.json()["ids"]
+    lines = [
+        json.dumps({
+            "conversation_id": conversation_id,
+            "prompt_content": f"Seed prompt {n} for conversation {conversation_id}",
+            "response_content": "Seed response " * 20,
+        })
+        for conversation_id in ids
+        for n in range(messages_per_conversation)
+    ]
+    response = await client.post(
+        "/bulk/messages", content="\n".join(lines), headers={"content-type": "application/x-ndjson"}
+    )
+    response.raise_for_status()
+    return Fixture(conversation_ids=ids)
+
+
+async def fresh_conversations(client: httpx.AsyncClient, n: int) -> List[int]:
+    response = await client.post(
+        "/bulk/conversations",
+        json=[{"title": f"Disposable {i}", "model_type": "gpt-3.5-turbo"} for i in range(n)],
+    )
+    response.raise_for_status()
+    return response.json()["ids"]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, scenario: Scenario, fixture: Fixture, concurrency: int, requests: int
+) -> Dict[str, Any]:
+    if scenario.needs_fresh_ids:
+        fixture.fresh_ids = await fresh_conversations(client, requests)
+    latencies: List[float] = []
+    first_byte: List[float] = []
+    errors = 0
+    indices = count()
+
+    async def worker() -> None:
+        nonlocal errors
+        while (i := next(indices)) < requests:
+            kwargs = {}
+            if scenario.body is not None:
+                kwargs["json"] = scenario.body(fixture, i)
+            started = time.perf_counter()
+            try:
+                if scenario.stream:
+                    async with client.stream(scenario.method, scenario.path(fixture, i), **kwargs) as r:
+                        first = None
+                        async for _ in r.aiter_raw():
+                            if first is None:
+                                first = time.perf_counter() - started
+                        first_byte.append(first if first is not None else time.perf_counter() - started)
+                        status = r.status_code
+                else:
+                    r = await client.request(scenario.method, scenario.path(fixture, i), **kwargs)
+                    status = r.status_code
+            except httpx.HTTPError:
+                status = 599
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    before = await metrics_snapshot(client)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    after = await metrics_snapshot(client)
+
+    checkouts = after["checkouts"] - before["checkouts"]
+    result = {
+        "route": scenario.name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        # The metrics scrape itself runs no SQL; background flushes are attributed to the route.
+        "db_statements_per_request": round((after["statements"] - before["statements"]) / requests, 3),
+        "pool_checkouts": checkouts,
+        "pool_wait_ms_mean": round(
+            (after["wait_seconds"] - before["wait_seconds"]) / checkouts * 1000, 3
+        ) if checkouts else 0.0,
+        "pool_waits_over_1ms": after["waits_over_1ms"] - before["waits_over_1ms"],
+    }
+    if scenario.stream:
+        result["ttfb_ms"] = summarize(first_byte)
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace, app_url: str) -> Dict[str, Any]:
+    selected = [s for s in SCENARIOS if not args.routes or any(r in s.name for r in args.routes)]
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+    async with httpx.AsyncClient(base_url=app_url, timeout=120, limits=limits) as client:
+        fixture = await seed(client, args.seed_conversations, args.seed_messages)
+        for scenario in selected:
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, scenario, fixture, concurrency, args.requests)
+                results.append(result)
+                print(
+                    f"{scenario.name:45} c={concurrency:<4} {result['throughput_rps']:>9.1f} rps  "
+                    f"p50={result['latency_ms']['p50']:.1f}ms p99={result['latency_ms']['p99']:.1f}ms  "
+                    f"sql/req={result['db_statements_per_request']:.2f} errors={result['errors']}",
+                    file=sys.stderr,
+                )
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "database": "custom" if args.database_url else "sqlite",
+            "ttft_ms": args.ttft_ms,
+            "tokens_per_second": args.tokens_per_second,
+            "response_tokens": args.response_tokens,
+            "error_rate": args.error_rate,
+            "slow_rate": args.slow_rate,
+            "slow_ttft_ms": args.slow_ttft_ms,
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route and level")
+    parser.add_argument("--routes", nargs="*", help="Only run routes containing these substrings")
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite file")
+    parser.add_argument("--seed-conversations", type=int, default=50)
+    parser.add_argument("--seed-messages", type=int, default=20)
+    parser.add_argument("--app-port", type=int, default=8800)
+    parser.add_argument("--llm-port", type=int, default=9100)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    fake_openai.add_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{tmp}/bench.db"
+        llm_args = fake_openai.command_line(args, args.llm_port)
+        app_env = {
+            "DATABASE_URL": database_url,
+            "OPENAI_API_KEY": "benchmark",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+        }
+        app_args = ["-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning"]
+        with serve(llm_args, args.llm_port, {}), serve(app_args, args.app_port, app_env):
+            report = asyncio.run(run(args, f"http://127.0.0.1:{args.app_port}"))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
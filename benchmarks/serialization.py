@@ -0,0 +1,108 @@
+"""Compare the ORM + per-row pydantic list path with the column-only fast path.
+
+Seeds an in-memory SQLite database and times, per page of `--page-size` rows:
+
+* orm: select entities, `model_validate` each row, then FastAPI-style response
+  validation, `jsonable_encoder` and `json.dumps` (the previous list endpoints)
+* fast: select only the schema columns, validate with a cached TypeAdapter and
+  render with orjson (the current list endpoints)
+
+Usage: python -m benchmarks.serialization [--rows 20000] [--page-size 1000] [--repeat 20]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from models import Base, Conversation, Message
+from repositories.projections import schema_columns
+from responses import OrjsonResponse
+from schemas import ConversationListAdapter, ConversationOut, MessageListAdapter, MessageOut
+
+
+async def seed(session: AsyncSession, rows: int) -> None:
+    now = datetime.now()
+    await session.execute(
+        insert(Conversation),
+        [
+            {"title": f"Conversation {i}", "model_type": "gpt-3.5-turbo",
+             "created_at": now, "updated_at": now - timedelta(seconds=i)}
+            for i in range(rows)
+        ],
+    )
+    await session.execute(
+        insert(Message),
+        [
+            {"conversation_id": 1, "prompt_content": f"Prompt number {i} " * 8,
+             "response_content": f"Response number {i} " * 32, "prompt_tokens": 24,
+             "response_tokens": 96, "total_tokens": 120, "is_success": True,
+             "status_code": 200, "created_at": now + timedelta(seconds=i),
+             "updated_at": now + timedelta(seconds=i)}
+            for i in range(rows)
+        ],
+    )
+    await session.commit()
+
+
+async def orm_path(session: AsyncSession, model, schema, adapter, page_size: int) -> bytes:
+    result = await session.execute(select(model).limit(page_size))
+    items = [schema.model_validate(r) for r in result.scalars().all()]
+    validated = adapter.validate_python(items, from_attributes=True)
+    session.expunge_all()
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+async def fast_path(session: AsyncSession, model, schema, adapter, page_size: int) -> bytes:
+    result = await session.execute(select(*schema_columns(model, schema)).limit(page_size))
+    items = adapter.validate_python(result.all(), from_attributes=True)
+    return OrjsonResponse(items).body
+
+
+async def timed(fn, repeat: int, *args) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn(*args)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+async def main(rows: int, page_size: int, repeat: int) -> dict:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    report = {"rows": rows, "page_size": page_size, "repeat": repeat, "results": {}}
+    async with session_factory() as session:
+        await seed(session, rows)
+        for name, model, schema, adapter in (
+            ("conversations", Conversation, ConversationOut, ConversationListAdapter),
+            ("messages", Message, MessageOut, MessageListAdapter),
+        ):
+            # Warm up statement caches and adapters before timing
+            await orm_path(session, model, schema, adapter, page_size)
+            await fast_path(session, model, schema, adapter, page_size)
+            orm = await timed(orm_path, repeat, session, model, schema, adapter, page_size)
+            fast = await timed(fast_path, repeat, session, model, schema, adapter, page_size)
+            report["results"][name] = {
+                "orm_ms": round(orm * 1000, 3),
+                "fast_ms": round(fast * 1000, 3),
+                "speedup": round(orm / fast, 2),
+            }
+    await engine.dispose()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.rows, args.page_size, args.repeat)), indent=2))
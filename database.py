@@ -1,29 +1,313 @@
-from sqlalchemy.ext.asyncio import create_async_engine
-from models import Base
-from settings import AppSettings
+import os
+import time
+from datetime import date
+from functools import cached_property
+from typing import Annotated, Any, Callable, Dict, List, Optional
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from fastapi import Depends
+from sqlalchemy import Connection, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from metrics import registry
+from models import Conversation, message_partition_bounds, message_partition_ddl
+from settings import get_settings
 
 # Get settings
-settings = AppSettings()
+settings = get_settings()
+
+db_statements = registry.counter(
+    "db_statements_total", "SQL statements executed, by engine and operation"
+)
+db_statement_duration = registry.histogram(
+    "db_statement_duration_seconds",
+    "SQL statement execution time, by engine and operation",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+db_statement_errors = registry.counter(
+    "db_statement_errors_total", "SQL statements that raised an error, by engine"
+)
+pool_checked_out = registry.gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool"
+)
+pool_connections_opened = registry.counter(
+    "db_pool_connections_opened_total", "New database connections opened by the pool"
+)
+pool_size = registry.gauge("db_pool_size", "Configured pool size, excluding overflow")
+pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Async queue pool that records how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+
+
+def statement_operation(statement: str) -> str:
+    """The leading SQL keyword, e.g. SELECT; keeps the operation label set small."""
+    words = statement.lstrip(" \n\t(").split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """Time statements and track pool usage with engine and pool events."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        operation = statement_operation(statement)
+        db_statements.inc(engine=name, operation=operation)
+        db_statement_duration.observe(elapsed, engine=name, operation=operation)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def record_error(context):
+        db_statement_errors.inc(engine=name)
+        started = context.connection.info.get("query_started") if context.connection else None
+        if started:
+            started.pop()
+
+    @event.listens_for(sync_engine, "connect")
+    def record_connect(dbapi_connection, connection_record):
+        pool_connections_opened.inc(engine=name)
+
+    @event.listens_for(sync_engine, "checkout")
+    def record_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_checked_out.inc(engine=name)
+
+    @event.listens_for(sync_engine, "checkin")
+    def record_checkin(dbapi_connection, connection_record):
+        pool_checked_out.dec(engine=name)
+
+    if hasattr(sync_engine.pool, "size"):
+        pool_size.set(sync_engine.pool.size(), engine=name)
+
+
+def create_engine_for(url: str, name: str = "primary") -> AsyncEngine:
+    """Create an engine for `url` with the pool and driver options from settings."""
+    parsed = make_url(url)
+    options: Dict[str, Any] = {
+        "echo": settings.db_echo,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    in_memory = parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+    if not in_memory:
+        options.update(
+            poolclass=TimedQueuePool if settings.metrics_enabled else AsyncAdaptedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    if parsed.get_driver_name() == "asyncpg":
+        # Both asyncpg's statement cache and SQLAlchemy's prepared statement
+        # cache; set DB_STATEMENT_CACHE_SIZE=0 behind a transaction-mode PgBouncer.
+        parsed = parsed.update_query_dict(
+            {"prepared_statement_cache_size": str(settings.db_statement_cache_size)}
+        )
+        options["connect_args"] = {"statement_cache_size": settings.db_statement_cache_size}
+    engine = create_async_engine(parsed, **options)
+    if parsed.get_backend_name() == "sqlite":
+        # SQLite ignores foreign keys, and so ON DELETE CASCADE, unless enabled per connection
+        @event.listens_for(engine.sync_engine, "connect")
+        def enable_foreign_keys(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+
+    if settings.metrics_enabled:
+        instrument_engine(engine, name)
+    return engine
+
 
 # Use the database URL from settings
 SQLALCHEMY_DATABASE_URL = settings.constructed_database_url
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL, echo=True)
+
+
+class Engines:
+    """The process's database engines, each created on first use and then shared.
+
+    Creating an engine loads its driver and sets up its pool, so importing the
+    app does not; the first session on an engine pays for it instead.
+    """
+
+    @cached_property
+    def primary(self) -> AsyncEngine:
+        return create_engine_for(SQLALCHEMY_DATABASE_URL)
+
+    @cached_property
+    def replica(self) -> AsyncEngine:
+        # Read traffic goes to the replica when one is configured, otherwise to the primary.
+        if settings.database_read_url:
+            return create_engine_for(settings.database_read_url, "replica")
+        return self.primary
+
+    @cached_property
+    def shards(self) -> List[AsyncEngine]:
+        # A shard URL equal to the primary's reuses its engine.
+        return [
+            self.primary if url == SQLALCHEMY_DATABASE_URL else create_engine_for(url, f"shard{index}")
+            for index, url in enumerate(settings.database_shard_urls)
+        ]
+
+    def databases(self) -> List[AsyncEngine]:
+        """The primary and every shard, each once: the databases that hold a schema."""
+        return [self.primary] + [e for e in self.shards if e is not self.primary]
+
+    async def dispose(self) -> None:
+        """Close the pools of the engines created so far."""
+        created = [self.__dict__[name] for name in ("primary", "replica") if name in self.__dict__]
+        created.extend(self.__dict__.get("shards", []))
+        for created_engine in {id(e): e for e in created}.values():
+            await created_engine.dispose()
+
+
+engines = Engines()
+
+
+def __getattr__(name: str) -> Any:
+    # `engine` and `read_engine` are kept as module attributes, created on first access
+    if name == "engine":
+        return engines.primary
+    if name == "read_engine":
+        return engines.replica
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def messages_partitioned(connection: Connection) -> bool:
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('messages'))"
+    )).scalar()
+
+def ensure_message_partitions(
+    connection: Connection, months_ahead: int, today: Optional[date] = None
+) -> None:
+    """Create the monthly partitions from the current month through `months_ahead` months."""
+    month = (today or date.today()).replace(day=1)
+    for _ in range(months_ahead + 1):
+        connection.execute(text(message_partition_ddl(month)))
+        month = message_partition_bounds(month)[1]
+
+def prepare_message_partitions(connection: Connection, months_ahead: int) -> None:
+    """Create the upcoming monthly partitions of a partitioned `messages` (MESSAGES_PARTITIONED).
+
+    Whether `messages` is partitioned is decided by migration 0006, when it is created.
+    """
+    if connection.dialect.name != "postgresql":
+        print("MESSAGES_PARTITIONED requires PostgreSQL; messages is a plain table.")
+        return
+    if not messages_partitioned(connection):
+        print("messages is not partitioned; MESSAGES_PARTITIONED is ignored.")
+        return
+    ensure_message_partitions(connection, months_ahead)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+# Key of the PostgreSQL advisory lock that lets one worker at a time migrate
+MIGRATION_LOCK_KEY = 0x63686174
+
+
+def alembic_config(connection: Optional[Connection] = None) -> Config:
+    """Alembic configuration; with `connection`, migrations run on it instead of a new engine."""
+    config = Config(ALEMBIC_INI)
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def head_revision() -> Optional[str]:
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def schema_revision(connection: Connection) -> Optional[str]:
+    return MigrationContext.configure(connection).get_current_revision()
+
+
+def migrate_schema(connection: Connection, head: str, auto_migrate: bool) -> Optional[str]:
+    """Bring the database at `connection` to `head`; returns the revision it started from.
+
+    A lock makes concurrently booting workers wait for the first one's migration,
+    then find nothing left to do: an advisory lock on PostgreSQL, and on SQLite
+    the database's write lock, taken up front with BEGIN IMMEDIATE.
+    """
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    elif connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    current = schema_revision(connection)
+    if current == head:
+        return current
+    url = connection.engine.url.render_as_string(hide_password=True)
+    if current is None and inspect(connection).has_table(Conversation.__tablename__):
+        raise RuntimeError(
+            f"{url} has tables but no Alembic revision; record the revision its schema "
+            f"matches, then upgrade: `alembic stamp 0001 && alembic upgrade head` for a "
+            f"database created before migrations were added"
+        )
+    if not auto_migrate:
+        raise RuntimeError(
+            f"{url} is at revision {current}, expected {head}; run `alembic upgrade head`"
+        )
+    command.upgrade(alembic_config(connection), "head")
+    print(f"Migrated {url} from revision {current} to {head}.")
+    return current
+
 
 async def init_db() -> None:
-    async with engine.begin() as conn:
-        # Create all tables in the database (only if they don't exist)
-        await conn.run_sync(Base.metadata.create_all)
+    """Check that every database is at the latest migration, instead of creating tables.
+
+    Up to date, this is one SELECT per database. Otherwise the database is upgraded
+    with DB_AUTO_MIGRATE, or the app refuses to start.
+    """
+    head = head_revision()
+    for database in engines.databases():
+        async with database.begin() as conn:
+            await conn.run_sync(migrate_schema, head, settings.db_auto_migrate)
+            if settings.messages_partitioned:
+                await conn.run_sync(prepare_message_partitions, settings.message_partitions_ahead)
     print("Database initialized successfully.")
 
-from typing import Annotated
 
-from database import engine
-from fastapi import Depends
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+class LazySessionmaker:
+    """An `async_sessionmaker` whose engine is created when the first session is."""
 
-async_session = async_sessionmaker(
-    bind=engine, class_=AsyncSession, autocommit=False, autoflush=False
-)
+    def __init__(self, engine: Callable[[], AsyncEngine]) -> None:
+        self._engine = engine
+        self._sessionmaker: Optional[async_sessionmaker] = None
+
+    def __call__(self) -> AsyncSession:
+        if self._sessionmaker is None:
+            self._sessionmaker = async_sessionmaker(
+                bind=self._engine(), class_=AsyncSession, autocommit=False, autoflush=False
+            )
+        return self._sessionmaker()
+
+
+async_session = LazySessionmaker(lambda: engines.primary)
+
+async_read_session = LazySessionmaker(lambda: engines.replica)
+
+shard_sessions = [
+    LazySessionmaker(lambda index=index: engines.shards[index])
+    for index in range(len(settings.database_shard_urls))
+]
 
 
 async def get_db_session():
@@ -37,4 +321,11 @@ async def get_db_session():
         await session.close()
 
 
-DBSessionDep = Annotated[AsyncSession, Depends(get_db_session)]
\ No newline at end of file
+async def get_read_db_session():
+    """Session for read-only traffic; may be served by a replica that lags the primary."""
+    async with async_read_session() as session:
+        yield session
+
+
+DBSessionDep = Annotated[AsyncSession, Depends(get_db_session)]
+ReadDBSessionDep = Annotated[AsyncSession, Depends(get_read_db_session)]
@@ -1,19 +1,63 @@
+import startup
+
+# Time the imports below when STARTUP_PROFILE is set
+startup.install()
+
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from database import engine, init_db
+from fastapi.responses import PlainTextResponse
+from database import engines, init_db, settings
+from metrics import PROMETHEUS_CONTENT_TYPE, RouteMetricsMiddleware, registry
+from services.archival import message_archivers
+from services.conversation_lookup import RequestScopeMiddleware
+from services.message_buffer import message_buffer
 
+from routers.analytics import router as analytics_router
+from routers.bulk import router as bulk_router
+from routers.chat import router as chat_router
 from routers.conversations import router as conversations_router
-from routers.llm import router as llm_router
+from routers.export import router as export_router
+from routers.llm import router as llm_router, title_worker
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
+    with startup.step("init_db"):
+        await init_db()
+    with startup.step("message_buffer"):
+        await message_buffer.start()
+    with startup.step("title_worker"):
+        await title_worker.start()
+    if settings.messages_partitioned:
+        with startup.step("message_archivers"):
+            for archiver in message_archivers:
+                await archiver.start()
+    startup.finish()
     yield
+    for archiver in message_archivers:
+        await archiver.close()
+    # Finish pending titles, then flush buffered messages before the process exits
+    await title_worker.close()
+    await message_buffer.close()
+    await engines.dispose()
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestScopeMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(RouteMetricsMiddleware)
 app.include_router(conversations_router)
 app.include_router(llm_router)
+app.include_router(chat_router)
+app.include_router(export_router)
+app.include_router(bulk_router)
+app.include_router(analytics_router)
 
 @app.get("/")
 async def healthy_check():
-    return {"message": "Healthy"}
\ No newline at end of file
+    return {"message": "Healthy"}
+
+@app.get("/metrics")
+async def metrics_controller(format: str = "prometheus"):
+    """Prometheus text exposition; `?format=json` returns the same values as JSON"""
+    if format == "json":
+        return registry.snapshot()
+    return PlainTextResponse(registry.exposition(), media_type=PROMETHEUS_CONTENT_TYPE)
\ No newline at end of file
@@ -0,0 +1,223 @@
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str, quotes: bool = True) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+
+    def samples(self) -> Dict[LabelKey, object]:
+        raise NotImplementedError
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {_escape(self.documentation, quotes=False)}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def exposition(self) -> List[str]:
+        lines = self.header()
+        for key, value in self.samples().items():
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> Dict[LabelKey, object]:
+        return dict(self._values)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class _HistogramValue:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, _HistogramValue] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = _HistogramValue(len(self.buckets) + 1)
+        entry.counts[bisect_left(self.buckets, value)] += 1
+        entry.sum += value
+        entry.count += 1
+
+    def samples(self) -> Dict[LabelKey, object]:
+        return dict(self._values)
+
+    def exposition(self) -> List[str]:
+        lines = self.header()
+        bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        for key, value in self.samples().items():
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, value.counts):
+                cumulative += bucket_count
+                labels = _format_labels(key + (("le", bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(value.sum)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {value.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """A minimal in-process metrics registry; values live in memory, no external service needed."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric):
+                raise ValueError(f"Metric {metric.name} already registered as {existing.kind}")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._register(Gauge(name, documentation))
+
+    def histogram(
+        self, name: str, documentation: str, buckets: Optional[Tuple[float, ...]] = None
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets or DEFAULT_BUCKETS))
+
+    def metrics(self) -> List[Metric]:
+        return list(self._metrics.values())
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Return every metric as plain JSON-serializable data."""
+        result: Dict[str, Dict[str, object]] = {}
+        for metric in self._metrics.values():
+            values: Dict[str, object] = {}
+            for key, value in metric.samples().items():
+                label = ",".join(f"{k}={v}" for k, v in key)
+                if isinstance(value, _HistogramValue):
+                    values[label] = {
+                        "count": value.count,
+                        "sum": value.sum,
+                        "buckets": dict(zip([str(b) for b in metric.buckets] + ["+Inf"], value.counts)),
+                    }
+                else:
+                    values[label] = value
+            result[metric.name] = values
+        return result
+
+    def exposition(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.exposition())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method, route template and status"
+)
+
+
+class RouteMetricsMiddleware:
+    """Records the latency of every HTTP request, labelled by its route template.
+
+    Streaming responses are timed until their last chunk is sent. Requests that
+    match no route share one label so unknown paths cannot grow the label set.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            request_duration.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
@@ -1,26 +1,45 @@
-from datetime import datetime
-from sqlalchemy import ForeignKey
+import re
+from datetime import date, datetime
+from sqlalchemy import DDL, ForeignKey, Index, event, false
 from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 class Base(DeclarativeBase):
     pass
 
 class Conversation(Base):
     __tablename__ = 'conversations'
+    __table_args__ = (
+        Index('ix_conversations_updated_at_id', 'updated_at', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(nullable=False)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
     model_type: Mapped[str] = mapped_column(nullable=False)
+    title_pending: Mapped[bool] = mapped_column(default=False, server_default=false())
+    # Usage counters, maintained in the same transaction as the message writes
+    message_count: Mapped[int] = mapped_column(default=0, server_default='0')
+    failed_message_count: Mapped[int] = mapped_column(default=0, server_default='0')
+    prompt_tokens_total: Mapped[int] = mapped_column(default=0, server_default='0')
+    response_tokens_total: Mapped[int] = mapped_column(default=0, server_default='0')
+    total_tokens: Mapped[int] = mapped_column(default=0, server_default='0')
+    last_message_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    # Deleting a conversation leaves its messages to the FK's ON DELETE CASCADE
+    # instead of loading them first
     messages: Mapped[List['Message']] = relationship(
         back_populates='conversation',
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        Index('ix_messages_conversation_id_created_at_id', 'conversation_id', 'created_at', 'id'),
+        Index('ix_messages_created_at_id', 'created_at', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     conversation_id: Mapped[int] = mapped_column(
@@ -36,4 +55,149 @@ class Message(Base):
     status_code: Mapped[Optional[int]] = mapped_column(nullable=False, default=200)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
-    conversation: Mapped[Conversation] = relationship("Conversation", back_populates='messages')
\ No newline at end of file
+    conversation: Mapped[Conversation] = relationship("Conversation", back_populates='messages')
+
+class UsageDaily(Base):
+    """Message and token totals per day and model, maintained with the messages.
+
+    Each day and model is split over several rows (`slot`, by conversation), so
+    concurrent writers do not all wait on one row lock.
+    """
+    __tablename__ = 'usage_daily'
+
+    day: Mapped[date] = mapped_column(primary_key=True)
+    model_type: Mapped[str] = mapped_column(primary_key=True)
+    slot: Mapped[int] = mapped_column(primary_key=True, default=0, server_default='0')
+    message_count: Mapped[int] = mapped_column(default=0)
+    failed_count: Mapped[int] = mapped_column(default=0)
+    prompt_tokens: Mapped[int] = mapped_column(default=0)
+    response_tokens: Mapped[int] = mapped_column(default=0)
+    total_tokens: Mapped[int] = mapped_column(default=0)
+
+class MessageArchive(Base):
+    """A monthly `messages` partition exported to a compressed NDJSON file and dropped."""
+    __tablename__ = 'message_archives'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    partition_name: Mapped[str] = mapped_column(unique=True)
+    range_start: Mapped[datetime] = mapped_column(nullable=False)
+    range_end: Mapped[datetime] = mapped_column(nullable=False)
+    path: Mapped[str] = mapped_column(nullable=False)
+    message_count: Mapped[int] = mapped_column(nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(default=datetime.now)
+
+class MessageArchiveSegment(Base):
+    """Where one conversation's messages sit in an archive file: one gzip member."""
+    __tablename__ = 'message_archive_segments'
+    __table_args__ = (
+        Index('ix_message_archive_segments_conversation_id', 'conversation_id'),
+    )
+
+    archive_id: Mapped[int] = mapped_column(
+        ForeignKey('message_archives.id', ondelete='CASCADE'), primary_key=True
+    )
+    conversation_id: Mapped[int] = mapped_column(
+        ForeignKey('conversations.id', ondelete='CASCADE'), primary_key=True
+    )
+    byte_offset: Mapped[int] = mapped_column(nullable=False)
+    byte_length: Mapped[int] = mapped_column(nullable=False)
+    message_count: Mapped[int] = mapped_column(nullable=False)
+    archive: Mapped[MessageArchive] = relationship()
+
+class IdBlock(Base):
+    """Hi/lo id allocation: the next block of ids to hand out for `name`.
+
+    Lives on the primary database, so ids are unique across all shards.
+    """
+    __tablename__ = 'id_blocks'
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    next_hi: Mapped[int] = mapped_column(nullable=False)
+
+
+# Full-text search indexes, created together with their tables. PostgreSQL gets a
+# generated tsvector column with a GIN index; SQLite gets an external-content FTS5
+# table kept in sync by triggers. Neither is mapped: only search queries use them.
+SEARCH_DDL = {
+    Conversation.__table__: {
+        "postgresql": [
+            "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', title)) STORED",
+            "CREATE INDEX IF NOT EXISTS ix_conversations_search_vector "
+            "ON conversations USING GIN (search_vector)",
+        ],
+        "sqlite": [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5("
+            "title, content='conversations', content_rowid='id', tokenize='porter unicode61')",
+            "CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN "
+            "INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title); END",
+            "CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN "
+            "INSERT INTO conversations_fts(conversations_fts, rowid, title) "
+            "VALUES ('delete', old.id, old.title); END",
+            "CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE OF title ON conversations BEGIN "
+            "INSERT INTO conversations_fts(conversations_fts, rowid, title) "
+            "VALUES ('delete', old.id, old.title); "
+            "INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title); END",
+        ],
+    },
+    Message.__table__: {
+        "postgresql": [
+            "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', prompt_content || ' ' || response_content)) STORED",
+            "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+        ],
+        "sqlite": [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+            "prompt_content, response_content, content='messages', content_rowid='id', "
+            "tokenize='porter unicode61')",
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+            "INSERT INTO messages_fts(rowid, prompt_content, response_content) "
+            "VALUES (new.id, new.prompt_content, new.response_content); END",
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, prompt_content, response_content) "
+            "VALUES ('delete', old.id, old.prompt_content, old.response_content); END",
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_au "
+            "AFTER UPDATE OF prompt_content, response_content ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, prompt_content, response_content) "
+            "VALUES ('delete', old.id, old.prompt_content, old.response_content); "
+            "INSERT INTO messages_fts(rowid, prompt_content, response_content) "
+            "VALUES (new.id, new.prompt_content, new.response_content); END",
+        ],
+    },
+}
+
+for _table, _statements in SEARCH_DDL.items():
+    for _dialect, _ddl in _statements.items():
+        for _statement in _ddl:
+            event.listen(_table, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+    event.listen(
+        _table,
+        "before_drop",
+        DDL(f"DROP TABLE IF EXISTS {_table.name}_fts").execute_if(dialect="sqlite"),
+    )
+
+
+# Monthly range partitions of `messages` (PostgreSQL, MESSAGES_PARTITIONED; see
+# migration 0006). The partitioned table's key is (id, created_at); the mapped key
+# stays `id`, which is still unique per sequence.
+MESSAGE_PARTITION_PATTERN = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+MESSAGE_DEFAULT_PARTITION = "messages_default"
+
+
+def message_partition_name(month: date) -> str:
+    return f"messages_y{month.year:04d}m{month.month:02d}"
+
+
+def message_partition_bounds(month: date) -> Tuple[date, date]:
+    """First day of `month` and of the month after it."""
+    start = month.replace(day=1)
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+def message_partition_ddl(month: date) -> str:
+    start, end = message_partition_bounds(month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {message_partition_name(start)} PARTITION OF messages "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
@@ -0,0 +1,204 @@
+import asyncio
+import gzip
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Conversation, Message, MessageArchive, MessageArchiveSegment
+
+_DATETIME_COLUMNS = ("created_at", "updated_at")
+# Segments recorded per statement, well under the driver's bind parameter limit
+_RECORD_BATCH = 1000
+
+
+def encode_segment(rows: Sequence[Dict[str, Any]]) -> bytes:
+    """One conversation's message rows as a gzip member of NDJSON lines."""
+    return gzip.compress(b"".join(orjson.dumps(row) + b"\n" for row in rows))
+
+
+@lru_cache(maxsize=256)
+def read_segment(path: str, offset: int, length: int) -> Tuple[Dict[str, Any], ...]:
+    """Decode one segment; archive files never change, so decoded segments are cached."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    rows = []
+    for line in gzip.decompress(data).splitlines():
+        row = orjson.loads(line)
+        for key in _DATETIME_COLUMNS:
+            row[key] = datetime.fromisoformat(row[key])
+        rows.append(row)
+    return tuple(rows)
+
+
+class ArchiveWriter:
+    """Writes message rows, sorted by conversation, to an archive file.
+
+    Each conversation's rows become one gzip member, so a conversation is read
+    back with a single seek, while the whole file still decompresses as one
+    NDJSON stream (e.g. with zcat). The file is written under a temporary name
+    and only moved into place by `close`.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.segments: List[Dict[str, int]] = []
+        self.message_count = 0
+        self._file = open(path + ".tmp", "wb")
+        self._conversation_id = None
+        self._rows: List[Dict[str, Any]] = []
+
+    def write(self, rows: Sequence[Dict[str, Any]]) -> None:
+        for row in rows:
+            if row["conversation_id"] != self._conversation_id:
+                self._flush_segment()
+                self._conversation_id = row["conversation_id"]
+            self._rows.append(row)
+
+    def close(self) -> None:
+        self._flush_segment()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self.path + ".tmp"):
+            os.remove(self.path + ".tmp")
+
+    def _flush_segment(self) -> None:
+        if not self._rows:
+            return
+        data = encode_segment(self._rows)
+        self.segments.append({
+            "conversation_id": self._conversation_id,
+            "byte_offset": self._file.tell(),
+            "byte_length": len(data),
+            "message_count": len(self._rows),
+        })
+        self._file.write(data)
+        self.message_count += len(self._rows)
+        self._rows = []
+
+
+class ArchiveRepository:
+    """The cold tier: messages of archived partitions, served from their archive files."""
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def messages(
+        self,
+        conversation_id: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Message]:
+        """The conversation's archived messages as transient Message objects, oldest first.
+
+        With `after`, only messages past that (created_at, id) key: archives whose
+        range ends at or before it are skipped without being read. With `limit`,
+        segments are read only until that many messages are found.
+        """
+        segments = await self.segments(conversation_id, after)
+        messages: List[Message] = []
+        for segment in segments:
+            if limit is not None and len(messages) >= limit:
+                break
+            batch = await self.read(segment)
+            if after is not None:
+                batch = [m for m in batch if (m.created_at, m.id) > after]
+            messages.extend(batch)
+        return messages if limit is None else messages[:limit]
+
+    async def latest_successful(self, conversation_id: int, limit: int) -> List[Message]:
+        """The conversation's last `limit` successful archived messages, oldest first.
+
+        Segments are read newest archive first, only until `limit` are found.
+        """
+        segments = await self.segments(conversation_id, newest_first=True)
+        messages: List[Message] = []
+        for segment in segments:
+            if len(messages) >= limit:
+                break
+            messages = [m for m in await self.read(segment) if m.is_success] + messages
+        return messages[-limit:]
+
+    async def segments(
+        self,
+        conversation_id: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        newest_first: bool = False,
+    ) -> List[Tuple[str, int, int]]:
+        """The (path, offset, length) of the conversation's segments, by archive range."""
+        query = (
+            select(
+                MessageArchive.path,
+                MessageArchiveSegment.byte_offset,
+                MessageArchiveSegment.byte_length,
+            )
+            .join(MessageArchiveSegment.archive)
+            .where(MessageArchiveSegment.conversation_id == conversation_id)
+        )
+        if after is not None:
+            # Archives cover disjoint [range_start, range_end) ranges of created_at
+            query = query.where(MessageArchive.range_end > after[0])
+        if newest_first:
+            query = query.order_by(MessageArchive.range_start.desc())
+        else:
+            query = query.order_by(MessageArchive.range_start)
+        result = await self.session.execute(query)
+        return [tuple(row) for row in result.all()]
+
+    @staticmethod
+    async def read(segment: Tuple[str, int, int]) -> List[Message]:
+        """One segment's messages, oldest first."""
+        rows = await asyncio.to_thread(read_segment, *segment)
+        messages = [Message(**row) for row in rows]
+        messages.sort(key=lambda m: (m.created_at, m.id))
+        return messages
+
+    async def record(
+        self,
+        partition_name: str,
+        range_start: datetime,
+        range_end: datetime,
+        path: str,
+        writer: ArchiveWriter,
+    ) -> MessageArchive:
+        """Record a written archive file and its segments; does not commit."""
+        await self.session.execute(
+            delete(MessageArchive).where(MessageArchive.partition_name == partition_name)
+        )
+        archive = MessageArchive(
+            partition_name=partition_name,
+            range_start=range_start,
+            range_end=range_end,
+            path=path,
+            message_count=writer.message_count,
+        )
+        self.session.add(archive)
+        await self.session.flush()
+        # The detached partition no longer cascades deletes, so skip conversations
+        # deleted since then.
+        for start in range(0, len(writer.segments), _RECORD_BATCH):
+            batch = writer.segments[start:start + _RECORD_BATCH]
+            result = await self.session.execute(
+                select(Conversation.id).where(
+                    Conversation.id.in_([segment["conversation_id"] for segment in batch])
+                )
+            )
+            existing = set(result.scalars().all())
+            segments = [
+                {"archive_id": archive.id, **segment}
+                for segment in batch
+                if segment["conversation_id"] in existing
+            ]
+            if segments:
+                await self.session.execute(insert(MessageArchiveSegment), segments)
+        return archive
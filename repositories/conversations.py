@@ -1,9 +1,12 @@
 from models import Conversation
 from repositories.interfaces import Repository
-from schemas import ConversationCreate, ConversationUpdate
-from sqlalchemy import select
+from repositories.pagination import decode_cursor, next_cursor
+from repositories.projections import schema_columns
+from schemas import ConversationCreate, ConversationOut, ConversationUpdate
+from datetime import datetime
+from sqlalchemy import Row, Select, delete, insert, or_, select, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 
 
 class ConversationRepository(Repository):
@@ -11,16 +14,56 @@ class ConversationRepository(Repository):
         self.session = session
 
     async def list(self, skip: int, take: int) -> List[Conversation]:
+        """Deprecated OFFSET/LIMIT listing, kept for clients that still send skip/take."""
         result = await self.session.execute(
-            select(Conversation).offset(skip).limit(take)
+            self._ordered(select(Conversation)).offset(skip).limit(take)
         )
         return [r for r in result.scalars().all()]
 
-    async def get(self, conversation_id: int) -> Optional[Conversation]:
+    async def list_rows(self, skip: int, take: int) -> List[Row]:
+        """`list` selecting only the ConversationOut columns."""
+        result = await self.session.execute(
+            self._ordered(select(*schema_columns(Conversation, ConversationOut)))
+            .offset(skip)
+            .limit(take)
+        )
+        return list(result.all())
+
+    async def list_page(
+        self, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Conversation], Optional[str]]:
+        """List conversations most recently updated first, using keyset pagination on (updated_at, id)."""
         result = await self.session.execute(
-            select(Conversation).where(Conversation.id == conversation_id)
+            self._after(self._ordered(select(Conversation)), cursor).limit(limit + 1)
         )
-        return result.scalars().first()
+        conversations = [r for r in result.scalars().all()]
+        return conversations, next_cursor(conversations, limit, "updated_at")
+
+    async def list_page_rows(
+        self, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Row], Optional[str]]:
+        """`list_page` selecting only the ConversationOut columns, without ORM hydration."""
+        query = self._ordered(select(*schema_columns(Conversation, ConversationOut)))
+        result = await self.session.execute(self._after(query, cursor).limit(limit + 1))
+        rows = list(result.all())
+        return rows, next_cursor(rows, limit, "updated_at")
+
+    @staticmethod
+    def _ordered(query: Select) -> Select:
+        return query.order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+
+    @staticmethod
+    def _after(query: Select, cursor: Optional[str]) -> Select:
+        if not cursor:
+            return query
+        updated_at, conversation_id = decode_cursor(cursor)
+        return query.where(
+            tuple_(Conversation.updated_at, Conversation.id) < tuple_(updated_at, conversation_id)
+        )
+
+    async def get(self, conversation_id: int) -> Optional[Conversation]:
+        # Session.get answers from the identity map when the row is already loaded
+        return await self.session.get(Conversation, conversation_id)
 
     async def create(self, conversation: Union[ConversationCreate, Conversation]) -> Conversation:
         if isinstance(conversation, ConversationCreate):
@@ -33,21 +76,75 @@ class ConversationRepository(Repository):
         await self.session.refresh(new_conversation)
         return new_conversation
 
+    async def create_many(
+        self, conversations: List[ConversationCreate], ids: Optional[List[int]] = None
+    ) -> List[int]:
+        """Insert conversations as one multi-row INSERT ... RETURNING and return their ids in order.
+
+        `ids` are used instead of database-assigned ones when given, e.g. on a shard.
+        """
+        if not conversations:
+            return []
+        rows = [c.model_dump() for c in conversations]
+        if ids is not None:
+            rows = [{"id": conversation_id, **row} for conversation_id, row in zip(ids, rows)]
+        result = await self.session.execute(
+            insert(Conversation).returning(Conversation.id, sort_by_parameter_order=True),
+            rows,
+        )
+        ids = list(result.scalars().all())
+        await self.session.commit()
+        return ids
+
     async def update(
         self, conversation_id: int, updated_conversation: ConversationUpdate
     ) -> Optional[Conversation]:
-        conversation = await self.get(conversation_id)
-        if not conversation:
-            return None
-        for key, value in updated_conversation.model_dump().items():
-            setattr(conversation, key, value)
+        """Update in one UPDATE ... RETURNING, without loading the row first."""
+        result = await self.session.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            # An explicit title wins over one still being generated in the background
+            .values(**updated_conversation.model_dump(), title_pending=False)
+            .returning(Conversation),
+            execution_options={"populate_existing": True},
+        )
+        conversation = result.scalars().first()
+        if conversation is not None:
+            # Detached, the commit does not expire the values RETURNING just loaded
+            self.session.expunge(conversation)
         await self.session.commit()
-        await self.session.refresh(conversation)
         return conversation
 
     async def delete(self, conversation_id: int) -> None:
-        conversation = await self.get(conversation_id)
-        if not conversation:
-            return
-        await self.session.delete(conversation)
-        await self.session.commit()
\ No newline at end of file
+        """Delete with one statement; messages go through the FK's ON DELETE CASCADE."""
+        await self.session.execute(
+            delete(Conversation)
+            .where(Conversation.id == conversation_id)
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.commit()
+
+    async def delete_inactive(self, before: datetime, limit: int) -> List[int]:
+        """Delete up to `limit` conversations with no update or message since `before`.
+
+        Commits, so each batch of a purge holds its locks only briefly. Returns the
+        deleted ids; fewer than `limit` means nothing is left to purge.
+        """
+        batch = (
+            select(Conversation.id)
+            .where(
+                Conversation.updated_at < before,
+                or_(Conversation.last_message_at.is_(None), Conversation.last_message_at < before),
+            )
+            .order_by(Conversation.id)
+            .limit(limit)
+        )
+        result = await self.session.execute(
+            delete(Conversation)
+            .where(Conversation.id.in_(batch.scalar_subquery()))
+            .returning(Conversation.id)
+            .execution_options(synchronize_session=False)
+        )
+        ids = list(result.scalars().all())
+        await self.session.commit()
+        return ids
@@ -1,17 +1,56 @@
+import heapq
+from datetime import datetime
 from models import Message
+from repositories.archive import ArchiveRepository
 from repositories.interfaces import Repository
-from sqlalchemy import select
+from repositories.pagination import decode_cursor, next_cursor
+from repositories.projections import schema_columns
+from repositories.usage import USAGE_COLUMNS, UsageRepository
+from schemas import MessageOut
+from settings import get_settings
+from sqlalchemy import Row, Select, delete, insert, select, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+settings = get_settings()
+
+def _sort_key(message: Any) -> Tuple[Any, int]:
+    return message.created_at, message.id
+
+
+def _forget_history(conversation_id: int) -> None:
+    """Drop the conversation's cached chat history once its messages changed."""
+    # Imported here: the history cache itself reads through this repository
+    from services.context import invalidate_context
+
+    invalidate_context(conversation_id)
+
+
+def _merge(archived: List[Any], recent: List[Any]) -> List[Any]:
+    """Merge archived and stored messages, both oldest first."""
+    if not archived:
+        return recent
+    return list(heapq.merge(archived, recent, key=_sort_key))
 
 
 class MessageRepository(Repository):
+    """Messages, including those of archived partitions.
+
+    When messages are partitioned, the per-conversation reads merge in the
+    conversation's cold-tier messages (see `ArchiveRepository`), so callers do
+    not need to know whether a conversation has been archived. Otherwise nothing
+    is ever archived and the archive is not looked up.
+    """
+
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
 
     async def list(self, skip: int = 0, take: int = 100) -> List[Message]:
         result = await self.session.execute(
-            select(Message).offset(skip).limit(take)
+            select(Message)
+            .order_by(Message.created_at, Message.id)
+            .offset(skip)
+            .limit(take)
         )
         return [r for r in result.scalars().all()]
 
@@ -23,30 +62,182 @@ class MessageRepository(Repository):
 
     async def create(self, message: Message) -> Message:
         self.session.add(message)
+        await self.session.flush()
+        await UsageRepository(self.session).add([message])
         await self.session.commit()
         await self.session.refresh(message)
         return message
 
+    async def create_many(self, messages: List[Dict[str, Any]]) -> None:
+        """Insert many message rows in a single transaction as a multi-row INSERT."""
+        if not messages:
+            return
+        await self.session.execute(insert(Message), messages)
+        await UsageRepository(self.session).add(messages)
+        await self.session.commit()
+
+    async def copy_many(self, messages: List[Dict[str, Any]]) -> None:
+        """Bulk load message rows, using COPY on PostgreSQL/asyncpg.
+
+        Every row must carry a value for each column except `id`. Other backends
+        fall back to `create_many`. The rows and their usage counters are
+        committed together.
+        """
+        if not messages:
+            return
+        connection = await self.session.connection()
+        if connection.dialect.driver != "asyncpg":
+            await self.create_many(messages)
+            return
+        columns = [c.key for c in Message.__table__.columns if c.key != "id"]
+        # Counters first: their statements begin the session's transaction on the
+        # driver connection, which the COPY then runs in.
+        await UsageRepository(self.session).add(messages)
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            Message.__tablename__,
+            records=[tuple(m[c] for c in columns) for m in messages],
+            columns=columns,
+        )
+        await self.session.commit()
+
     async def update(self, message_id: int, updated_message: Message) -> Optional[Message]:
-        message = await self.get(message_id)
-        if not message:
+        """Update with UPDATE ... RETURNING; only the usage columns are read beforehand."""
+        result = await self.session.execute(
+            select(*[Message.__table__.c[key] for key in USAGE_COLUMNS])
+            .where(Message.id == message_id)
+            .with_for_update()
+        )
+        previous = result.first()
+        if previous is None:
             return None
-        for key, value in updated_message.__dict__.items():
-            if not key.startswith('_'):
-                setattr(message, key, value)
+        values = {
+            column.key: updated_message.__dict__[column.key]
+            for column in Message.__table__.columns
+            if column.key != "id" and column.key in updated_message.__dict__
+        }
+        result = await self.session.execute(
+            update(Message).where(Message.id == message_id).values(**values).returning(Message),
+            execution_options={"populate_existing": True},
+        )
+        message = result.scalars().one()
+        await UsageRepository(self.session).replace(previous._asdict(), message)
+        # Detached, the commit does not expire the values RETURNING just loaded
+        self.session.expunge(message)
         await self.session.commit()
-        await self.session.refresh(message)
+        _forget_history(message.conversation_id)
         return message
 
     async def delete(self, message_id: int) -> None:
-        message = await self.get(message_id)
-        if not message:
-            return
-        await self.session.delete(message)
+        """Delete with DELETE ... RETURNING the columns the usage counters need."""
+        result = await self.session.execute(
+            delete(Message)
+            .where(Message.id == message_id)
+            .returning(*[Message.__table__.c[key] for key in USAGE_COLUMNS])
+            .execution_options(synchronize_session=False)
+        )
+        deleted = list(result.all())
+        if deleted:
+            await UsageRepository(self.session).remove(deleted)
+        await self.session.commit()
+        for row in deleted:
+            _forget_history(row.conversation_id)
+
+    async def delete_older(self, before: datetime, limit: int) -> int:
+        """Delete up to `limit` messages created before `before` and commit.
+
+        Returns how many were deleted; fewer than `limit` means nothing is left.
+        """
+        batch = (
+            select(Message.id)
+            .where(Message.created_at < before)
+            .order_by(Message.created_at, Message.id)
+            .limit(limit)
+        )
+        result = await self.session.execute(
+            delete(Message)
+            .where(Message.id.in_(batch.scalar_subquery()))
+            .returning(*[Message.__table__.c[key] for key in USAGE_COLUMNS])
+            .execution_options(synchronize_session=False)
+        )
+        deleted = list(result.all())
+        if deleted:
+            await UsageRepository(self.session).remove(deleted)
         await self.session.commit()
+        for conversation_id in {row.conversation_id for row in deleted}:
+            _forget_history(conversation_id)
+        return len(deleted)
 
     async def list_by_conversation(self, conversation_id: int) -> List[Message]:
         result = await self.session.execute(
-            select(Message).where(Message.conversation_id == conversation_id)
+            select(Message)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at, Message.id)
+        )
+        archived = []
+        if settings.messages_partitioned:
+            archived = await ArchiveRepository(self.session).messages(conversation_id)
+        return _merge(archived, [r for r in result.scalars().all()])
+
+    async def list_recent_by_conversation(
+        self, conversation_id: int, limit: int
+    ) -> List[Message]:
+        """Return the conversation's latest successful messages, oldest first."""
+        result = await self.session.execute(
+            select(Message)
+            .where(Message.conversation_id == conversation_id, Message.is_success.is_(True))
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(limit)
+        )
+        messages = list(reversed(result.scalars().all()))
+        if len(messages) < limit and settings.messages_partitioned:
+            archived = await ArchiveRepository(self.session).latest_successful(
+                conversation_id, limit - len(messages)
+            )
+            messages = _merge(archived, messages)[-limit:]
+        return messages
+
+    async def list_page_by_conversation(
+        self, conversation_id: int, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Message], Optional[str]]:
+        """List a conversation's messages oldest first, using keyset pagination on (created_at, id)."""
+        archived = await self._archived_page(conversation_id, limit, cursor)
+        query = self._conversation_page(select(Message), conversation_id, cursor)
+        result = await self.session.execute(query.limit(limit + 1))
+        messages = _merge(archived, [r for r in result.scalars().all()])[:limit + 1]
+        return messages, next_cursor(messages, limit, "created_at")
+
+    async def list_page_rows_by_conversation(
+        self, conversation_id: int, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Row], Optional[str]]:
+        """`list_page_by_conversation` selecting only the MessageOut columns, without ORM hydration."""
+        archived = await self._archived_page(conversation_id, limit, cursor)
+        query = self._conversation_page(
+            select(*schema_columns(Message, MessageOut)), conversation_id, cursor
+        )
+        result = await self.session.execute(query.limit(limit + 1))
+        rows = _merge(archived, list(result.all()))[:limit + 1]
+        return rows, next_cursor(rows, limit, "created_at")
+
+    async def _archived_page(
+        self, conversation_id: int, limit: int, cursor: Optional[str]
+    ) -> List[Message]:
+        """Up to `limit + 1` archived messages after `cursor`."""
+        if not settings.messages_partitioned:
+            return []
+        after = decode_cursor(cursor) if cursor else None
+        return await ArchiveRepository(self.session).messages(
+            conversation_id, after=after, limit=limit + 1
+        )
+
+    @staticmethod
+    def _conversation_page(query: Select, conversation_id: int, cursor: Optional[str]) -> Select:
+        query = query.where(Message.conversation_id == conversation_id).order_by(
+            Message.created_at, Message.id
         )
-        return [r for r in result.scalars().all()] 
\ No newline at end of file
+        if cursor:
+            created_at, message_id = decode_cursor(cursor)
+            query = query.where(
+                tuple_(Message.created_at, Message.id) > tuple_(created_at, message_id)
+            )
+        return query
@@ -0,0 +1,55 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+
+def _encode(values: List[Any]) -> str:
+    payload = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> List[Any]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+
+def encode_cursor(timestamp: datetime, uid: int) -> str:
+    """Encode the sort key of the last row of a page into an opaque cursor."""
+    return _encode([timestamp.isoformat(), uid])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by `encode_cursor`, raising ValueError if it is malformed."""
+    try:
+        timestamp, uid = _decode(cursor)
+        return datetime.fromisoformat(timestamp), int(uid)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def encode_rank_cursor(rank: float, kind: int, conversation_id: int, uid: int) -> str:
+    """Encode the (rank, kind, conversation id, id) sort key of the last search hit of a page."""
+    return _encode([rank, kind, conversation_id, uid])
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int, int, int]:
+    """Decode a cursor produced by `encode_rank_cursor`, raising ValueError if it is malformed."""
+    try:
+        rank, kind, conversation_id, uid = _decode(cursor)
+        return float(rank), int(kind), int(conversation_id), int(uid)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def next_cursor(rows: list, limit: int, timestamp_attr: str) -> Optional[str]:
+    """Return the cursor for the page after `rows`, or None when this is the last page.
+
+    Callers fetch `limit + 1` rows; the extra row only signals that more data exists
+    and is trimmed from `rows` in place.
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return encode_cursor(getattr(last, timestamp_attr), last.id)
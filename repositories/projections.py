@@ -0,0 +1,12 @@
+from typing import List, Type
+
+from pydantic import BaseModel
+
+
+def schema_columns(model, schema: Type[BaseModel]) -> List:
+    """The mapped columns of `model` that `schema` serializes, in schema order.
+
+    Selecting these instead of the entity returns plain Row tuples and skips ORM
+    identity-map hydration, for read paths that only serialize the result.
+    """
+    return [getattr(model, name) for name in schema.model_fields]
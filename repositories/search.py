@@ -0,0 +1,134 @@
+from typing import List, Optional, Tuple
+
+from sqlalchemy import DateTime, Float, Integer, Row, String, TextClause, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from repositories.pagination import decode_rank_cursor, encode_rank_cursor
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+
+# Hit kinds, in the order they sort at equal rank
+KIND_CONVERSATION = 0
+KIND_MESSAGE = 1
+
+_PAGE = """
+SELECT * FROM ({hits}) AS hits
+{after}
+ORDER BY rank DESC, kind, conversation_id DESC, uid DESC
+LIMIT :limit
+"""
+
+_AFTER = """
+WHERE rank < :rank OR (rank = :rank AND (kind > :kind OR (kind = :kind AND (
+    conversation_id < :conversation_id OR (conversation_id = :conversation_id AND uid < :uid)
+))))
+"""
+
+_POSTGRESQL_HITS = """
+SELECT 0 AS kind, c.id AS uid, c.id AS conversation_id, NULL::integer AS message_id,
+       ts_rank_cd(c.search_vector, query) AS rank, c.created_at
+FROM conversations c, websearch_to_tsquery('english', :q) query
+WHERE c.search_vector @@ query
+UNION ALL
+SELECT 1, m.id, m.conversation_id, m.id, ts_rank_cd(m.search_vector, query), m.created_at
+FROM messages m, websearch_to_tsquery('english', :q) query
+WHERE m.search_vector @@ query
+"""
+
+# Headlines are expensive, so they are built for the page only
+_POSTGRESQL = """
+SELECT hits.kind, hits.uid, hits.conversation_id, c.title AS conversation_title,
+       hits.message_id, hits.rank, hits.created_at,
+       ts_headline(
+           'english',
+           CASE WHEN hits.kind = 0 THEN c.title
+                ELSE m.prompt_content || ' ' || m.response_content END,
+           websearch_to_tsquery('english', :q),
+           'StartSel={start}, StopSel={stop}, MaxFragments=2, MaxWords=20, MinWords=5'
+       ) AS snippet
+FROM ({page}) AS hits
+JOIN conversations c ON c.id = hits.conversation_id
+LEFT JOIN messages m ON m.id = hits.message_id
+ORDER BY hits.rank DESC, hits.kind, hits.conversation_id DESC, hits.uid DESC
+"""
+
+# FTS5 auxiliary functions only work next to their MATCH, so snippets are built
+# inline; bm25() is lower for better matches and is negated to sort like ts_rank.
+_SQLITE_HITS = """
+SELECT 0 AS kind, c.id AS uid, c.id AS conversation_id, c.title AS conversation_title,
+       NULL AS message_id, -bm25(conversations_fts) AS rank, c.created_at,
+       highlight(conversations_fts, 0, '{start}', '{stop}') AS snippet
+FROM conversations_fts JOIN conversations c ON c.id = conversations_fts.rowid
+WHERE conversations_fts MATCH :q
+UNION ALL
+SELECT 1, m.id, m.conversation_id, c.title, m.id, -bm25(messages_fts), m.created_at,
+       snippet(messages_fts, -1, '{start}', '{stop}', '...', 16)
+FROM messages_fts
+JOIN messages m ON m.id = messages_fts.rowid
+JOIN conversations c ON c.id = m.conversation_id
+WHERE messages_fts MATCH :q
+"""
+
+
+def fts5_query(query: str) -> str:
+    """Quote each term so user input is matched literally instead of parsed as FTS5 syntax."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+class SearchRepository:
+    """Ranked full-text search over conversation titles and message contents.
+
+    Uses the tsvector columns and GIN indexes on PostgreSQL and the FTS5 tables
+    on SQLite (see `models.SEARCH_DDL`). Pages are keyset-paginated on
+    (rank, kind, conversation id, id); message ids are only unique per shard,
+    so the conversation id keeps the key unique across shards.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def search(
+        self, query: str, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Row], Optional[str]]:
+        params = {"limit": limit + 1}
+        after = ""
+        if cursor:
+            (
+                params["rank"], params["kind"], params["conversation_id"], params["uid"]
+            ) = decode_rank_cursor(cursor)
+            after = _AFTER
+        dialect = self.session.get_bind().dialect.name
+        if dialect == "postgresql":
+            params["q"] = query
+            page = _PAGE.format(hits=_POSTGRESQL_HITS, after=after)
+            sql = _POSTGRESQL.format(page=page, start=HIGHLIGHT_START, stop=HIGHLIGHT_STOP)
+        elif dialect == "sqlite":
+            params["q"] = fts5_query(query)
+            hits = _SQLITE_HITS.format(start=HIGHLIGHT_START, stop=HIGHLIGHT_STOP)
+            sql = _PAGE.format(hits=hits, after=after)
+        else:
+            raise NotImplementedError(f"Full-text search is not available on {dialect}")
+        if not params["q"].strip():
+            return [], None
+
+        result = await self.session.execute(self._typed(text(sql)), params)
+        rows = list(result.all())
+        if len(rows) <= limit:
+            return rows, None
+        del rows[limit:]
+        last = rows[-1]
+        return rows, encode_rank_cursor(last.rank, last.kind, last.conversation_id, last.uid)
+
+    @staticmethod
+    def _typed(statement: TextClause):
+        return statement.columns(
+            kind=Integer,
+            uid=Integer,
+            conversation_id=Integer,
+            conversation_title=String,
+            message_id=Integer,
+            rank=Float,
+            created_at=DateTime,
+            snippet=String,
+        )
@@ -0,0 +1,196 @@
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, Integer, Row, bindparam, case, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Conversation, Message, UsageDaily
+from settings import get_settings
+
+settings = get_settings()
+
+USAGE_FIELDS = ("message_count", "failed_count", "prompt_tokens", "response_tokens", "total_tokens")
+
+# Conversation counter column for each usage field
+CONVERSATION_COLUMNS = {
+    "message_count": "message_count",
+    "failed_count": "failed_message_count",
+    "prompt_tokens": "prompt_tokens_total",
+    "response_tokens": "response_tokens_total",
+    "total_tokens": "total_tokens",
+}
+
+# Message columns that `message_usage` reads
+USAGE_COLUMNS = (
+    "conversation_id", "is_success", "prompt_tokens", "response_tokens", "total_tokens", "created_at"
+)
+
+_UPSERT = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _value(row: Any, key: str) -> Any:
+    return row[key] if isinstance(row, dict) else getattr(row, key)
+
+
+def message_usage(row: Any, sign: int = 1) -> Dict[str, int]:
+    """What one message (an ORM object or a column dict) contributes to the counters."""
+    prompt_tokens = _value(row, "prompt_tokens") or 0
+    response_tokens = _value(row, "response_tokens") or 0
+    total_tokens = _value(row, "total_tokens")
+    return {
+        "message_count": sign,
+        "failed_count": sign if _value(row, "is_success") is False else 0,
+        "prompt_tokens": sign * prompt_tokens,
+        "response_tokens": sign * response_tokens,
+        "total_tokens": sign * (total_tokens if total_tokens is not None else prompt_tokens + response_tokens),
+    }
+
+
+def _add(totals: Dict[str, int], usage: Dict[str, int]) -> None:
+    for field in USAGE_FIELDS:
+        totals[field] += usage[field]
+
+
+class UsageRepository:
+    """Incrementally maintained usage aggregates.
+
+    Every message write adds its contribution to its conversation's counters and
+    to the `usage_daily` rollup, in the caller's transaction; nothing here
+    commits. A conversation's usage goes to one of `usage_rollup_slots` rollup
+    rows for its day and model, so writers for different conversations rarely
+    contend for the same row; `daily` adds the slots up. Daily rollups record usage as it happened and are not reduced when
+    messages are deleted later.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def add(self, messages: Sequence[Any]) -> None:
+        """Count newly inserted messages."""
+        await self._apply([(m, 1) for m in messages], rollup=True, touch=True)
+
+    async def replace(self, old: Dict[str, Any], new: Message) -> None:
+        """Swap an updated message's old contribution for its new one."""
+        await self._apply([(old, -1), (new, 1)], rollup=True, touch=False)
+
+    async def remove(self, messages: Sequence[Any]) -> None:
+        """Take deleted messages out of their conversations' counters.
+
+        Call after the delete is flushed, so the last message time is recomputed
+        from the remaining rows.
+        """
+        await self._apply([(m, -1) for m in messages], rollup=False, touch=False)
+        table = Conversation.__table__
+        conversation_ids = sorted({_value(m, "conversation_id") for m in messages})
+        latest = (
+            select(func.max(Message.created_at))
+            .where(Message.conversation_id == table.c.id)
+            .scalar_subquery()
+        )
+        await self.session.execute(
+            update(table)
+            .where(table.c.id.in_(conversation_ids))
+            .values(last_message_at=latest, updated_at=table.c.updated_at)
+        )
+
+    async def _apply(
+        self, rows: Iterable[Tuple[Any, int]], rollup: bool, touch: bool
+    ) -> None:
+        conversations: Dict[int, Dict[str, int]] = {}
+        latest: Dict[int, datetime] = {}
+        days: Dict[Tuple[date, int], Dict[str, int]] = {}
+        for row, sign in rows:
+            conversation_id = _value(row, "conversation_id")
+            usage = message_usage(row, sign)
+            _add(conversations.setdefault(conversation_id, dict.fromkeys(USAGE_FIELDS, 0)), usage)
+            created_at = _value(row, "created_at") or datetime.now()
+            if touch:
+                latest[conversation_id] = max(latest.get(conversation_id, created_at), created_at)
+            if rollup:
+                _add(days.setdefault((created_at.date(), conversation_id), dict.fromkeys(USAGE_FIELDS, 0)), usage)
+        if not conversations:
+            return
+        await self._update_conversations(conversations, latest)
+        if rollup:
+            await self._update_days(days)
+
+    async def _update_conversations(
+        self, conversations: Dict[int, Dict[str, int]], latest: Dict[int, datetime]
+    ) -> None:
+        table = Conversation.__table__
+        last = bindparam("b_last", type_=DateTime)
+        values = {
+            CONVERSATION_COLUMNS[field]: table.c[CONVERSATION_COLUMNS[field]]
+            + bindparam(f"b_{field}", type_=Integer)
+            for field in USAGE_FIELDS
+        }
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                **values,
+                last_message_at=case(
+                    (or_(table.c.last_message_at.is_(None), table.c.last_message_at < last), last),
+                    else_=table.c.last_message_at,
+                ),
+                # Counters are not an edit: keep the conversation's place in the listing
+                updated_at=table.c.updated_at,
+            )
+        )
+        # Sorted so concurrent writers lock conversations in the same order
+        await self.session.execute(statement, [
+            {
+                "b_id": conversation_id,
+                "b_last": latest.get(conversation_id),
+                **{f"b_{field}": totals[field] for field in USAGE_FIELDS},
+            }
+            for conversation_id, totals in sorted(conversations.items())
+        ])
+
+    async def _update_days(self, days: Dict[Tuple[date, int], Dict[str, int]]) -> None:
+        conversation_ids = {conversation_id for _, conversation_id in days}
+        result = await self.session.execute(
+            select(Conversation.id, Conversation.model_type).where(Conversation.id.in_(conversation_ids))
+        )
+        model_types = dict(result.all())
+        slots = max(settings.usage_rollup_slots, 1)
+        rollups: Dict[Tuple[date, str, int], Dict[str, int]] = {}
+        for (day, conversation_id), usage in days.items():
+            model_type = model_types.get(conversation_id)
+            if model_type is not None:
+                key = (day, model_type, conversation_id % slots)
+                _add(rollups.setdefault(key, dict.fromkeys(USAGE_FIELDS, 0)), usage)
+        if not rollups:
+            return
+
+        dialect = self.session.get_bind().dialect.name
+        if dialect not in _UPSERT:
+            raise NotImplementedError(f"Usage rollups are not available on {dialect}")
+        statement = _UPSERT[dialect](UsageDaily).values([
+            {"day": day, "model_type": model_type, "slot": slot, **usage}
+            for (day, model_type, slot), usage in sorted(rollups.items())
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[UsageDaily.day, UsageDaily.model_type, UsageDaily.slot],
+            set_={field: UsageDaily.__table__.c[field] + statement.excluded[field] for field in USAGE_FIELDS},
+        )
+        await self.session.execute(statement)
+
+    async def daily(
+        self, start: date, end: date, model_type: Optional[str] = None
+    ) -> List[Row]:
+        """Totals per day and model from `start` to `end` inclusive, oldest first."""
+        query = (
+            select(
+                UsageDaily.day,
+                UsageDaily.model_type,
+                *[func.sum(UsageDaily.__table__.c[field]).label(field) for field in USAGE_FIELDS],
+            )
+            .where(UsageDaily.day >= start, UsageDaily.day <= end)
+            .group_by(UsageDaily.day, UsageDaily.model_type)
+        )
+        if model_type is not None:
+            query = query.where(UsageDaily.model_type == model_type)
+        result = await self.session.execute(query.order_by(UsageDaily.day, UsageDaily.model_type))
+        return list(result.all())
@@ -0,0 +1,19 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(obj: Any) -> Any:
+    # Field values of already-validated models; orjson serializes datetimes natively.
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class OrjsonResponse(JSONResponse):
+    """JSON response rendered with orjson, for content that has already been validated."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+from typing import Optional
+from fastapi import APIRouter, HTTPException, status
+from models import Conversation
+from repositories.usage import USAGE_FIELDS, UsageRepository
+from schemas import ConversationUsageOut, UsageDayOut, UsageReportOut, UsageTotalsOut
+from sharding import ReadShardSessionDep, shards
+
+router = APIRouter(prefix="/analytics")
+
+MAX_USAGE_DAYS = 366
+
+
+@router.get("/usage")
+async def usage_report_controller(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    model_type: Optional[str] = None,
+) -> UsageReportOut:
+    """Message and token usage per day and model, read from the daily rollups (default: last 30 days)"""
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days >= MAX_USAGE_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"start must be on or before end, at most {MAX_USAGE_DAYS} days apart",
+        )
+    pages = await shards.fan_out(
+        "usage_report", lambda session: UsageRepository(session).daily(start, end, model_type)
+    )
+    # Each shard rolls up its own conversations; add up the same day and model
+    days = {}
+    for rows in pages:
+        for row in rows:
+            day = days.setdefault((row.day, row.model_type), dict.fromkeys(USAGE_FIELDS, 0))
+            for field in USAGE_FIELDS:
+                day[field] += getattr(row, field)
+    totals = UsageTotalsOut(
+        **{field: sum(day[field] for day in days.values()) for field in USAGE_FIELDS}
+    )
+    return UsageReportOut(
+        start=start,
+        end=end,
+        totals=totals,
+        days=[
+            UsageDayOut(day=day, model_type=model_type, **usage)
+            for (day, model_type), usage in sorted(days.items())
+        ],
+    )
+
+
+@router.get("/usage/conversations/{conversation_id}")
+async def conversation_usage_controller(
+    conversation_id: int, session: ReadShardSessionDep
+) -> ConversationUsageOut:
+    """A conversation's message, failure and token counters"""
+    conversation = await session.get(Conversation, conversation_id)
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found",
+        )
+    return ConversationUsageOut.model_validate(conversation)
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from database import settings
+from schemas import BulkConversationsOut, ConversationCreate, ImportReport, PurgeProgress
+from services.export import NDJSON_MEDIA_TYPE
+from services.importer import CSV_MEDIA_TYPE, BulkImporter, iter_csv, iter_ndjson
+from services.purge import BulkPurger
+from sharding import shards
+
+router = APIRouter(prefix="/bulk")
+importer = BulkImporter(shards, batch_size=settings.bulk_batch_size)
+purger = BulkPurger(shards, batch_size=settings.bulk_purge_batch_size)
+
+
+async def progress_ndjson(progress: AsyncIterator[PurgeProgress]) -> AsyncIterator[bytes]:
+    async for line in progress:
+        yield (line.model_dump_json() + "\n").encode()
+
+
+@router.post("/conversations", status_code=status.HTTP_201_CREATED)
+async def bulk_create_conversations_controller(
+    conversations: List[ConversationCreate],
+) -> BulkConversationsOut:
+    """Create many conversations in batches; ids are returned in request order"""
+    return await importer.create_conversations(conversations)
+
+
+@router.post("/messages")
+async def bulk_import_messages_controller(request: Request) -> ImportReport:
+    """Import messages from an NDJSON or CSV request body, streamed batch by batch"""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(NDJSON_MEDIA_TYPE):
+        records = iter_ndjson(request.stream())
+    elif content_type.startswith(CSV_MEDIA_TYPE):
+        records = iter_csv(request.stream())
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Expected {NDJSON_MEDIA_TYPE} or {CSV_MEDIA_TYPE}",
+        )
+    return await importer.import_messages(records)
+
+
+@router.delete("/conversations")
+async def purge_conversations_controller(
+    older_than_days: int = Query(..., ge=1),
+) -> StreamingResponse:
+    """Delete conversations with no activity in the last N days, with their messages.
+
+    Rows are deleted in batches; one NDJSON progress line is streamed per batch.
+    """
+    before = datetime.now() - timedelta(days=older_than_days)
+    return StreamingResponse(
+        progress_ndjson(purger.purge_conversations(before)), media_type=NDJSON_MEDIA_TYPE
+    )
+
+
+@router.delete("/messages")
+async def purge_messages_controller(
+    older_than_days: int = Query(..., ge=1),
+) -> StreamingResponse:
+    """Delete messages older than N days, streaming one NDJSON progress line per batch"""
+    before = datetime.now() - timedelta(days=older_than_days)
+    return StreamingResponse(
+        progress_ndjson(purger.purge_messages(before)), media_type=NDJSON_MEDIA_TYPE
+    )
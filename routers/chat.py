@@ -0,0 +1,191 @@
+import asyncio
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from database import settings
+from metrics import registry
+from routers.llm import llm_service, stream_generator
+from schemas import ChatClientFrame
+from services.admission import Overloaded
+from services.conversations import ConversationService
+from services.streaming import ErrorChunk, coalesce, passthrough
+from sharding import shards
+
+router = APIRouter(prefix="/llm")
+
+open_sockets = registry.gauge("chat_ws_connections", "Open chat WebSocket connections")
+active_turns = registry.gauge("chat_ws_active_turns", "Generations running on chat WebSockets")
+chat_frames = registry.counter("chat_ws_frames_total", "Chat WebSocket frames, by direction and type")
+
+
+class ChatSocket:
+    """One chat WebSocket carrying any number of joined conversations.
+
+    A conversation is checked once, when it is joined; after that each prompt
+    starts a generation as its own task, so conversations stream concurrently
+    and can be cancelled independently. All frames go through one send lock:
+    when the client reads slowly, sends wait for the socket to drain and the
+    generations wait with them, so at most one coalesced chunk per generation
+    is held in memory. An idle socket costs no task besides its receive loop.
+    """
+
+    def __init__(self, websocket: WebSocket, max_conversations: int) -> None:
+        self.websocket = websocket
+        self.max_conversations = max_conversations
+        # conversation id -> model type, for the conversations joined on this socket
+        self.conversations: Dict[int, Optional[str]] = {}
+        self.turns: Dict[int, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, frame_type: str, conversation_id: Optional[int], **fields: Any) -> None:
+        async with self._send_lock:
+            await self.websocket.send_json(
+                {"type": frame_type, "conversation_id": conversation_id, **fields}
+            )
+        chat_frames.inc(direction="out", type=frame_type)
+
+    async def error(self, conversation_id: Optional[int], detail: str, status: int, **fields: Any) -> None:
+        await self.send("error", conversation_id, status=status, detail=detail, **fields)
+
+    async def run(self) -> None:
+        open_sockets.inc()
+        try:
+            while True:
+                try:
+                    frame = ChatClientFrame.model_validate(await self.websocket.receive_json())
+                except (ValidationError, ValueError) as e:
+                    await self.error(None, f"Invalid frame: {e}", 400)
+                    continue
+                chat_frames.inc(direction="in", type=frame.type)
+                await self.handle(frame)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            open_sockets.dec()
+            for task in list(self.turns.values()):
+                task.cancel()
+            if self.turns:
+                await asyncio.gather(*self.turns.values(), return_exceptions=True)
+
+    async def handle(self, frame: ChatClientFrame) -> None:
+        conversation_id = frame.conversation_id
+        if frame.type == "join":
+            await self.join(conversation_id)
+        elif conversation_id not in self.conversations:
+            await self.error(conversation_id, "Conversation not joined", 409)
+        elif frame.type == "leave":
+            await self.cancel(conversation_id)
+            del self.conversations[conversation_id]
+            await self.send("left", conversation_id)
+        elif frame.type == "cancel":
+            if not await self.cancel(conversation_id):
+                await self.error(conversation_id, "No generation in progress", 409)
+        elif not frame.prompt:
+            await self.error(conversation_id, "prompt is required", 400)
+        else:
+            await self.prompt(conversation_id, frame.prompt, frame.use_cache)
+
+    async def join(self, conversation_id: int) -> None:
+        if conversation_id not in self.conversations:
+            if len(self.conversations) >= self.max_conversations:
+                await self.error(
+                    conversation_id, f"At most {self.max_conversations} conversations per socket", 429
+                )
+                return
+            async with shards.session(conversation_id) as session:
+                conversation = await ConversationService(session).lookup(conversation_id)
+            if conversation is None:
+                await self.error(conversation_id, "Conversation not found", 404)
+                return
+            self.conversations[conversation_id] = conversation.model_type
+        await self.send("joined", conversation_id)
+
+    async def prompt(self, conversation_id: int, prompt: str, use_cache: bool) -> None:
+        if conversation_id in self.turns:
+            await self.error(conversation_id, "A generation is already in progress", 409)
+            return
+        try:
+            llm_service.check_admission(prompt)
+        except Overloaded as e:
+            await self.error(conversation_id, str(e), e.status_code, retry_after=e.retry_after)
+            return
+        task = asyncio.create_task(self._generate(conversation_id, prompt, use_cache))
+        self.turns[conversation_id] = task
+        active_turns.inc()
+        task.add_done_callback(lambda _: self._finished(conversation_id, task))
+
+    def _finished(self, conversation_id: int, task: asyncio.Task) -> None:
+        active_turns.dec()
+        if self.turns.get(conversation_id) is task:
+            del self.turns[conversation_id]
+
+    async def cancel(self, conversation_id: int) -> bool:
+        """Stop the conversation's generation; what was produced so far is stored as partial."""
+        task = self.turns.get(conversation_id)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    async def _generate(self, conversation_id: int, prompt: str, use_cache: bool) -> None:
+        chunks = stream_generator(
+            prompt, conversation_id, use_cache, self.conversations[conversation_id]
+        )
+        if settings.stream_coalesce_max_bytes > 0:
+            chunks = coalesce(
+                chunks,
+                settings.stream_coalesce_max_bytes,
+                settings.stream_coalesce_max_delay_ms / 1000,
+            )
+        else:
+            chunks = passthrough(chunks)
+        try:
+            failure: Optional[ErrorChunk] = None
+            async for chunk in chunks:
+                if isinstance(chunk, ErrorChunk):
+                    # Upstream failure or queue rejection: reported instead of `done`
+                    failure = chunk
+                else:
+                    await self.send("chunk", conversation_id, data=chunk)
+            if failure is None:
+                await self.send("done", conversation_id)
+            elif failure.retry_after is not None:
+                await self.error(
+                    conversation_id, failure.detail, failure.status_code,
+                    retry_after=failure.retry_after,
+                )
+            else:
+                await self.error(conversation_id, failure.detail, failure.status_code)
+        except asyncio.CancelledError:
+            await chunks.aclose()
+            try:
+                await self.send("cancelled", conversation_id)
+            except Exception:
+                pass  # The socket is already gone
+            raise
+        except Exception as e:
+            await chunks.aclose()
+            print(f"Error streaming chat response: {e}")
+            try:
+                await self.error(conversation_id, f"Error streaming response: {e}", 500)
+            except Exception:
+                pass  # The socket is already gone
+
+
+@router.websocket("/chat")
+async def chat_websocket(websocket: WebSocket) -> None:
+    """Multiplexed chat: one socket carries several conversations.
+
+    Client frames are JSON objects tagged with `type` and `conversation_id`:
+    `join` (checks the conversation once), `prompt` (with `prompt` and optional
+    `use_cache`), `cancel` and `leave`. The server answers `joined`, `left`,
+    `chunk` (with `data`), `done`, `cancelled` and `error` (with `status` and
+    `detail`) frames for the same conversation id. A generation ends with
+    exactly one of `done`, `cancelled` or `error`; an overloaded `error` also
+    carries `retry_after`.
+    """
+    await websocket.accept()
+    await ChatSocket(websocket, settings.chat_ws_max_conversations).run()
@@ -1,17 +1,48 @@
-from typing import Annotated, List
-from fastapi import APIRouter, Depends, HTTPException, status
-from services.conversations import ConversationService
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from services.conversations import (
+    ConversationService,
+    create_conversation,
+    list_conversation_page_rows,
+    list_conversation_rows,
+    search_conversations,
+)
 from models import Conversation, Message
-from schemas import ConversationCreate, ConversationUpdate, ConversationOut, MessageOut
-from database import DBSessionDep
+from schemas import (
+    ConversationCreate,
+    ConversationListAdapter,
+    ConversationOut,
+    ConversationUpdate,
+    MessageListAdapter,
+    MessageOut,
+    SearchHitListAdapter,
+    SearchHitOut,
+)
+from database import settings
+from sharding import ReadShardSessionDep, ShardSessionDep, shards
+from responses import OrjsonResponse
+from services.export import NDJSON_MEDIA_TYPE, stream_conversation_messages
 
 router = APIRouter(prefix="/conversations")
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def page_response(items: list, cursor: Optional[str]) -> OrjsonResponse:
+    """Render validated items, exposing the opaque cursor for the next page if there is one."""
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else None
+    return OrjsonResponse(items, headers=headers)
+
+
+def invalid_cursor(e: ValueError) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 
 async def get_conversation(
-    conversation_id: int, session: DBSessionDep
-) -> Conversation:
-    conversation = await ConversationService(session).get(conversation_id)
+    conversation_id: int, session: ShardSessionDep
+) -> ConversationOut:
+    conversation = await ConversationService(session).lookup(conversation_id)
     if not conversation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -20,57 +51,134 @@ async def get_conversation(
     return conversation
 
 
-GetConversationDep = Annotated[Conversation, Depends(get_conversation)]
+GetConversationDep = Annotated[ConversationOut, Depends(get_conversation)]
+
+
+async def get_read_conversation(
+    conversation_id: int, session: ReadShardSessionDep
+) -> ConversationOut:
+    return await get_conversation(conversation_id, session)
+
+
+ReadConversationDep = Annotated[ConversationOut, Depends(get_read_conversation)]
+
+
+# Declared before the /{conversation_id} routes so "search" is not parsed as an id
+@router.get("/search", response_model=List[SearchHitOut], response_class=OrjsonResponse)
+async def search_conversations_controller(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+) -> Response:
+    """Full-text search over conversation titles and messages, best matches first.
+
+    Each hit carries a snippet with the matched terms wrapped in <mark></mark>;
+    the next page's cursor is returned in the X-Next-Cursor header.
+    """
+    try:
+        rows, cursor = await search_conversations(q, limit, cursor)
+    except ValueError as e:
+        raise invalid_cursor(e)
+    return page_response(SearchHitListAdapter.validate_python(rows, from_attributes=True), cursor)
+
+
+@router.get("/{conversation_id}/messages/stream")
+async def stream_conversation_messages_controller(
+    conversation: ReadConversationDep,
+) -> StreamingResponse:
+    """Export all messages of a conversation as NDJSON with flat memory use"""
+    return StreamingResponse(
+        stream_conversation_messages(
+            lambda: shards.read_session(conversation.id), conversation.id, settings.export_fetch_size
+        ),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
 
 
-@router.get("/{conversation_id}/messages", response_model=List[MessageOut])
+@router.get(
+    "/{conversation_id}/messages",
+    response_model=List[MessageOut],
+    response_class=OrjsonResponse,
+)
 async def list_conversation_messages_controller(
-    conversation: GetConversationDep,
-    session: DBSessionDep,
-):
-    messages = await ConversationService(session).list_messages(conversation.id)
-    return messages  # FastAPI will use the response_model to serialize
+    conversation: ReadConversationDep,
+    session: ReadShardSessionDep,
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+) -> Response:
+    """List messages oldest first; the next page's cursor is returned in the X-Next-Cursor header.
+
+    With `Accept: application/x-ndjson` the whole conversation is streamed instead.
+    """
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return await stream_conversation_messages_controller(conversation)
+    try:
+        rows, cursor = await ConversationService(session).list_messages_page_rows(
+            conversation.id, limit, cursor
+        )
+    except ValueError as e:
+        raise invalid_cursor(e)
+    return page_response(MessageListAdapter.validate_python(rows, from_attributes=True), cursor)
 
 
-@router.get("")
+@router.get("", response_model=List[ConversationOut], response_class=OrjsonResponse)
 async def list_conversations_controller(
-    session: DBSessionDep, skip: int = 0, take: int = 100
-) -> List[ConversationOut]:
-    conversations = await ConversationService(session).list(skip, take)
-    return [ConversationOut.model_validate(c) for c in conversations]
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    skip: Optional[int] = Query(None, ge=0, deprecated=True),
+    take: Optional[int] = Query(None, ge=1, le=1000, deprecated=True),
+) -> Response:
+    """List conversations most recently updated first.
+
+    The next page's cursor is returned in the X-Next-Cursor header. `skip`/`take`
+    are deprecated: they fall back to OFFSET pagination, which degrades on deep pages.
+    With sharding, every shard is queried and the pages are merged.
+    """
+    if skip is not None or take is not None:
+        rows, cursor = await list_conversation_rows(skip or 0, take or limit), None
+    else:
+        try:
+            rows, cursor = await list_conversation_page_rows(limit, cursor)
+        except ValueError as e:
+            raise invalid_cursor(e)
+    return page_response(ConversationListAdapter.validate_python(rows, from_attributes=True), cursor)
 
 
 @router.get("/{conversation_id}")
 async def get_conversation_controller(
-    conversation: GetConversationDep,
+    conversation: ReadConversationDep,
 ) -> ConversationOut:
     return ConversationOut.model_validate(conversation)
 
 
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def create_conversation_controller(
-    conversation: ConversationCreate, session: DBSessionDep
+    conversation: ConversationCreate,
 ) -> ConversationOut:
-    new_conversation = await ConversationService(session).create(
-        conversation
-    )
+    new_conversation = await create_conversation(conversation)
     return ConversationOut.model_validate(new_conversation)
 
 
 @router.put("/{conversation_id}", status_code=status.HTTP_202_ACCEPTED)
 async def update_conversation_controller(
-    conversation: GetConversationDep,
+    conversation_id: int,
     updated_conversation: ConversationUpdate,
-    session: DBSessionDep,
+    session: ShardSessionDep,
 ) -> ConversationOut:
-    updated_conversation = await ConversationService(session).update(
-        conversation.id, updated_conversation
-    )
-    return ConversationOut.model_validate(updated_conversation)
+    # The UPDATE itself tells whether the conversation exists: the lookup cache
+    # may still hold one another worker has deleted.
+    conversation = await ConversationService(session).update(conversation_id, updated_conversation)
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found",
+        )
+    return ConversationOut.model_validate(conversation)
 
 
 @router.delete("/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_conversation_controller(
-    conversation: GetConversationDep, session: DBSessionDep
+    conversation: GetConversationDep, session: ShardSessionDep
 ) -> None:
     await ConversationService(session).delete(conversation.id)
\ No newline at end of file
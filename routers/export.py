@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from database import settings
+from services.export import NDJSON_MEDIA_TYPE, stream_database
+from sharding import shards
+
+router = APIRouter(prefix="/export")
+
+
+@router.get("")
+async def export_database_controller() -> StreamingResponse:
+    """Stream a full NDJSON export of conversations and messages for backups"""
+    return StreamingResponse(
+        stream_database(shards.read_session_factories, settings.export_fetch_size),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": 'attachment; filename="export.ndjson"'},
+    )
@@ -1,21 +1,53 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import time
+from typing import Annotated, AsyncIterator, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import DBSessionDep
+from database import settings
 from models import Conversation, Message
 from repositories.messages import MessageRepository
+from services.admission import Overloaded
+from services.idempotency import (
+    IDEMPOTENCY_HEADER,
+    MAX_KEY_LENGTH,
+    REPLAYED_HEADER,
+    Flight,
+    IdempotencyConflict,
+    IdempotencyStore,
+    request_fingerprint,
+)
+from services.message_buffer import message_buffer
+from services.tokens import count_tokens
 from services.llm import LLMService
 from services.conversations import ConversationService
-from schemas import LLMConversationRequest, LLMTextRequest, LLMConversationResponse, LLMTextResponse
+from sharding import ShardSessionDep, shards
+from services.streaming import SSE_MEDIA_TYPE, ErrorChunk, coalesce, encode, passthrough
+from services.titles import TitleWorker
+from schemas import (
+    ConversationOut,
+    ConversationTitleOut,
+    LLMConversationRequest,
+    LLMConversationResponse,
+    LLMTextRequest,
+    LLMTextResponse,
+)
 
 router = APIRouter(prefix="/llm")
 llm_service = LLMService()
+title_worker = TitleWorker(
+    llm_service,
+    shards,
+    batch_size=settings.title_batch_size,
+    batch_window=settings.title_batch_window_ms / 1000,
+    concurrency=settings.title_concurrency,
+    max_pending=settings.title_queue_max_pending,
+)
 
 async def get_conversation(
-    conversation_id: int, session: DBSessionDep
-) -> Conversation:
-    conversation = await ConversationService(session).get(conversation_id)
+    conversation_id: int, session: ShardSessionDep
+) -> ConversationOut:
+    conversation = await ConversationService(session).lookup(conversation_id)
     if not conversation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -23,85 +55,327 @@ async def get_conversation(
         )
     return conversation
 
-GetConversationDep = Annotated[Conversation, Depends(get_conversation)]
+GetConversationDep = Annotated[ConversationOut, Depends(get_conversation)]
+
+idempotency = IdempotencyStore(
+    max_entries=settings.idempotency_max_entries,
+    max_bytes=settings.idempotency_max_bytes,
+    ttl_seconds=settings.idempotency_ttl_seconds,
+)
+
+def idempotent_flight(
+    http_request: Request, endpoint: str, request: LLMTextRequest
+) -> Tuple[Optional[str], Optional[str], Optional[Flight]]:
+    """The request's Idempotency-Key, its fingerprint and the flight it joins, if any"""
+    key = http_request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return None, None, None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters",
+        )
+    fingerprint = request_fingerprint(endpoint, request.model_dump())
+    try:
+        return key, fingerprint, idempotency.lookup(key, fingerprint)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+def overloaded(error: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+# Partial responses left behind by a client disconnect are persisted from a
+# detached task, since the request's own task is being cancelled.
+_background_tasks: Set[asyncio.Task] = set()
+
+STATUS_PARTIAL_CONTENT = 206
+STATUS_BAD_GATEWAY = 502
+STATUS_CLIENT_CLOSED_REQUEST = 499
+
+def build_message(
+    prompt_content: str,
+    response_content: str,
+    conversation_id: int,
+    is_success: bool = True,
+    status_code: int = 200,
+) -> Message:
+    prompt_tokens = count_tokens(prompt_content)
+    response_tokens = count_tokens(response_content)
+    return Message(
+        conversation_id=conversation_id,
+        prompt_content=prompt_content,
+        response_content=response_content,
+        prompt_tokens=prompt_tokens,
+        response_tokens=response_tokens,
+        total_tokens=prompt_tokens + response_tokens,
+        is_success=is_success,
+        status_code=status_code
+    )
 
 async def store_message(
     prompt_content: str,
     response_content: str,
     conversation_id: int,
-    session: AsyncSession,
+    session: Optional[AsyncSession] = None,
+    is_success: bool = True,
+    status_code: int = 200,
 ) -> None:
-    """Store message in the database"""
+    """Store message in the database, opening a short-lived session if none is given"""
     try:
-        message = Message(
-            conversation_id=conversation_id,
-            prompt_content=prompt_content,
-            response_content=response_content,
-            prompt_tokens=len(prompt_content.split()),  # Simple token estimation
-            response_tokens=len(response_content.split()),
-            total_tokens=len(prompt_content.split()) + len(response_content.split()),
-            is_success=True,
-            status_code=200
+        message = build_message(
+            prompt_content, response_content, conversation_id, is_success, status_code
         )
-        await MessageRepository(session).create(message)
+        if settings.message_write_behind:
+            await message_buffer.submit(message)
+        elif session is not None:
+            await MessageRepository(session).create(message)
+        else:
+            async with shards.session(conversation_id) as session:
+                await MessageRepository(session).create(message)
+        if is_success:
+            llm_service.remember_turn(conversation_id, prompt_content, response_content)
     except Exception as e:
         print(f"Error storing message: {e}")
 
+class StreamCheckpointer:
+    """Periodically persists the partial response of a stream.
+
+    The first checkpoint inserts the message as a partial (206) row, later ones
+    update it in place and `finish` marks it complete. Each write uses its own
+    short-lived session, so no connection is held between checkpoints.
+    """
+
+    def __init__(self, prompt: str, conversation_id: int, interval: float) -> None:
+        self.prompt = prompt
+        self.conversation_id = conversation_id
+        self.interval = interval
+        self.message_id: Optional[int] = None
+        self._last_saved = time.monotonic()
+
+    async def maybe_save(self, chunks: List[str]) -> None:
+        if time.monotonic() - self._last_saved >= self.interval:
+            await self.save(chunks, is_success=False, status_code=STATUS_PARTIAL_CONTENT)
+
+    async def save(self, chunks: List[str], is_success: bool, status_code: int) -> None:
+        self._last_saved = time.monotonic()
+        message = build_message(
+            self.prompt, "".join(chunks), self.conversation_id, is_success, status_code
+        )
+        try:
+            async with shards.session(self.conversation_id) as session:
+                repository = MessageRepository(session)
+                if self.message_id is None:
+                    self.message_id = (await repository.create(message)).id
+                else:
+                    await repository.update(self.message_id, message)
+            if is_success:
+                llm_service.remember_turn(self.conversation_id, self.prompt, message.response_content)
+        except Exception as e:
+            print(f"Error checkpointing message: {e}")
+
 @router.post("/conversations", response_model=LLMConversationResponse)
 async def create_conversation_with_llm(
     request: LLMConversationRequest,
-    session: DBSessionDep,
 ) -> LLMConversationResponse:
-    """Create a new conversation with AI-generated title"""
-    conversation = await llm_service.create_conversation_with_title(request.prompt, session)
+    """Create a new conversation; its AI-generated title is filled in by a background worker"""
+    async with shards.new_conversation() as (conversation_id, session):
+        conversation = await llm_service.create_conversation_with_placeholder_title(
+            session, conversation_id
+        )
+    await title_worker.submit(conversation.id, request.prompt)
     return LLMConversationResponse(
         conversation_id=conversation.id,
         title=conversation.title,
-        message="Conversation created successfully"
+        message="Conversation created successfully",
+        title_pending=conversation.title_pending,
     )
 
-async def stream_generator(prompt: str, conversation_id: int, session: AsyncSession):
-    """Generator for streaming response"""
-    response_content = ""
-    
-    async for chunk in llm_service.stream_response(prompt, conversation_id):
-        response_content += chunk
-        yield chunk
-    
-    # Store message after streaming is complete
-    await store_message(prompt, response_content, conversation_id, session)
+@router.get("/conversations/{conversation_id}/title", response_model=ConversationTitleOut)
+async def get_conversation_title_controller(
+    conversation_id: int,
+    wait: float = Query(0, ge=0, le=30, description="Seconds to wait for a pending title"),
+) -> ConversationTitleOut:
+    """Poll for a conversation's generated title, optionally long-polling until it is ready"""
+    if wait:
+        await title_worker.wait_for_title(conversation_id, wait)
+    async with shards.session(conversation_id) as session:
+        # Read the row itself: the lookup cache may still hold the placeholder title
+        conversation = await ConversationService(session).get(conversation_id)
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found",
+        )
+    return ConversationTitleOut(
+        conversation_id=conversation.id,
+        title=conversation.title,
+        title_pending=conversation.title_pending,
+    )
+
+async def stream_generator(
+    prompt: str, conversation_id: int, use_cache: bool = True, model_type: Optional[str] = None
+):
+    """Generator for streaming response; holds no database connection while streaming"""
+    chunks: List[str] = []
+    interval = settings.stream_checkpoint_interval_ms / 1000
+    checkpointer = StreamCheckpointer(prompt, conversation_id, interval) if interval > 0 else None
+    completed = False
+    failed = False
+    try:
+        async for chunk in llm_service.stream_response(
+            prompt, conversation_id, use_cache, model_type
+        ):
+            if isinstance(chunk, ErrorChunk):
+                failed = True
+            else:
+                chunks.append(chunk)
+            yield chunk
+            if checkpointer:
+                await checkpointer.maybe_save(chunks)
+        completed = not failed
+    except Overloaded as e:
+        # Admitted by the pre-check but rejected once queued; nothing to store
+        yield ErrorChunk(str(e), e.status_code, e.retry_after)
+    finally:
+        # Store message after streaming is complete, or what was generated so far
+        # if the upstream failed or the client went away mid-stream.
+        if completed:
+            status_code = 200
+        elif failed:
+            status_code = STATUS_BAD_GATEWAY
+        else:
+            status_code = STATUS_CLIENT_CLOSED_REQUEST
+        if checkpointer:
+            persist = checkpointer.save(chunks, completed, status_code)
+        else:
+            persist = store_message(
+                prompt, "".join(chunks), conversation_id,
+                is_success=completed, status_code=status_code,
+            )
+        if completed or failed:
+            await persist
+        elif chunks or (checkpointer and checkpointer.message_id is not None):
+            task = asyncio.create_task(persist)
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        else:
+            persist.close()
 
 @router.post("/text/generate/stream")
 async def stream_llm_controller(
     request: LLMTextRequest,
-    session: DBSessionDep,
+    http_request: Request,
 ) -> StreamingResponse:
-    """Stream LLM response and store message in background"""
-    # Verify conversation exists
-    conversation = await get_conversation(request.conversation_id, session)
+    """Stream LLM response and store message once the stream ends.
+
+    Deltas are coalesced into fewer, larger writes. With `Accept: text/event-stream`
+    each write is framed as a server-sent event, and with STREAM_GZIP_ENABLED the
+    body is gzip-compressed for clients that accept it.
+    """
+    # Verify conversation exists without keeping the connection for the stream
+    async with shards.session(request.conversation_id) as session:
+        conversation = await get_conversation(request.conversation_id, session)
+    key, fingerprint, flight = idempotent_flight(http_request, "stream", request)
+    if flight is None:
+        # Reject before the response starts, while a 429/503 status can still be sent
+        try:
+            llm_service.check_admission(request.prompt)
+        except Overloaded as e:
+            raise overloaded(e)
     
+    headers = {}
+    if flight is not None:
+        headers[REPLAYED_HEADER] = "true"
+        chunks = flight.follow()
+    else:
+        chunks = stream_generator(
+            request.prompt, request.conversation_id, request.use_cache, conversation.model_type
+        )
+        if key is not None:
+            chunks = idempotency.start(key, fingerprint, chunks).follow()
+    if settings.stream_coalesce_max_bytes > 0:
+        chunks = coalesce(
+            chunks,
+            settings.stream_coalesce_max_bytes,
+            settings.stream_coalesce_max_delay_ms / 1000,
+        )
+    else:
+        chunks = passthrough(chunks)
+
+    sse = SSE_MEDIA_TYPE in http_request.headers.get("accept", "")
+    gzip = settings.stream_gzip_enabled and "gzip" in http_request.headers.get("accept-encoding", "")
+    if sse:
+        # Tell proxies not to buffer the event stream
+        headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        media_type = SSE_MEDIA_TYPE
+    else:
+        headers["Content-Type"] = "text/plain; charset=utf-8"
+        media_type = "text/plain"
+    if gzip:
+        headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
     return StreamingResponse(
-        stream_generator(request.prompt, request.conversation_id, session),
-        media_type="text/plain",
-        headers={"Content-Type": "text/plain; charset=utf-8"}
+        encode(chunks, sse=sse, gzip_level=settings.stream_gzip_level if gzip else None),
+        media_type=media_type,
+        headers=headers,
     )
 
+async def generate_chunks(
+    request: LLMTextRequest, model_type: Optional[str]
+) -> AsyncIterator[str]:
+    """Generate a response chunk by chunk and store the message once it is complete"""
+    chunks: List[str] = []
+    failed = False
+    async for chunk in llm_service.stream_response(
+        request.prompt, request.conversation_id, request.use_cache, model_type
+    ):
+        if isinstance(chunk, ErrorChunk):
+            failed = True
+        else:
+            chunks.append(chunk)
+        yield chunk
+    if failed:
+        await store_message(
+            request.prompt, "".join(chunks), request.conversation_id,
+            is_success=False, status_code=STATUS_BAD_GATEWAY,
+        )
+    else:
+        await store_message(request.prompt, "".join(chunks), request.conversation_id)
+
 @router.post("/text/generate", response_model=LLMTextResponse)
 async def generate_text_controller(
     request: LLMTextRequest,
-    session: DBSessionDep,
+    http_request: Request,
+    http_response: Response,
 ) -> LLMTextResponse:
-    """Generate text response and store message"""
-    conversation = await get_conversation(request.conversation_id, session)
-    
-    response_content = ""
-    async for chunk in llm_service.stream_response(request.prompt, request.conversation_id):
-        response_content += chunk
+    """Generate text response and store message.
+
+    Retries sending the same Idempotency-Key get the original result, joining
+    the generation if it is still running, instead of calling the model again.
+    """
+    async with shards.session(request.conversation_id) as session:
+        conversation = await get_conversation(request.conversation_id, session)
+    key, fingerprint, flight = idempotent_flight(http_request, "generate", request)
+    if flight is not None:
+        http_response.headers[REPLAYED_HEADER] = "true"
+    elif key is not None:
+        flight = idempotency.start(
+            key, fingerprint, generate_chunks(request, conversation.model_type)
+        )
+    chunks = flight.follow() if flight is not None else generate_chunks(
+        request, conversation.model_type
+    )
     
-    await store_message(request.prompt, response_content, conversation.id, session)
+    try:
+        response_content = "".join([chunk async for chunk in chunks])
+    except Overloaded as e:
+        raise overloaded(e)
     
     return LLMTextResponse(
         response=response_content,
         conversation_id=request.conversation_id,
         prompt=request.prompt
-    ) 
\ No newline at end of file
+    )
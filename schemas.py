@@ -1,7 +1,7 @@
 
-from datetime import datetime
-from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from datetime import date, datetime
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from typing import List, Literal, Optional
 
 class ConversationBase(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -18,6 +18,7 @@ class ConversationOut(ConversationBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    title_pending: bool = False
 
 class MessageOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -34,19 +35,120 @@ class MessageOut(BaseModel):
     created_at: datetime
     updated_at: datetime
 
+class SearchHitOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    conversation_id: int
+    conversation_title: str
+    # None when the conversation title matched rather than one of its messages
+    message_id: Optional[int]
+    rank: float
+    # Matching text with the terms wrapped in <mark></mark>; not HTML-escaped
+    snippet: str
+    created_at: datetime
+
+class UsageTotalsOut(BaseModel):
+    message_count: int = 0
+    failed_count: int = 0
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    total_tokens: int = 0
+
+class UsageDayOut(UsageTotalsOut):
+    model_config = ConfigDict(from_attributes=True)
+    
+    day: date
+    model_type: str
+
+class UsageReportOut(BaseModel):
+    start: date
+    end: date
+    totals: UsageTotalsOut
+    days: List[UsageDayOut]
+
+class ConversationUsageOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    conversation_id: int = Field(validation_alias="id")
+    model_type: str
+    message_count: int
+    failed_message_count: int
+    prompt_tokens_total: int
+    response_tokens_total: int
+    total_tokens: int
+    last_message_at: Optional[datetime]
+
+# Validate whole result sets in one call on the list endpoints' fast path
+ConversationListAdapter = TypeAdapter(List[ConversationOut])
+MessageListAdapter = TypeAdapter(List[MessageOut])
+SearchHitListAdapter = TypeAdapter(List[SearchHitOut])
+
 class LLMConversationRequest(BaseModel):
     prompt: str
 
 class LLMTextRequest(BaseModel):
     prompt: str
     conversation_id: int
+    use_cache: bool = True  # False forces a fresh completion
+
+class ChatClientFrame(BaseModel):
+    """A frame sent by the client on the chat WebSocket."""
+    type: Literal["join", "leave", "prompt", "cancel"]
+    conversation_id: int
+    prompt: Optional[str] = None
+    use_cache: bool = True
 
 class LLMConversationResponse(BaseModel):
     conversation_id: int
     title: str
     message: str
+    title_pending: bool = False
+
+class ConversationTitleOut(BaseModel):
+    conversation_id: int
+    title: str
+    title_pending: bool
 
 class LLMTextResponse(BaseModel):
     response: str
     conversation_id: int
-    prompt: str
\ No newline at end of file
+    prompt: str
+
+class MessageImportRow(BaseModel):
+    conversation_id: int
+    prompt_content: str
+    response_content: str
+    prompt_tokens: Optional[int] = None
+    response_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+    is_success: bool = True
+    status_code: int = 200
+    created_at: Optional[datetime] = None
+
+class ImportBatchResult(BaseModel):
+    batch: int
+    rows: int
+    inserted: int
+    error: Optional[str] = None
+
+class ImportReport(BaseModel):
+    total_rows: int
+    inserted_rows: int
+    failed_rows: int
+    seconds: float
+    rows_per_second: float
+    batches: List[ImportBatchResult]
+
+class PurgeProgress(BaseModel):
+    """One line of a purge's NDJSON progress stream; the last has `done` set."""
+    batch: int
+    deleted: int
+    total_deleted: int
+    seconds: float
+    rows_per_second: float
+    done: bool = False
+
+class BulkConversationsOut(BaseModel):
+    ids: List[int]
+    seconds: float
+    rows_per_second: float
@@ -0,0 +1,264 @@
+import asyncio
+import heapq
+import math
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from itertools import count
+from typing import AsyncIterator, Dict, List, Optional
+
+from metrics import registry
+
+queue_depth = registry.gauge("llm_admission_queue_depth", "LLM calls waiting for admission, by priority")
+in_flight_calls = registry.gauge("llm_in_flight", "LLM calls currently running upstream")
+concurrency_limit = registry.gauge("llm_concurrency_limit", "Current adaptive LLM concurrency limit")
+admission_wait = registry.histogram(
+    "llm_admission_wait_seconds", "Time LLM calls spent queued for admission, by priority"
+)
+rejections = registry.counter("llm_admission_rejected_total", "LLM calls rejected, by reason")
+
+
+class Priority(IntEnum):
+    """Lower values are admitted first."""
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing an interactive call that could not start in time."""
+
+    def __init__(self, status_code: int, retry_after: int, reason: str) -> None:
+        super().__init__(f"LLM capacity exceeded ({reason}), retry after {retry_after}s")
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """Continuously refilled budget of `per_minute` units; 0 means unlimited."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.rate = per_minute / 60
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        # May go negative: a request larger than the bucket borrows from the future.
+        if self.rate > 0:
+            self._refill()
+            self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        if self.rate > 0:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AIMDLimit:
+    """Additive-increase/multiplicative-decrease concurrency limit.
+
+    Every call that finishes under `latency_target` raises the limit by about
+    one per limit's worth of calls; a slow call or an upstream 429 cuts it by
+    `backoff`, at most once per `cooldown` seconds so one burst counts once.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        latency_target: float,
+        backoff: float = 0.5,
+        cooldown: float = 1.0,
+    ) -> None:
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self._last_decrease = 0.0
+
+    @property
+    def slots(self) -> int:
+        return max(1, int(self.limit))
+
+    def succeeded(self, latency: float) -> None:
+        if latency > self.latency_target:
+            self.throttled()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def throttled(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self._last_decrease = now
+
+
+class Slot:
+    """One admitted call; the caller reports its latency and outcome through it."""
+
+    def __init__(self, tokens: int) -> None:
+        self.tokens = tokens
+        self.started = time.monotonic()
+        self.latency: Optional[float] = None
+        self.throttled = False
+        self.used_tokens: Optional[int] = None
+
+    def first_token(self) -> None:
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "future")
+
+    def __init__(self, priority: Priority, seq: int, tokens: int, future: asyncio.Future) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """Admission control in front of the upstream LLM API.
+
+    Calls are admitted in priority order while fewer than the adaptive limit
+    are running and the requests/min and tokens/min buckets allow it. An
+    interactive call is rejected up front with 503 when `max_queue` interactive
+    calls are already waiting, or with 429 when the rate budgets could not
+    admit it within `max_wait` seconds. Background calls are never rejected;
+    their producers bound their own concurrency.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        limit: AIMDLimit,
+        max_queue: int = 100,
+        max_wait: float = 10.0,
+    ) -> None:
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters: List[_Waiter] = []
+        self._queued: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._queued_tokens = 0
+        self._seq = count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._service_time = 1.0
+        concurrency_limit.set(self.limit.slots)
+
+    def check(self, priority: Priority, tokens: int) -> None:
+        """Raise `Overloaded` if a call with this priority would be rejected right now."""
+        if priority != Priority.INTERACTIVE:
+            return
+        if self._queued[Priority.INTERACTIVE] >= self.max_queue:
+            rejections.inc(reason="queue_full")
+            waiting = self._queued[Priority.INTERACTIVE] + self.in_flight
+            retry_after = math.ceil(waiting / self.limit.slots * self._service_time)
+            raise Overloaded(503, max(1, retry_after), "queue full")
+        delay = max(
+            self.requests.delay(sum(self._queued.values()) + 1),
+            self.tokens.delay(min(self._queued_tokens + tokens, self.tokens.capacity)),
+        )
+        if delay > self.max_wait:
+            rejections.inc(reason="rate_limit")
+            raise Overloaded(429, math.ceil(delay), "rate limit")
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, tokens: int) -> AsyncIterator[Slot]:
+        """Wait for admission and hold a concurrency slot for the body of the block."""
+        self.check(priority, tokens)
+        waiter = _Waiter(priority, next(self._seq), tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, waiter)
+        self._enqueued(waiter, 1)
+        self._dispatch()
+
+        queued_at = time.monotonic()
+        timeout = self.max_wait if priority == Priority.INTERACTIVE else None
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except BaseException as e:
+            if waiter.future.done():
+                # Admitted just as the wait ended; give the slot back.
+                self._release(None)
+            else:
+                waiter.future.cancel()
+                self._enqueued(waiter, -1)
+            if isinstance(e, asyncio.TimeoutError):
+                rejections.inc(reason="queue_timeout")
+                raise Overloaded(503, max(1, math.ceil(self._service_time)), "queue timeout") from None
+            raise
+        admission_wait.observe(time.monotonic() - queued_at, priority=priority.name.lower())
+
+        slot = Slot(tokens)
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    def _enqueued(self, waiter: _Waiter, sign: int) -> None:
+        self._queued[waiter.priority] += sign
+        self._queued_tokens += sign * waiter.tokens
+        queue_depth.set(self._queued[waiter.priority], priority=waiter.priority.name.lower())
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters and self.in_flight < self.limit.slots:
+            waiter = self._waiters[0]
+            if waiter.future.done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = max(
+                self.requests.delay(1),
+                self.tokens.delay(min(waiter.tokens, self.tokens.capacity)),
+            )
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                break
+            heapq.heappop(self._waiters)
+            self._enqueued(waiter, -1)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            waiter.future.set_result(None)
+        in_flight_calls.set(self.in_flight)
+
+    def _release(self, slot: Optional[Slot]) -> None:
+        self.in_flight -= 1
+        if slot is not None:
+            duration = time.monotonic() - slot.started
+            self._service_time = 0.9 * self._service_time + 0.1 * duration
+            if slot.throttled:
+                self.limit.throttled()
+            elif slot.latency is not None:
+                self.limit.succeeded(slot.latency)
+            if slot.used_tokens is not None and slot.used_tokens < slot.tokens:
+                self.tokens.refund(slot.tokens - slot.used_tokens)
+            concurrency_limit.set(self.limit.slots)
+        self._dispatch()
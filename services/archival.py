@@ -0,0 +1,203 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import column, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import ensure_message_partitions, messages_partitioned, settings
+from metrics import registry
+from models import MESSAGE_PARTITION_PATTERN, Message, message_partition_bounds
+from repositories.archive import ArchiveRepository, ArchiveWriter
+from sharding import shards
+
+archived_partitions = registry.counter(
+    "message_archive_partitions_total", "Message partitions moved to the cold tier"
+)
+archived_rows = registry.counter(
+    "message_archive_rows_total", "Messages moved to the cold tier"
+)
+archive_seconds = registry.histogram(
+    "message_archive_seconds", "Time to export, record and drop one message partition"
+)
+
+# Key of the PostgreSQL advisory lock that lets one worker at a time archive
+ARCHIVE_LOCK_KEY = 0x61726368
+
+# Monthly partitions, attached or left detached by an interrupted run
+_PARTITIONS = """
+SELECT c.relname, i.inhrelid IS NOT NULL AS attached
+FROM pg_class c
+LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = to_regclass('messages')
+WHERE c.relkind = 'r' AND c.relname ~ '^messages_y[0-9]{4}m[0-9]{2}$'
+  AND pg_table_is_visible(c.oid)
+"""
+
+
+def archive_cutoff(after_months: int, today: Optional[date] = None) -> date:
+    """Partitions ending on or before this day are old enough to archive."""
+    month = (today or date.today()).replace(day=1)
+    index = month.year * 12 + month.month - 1 - after_months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class MessageArchiver:
+    """Moves old monthly `messages` partitions to the cold tier.
+
+    Each run creates the upcoming partitions. Unless `after_months` is 0, every
+    partition older than that many whole months is then detached, so no new
+    writes land in it, and its rows are streamed into a compressed archive file;
+    the file and its per-conversation segments are recorded and the table is
+    dropped in one transaction. A run interrupted after the detach picks the
+    detached table up again next time. Every worker runs an archiver, so a run
+    is skipped while another worker holds the database's archive lock.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        archive_dir: str,
+        after_months: int,
+        months_ahead: int = 3,
+        interval: float = 3600.0,
+        fetch_size: int = 1000,
+    ) -> None:
+        self.session_factory = session_factory
+        self.archive_dir = archive_dir
+        self.after_months = after_months
+        self.months_ahead = months_ahead
+        self.interval = interval
+        self.fetch_size = fetch_size
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the background task; an archive in progress is resumed on the next start."""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Error archiving message partitions: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, today: Optional[date] = None) -> List[str]:
+        """Create upcoming partitions and archive the old ones; returns the archived names."""
+        async with self.session_factory() as session:
+            if session.get_bind().dialect.name != "postgresql":
+                return []
+            # A session-level lock, held by this connection across the run's own
+            # transactions; autocommit, so it does not sit idle in a transaction.
+            connection = await session.connection(
+                execution_options={"isolation_level": "AUTOCOMMIT"}
+            )
+            lock = {"key": ARCHIVE_LOCK_KEY}
+            result = await connection.execute(text("SELECT pg_try_advisory_lock(:key)"), lock)
+            if not result.scalar():
+                return []
+            try:
+                return await self._run_locked(today)
+            finally:
+                await connection.execute(text("SELECT pg_advisory_unlock(:key)"), lock)
+
+    async def _run_locked(self, today: Optional[date]) -> List[str]:
+        async with self.session_factory() as session:
+            connection = await session.connection()
+            if not await connection.run_sync(messages_partitioned):
+                return []
+            await connection.run_sync(ensure_message_partitions, self.months_ahead, today)
+            result = await session.execute(text(_PARTITIONS))
+            partitions = [(name, attached) for name, attached in result.all()]
+            await session.commit()
+        if self.after_months <= 0:
+            return []
+
+        cutoff = archive_cutoff(self.after_months, today)
+        archived = []
+        for name, attached in sorted(partitions):
+            start, end = self._bounds(name)
+            if end <= cutoff:
+                await self.archive(name, attached, start, end)
+                archived.append(name)
+        return archived
+
+    async def archive(self, name: str, attached: bool, start: date, end: date) -> None:
+        started = time.perf_counter()
+        if attached:
+            async with self.session_factory() as session:
+                await session.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+                await session.commit()
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.abspath(os.path.join(self.archive_dir, f"{name}.ndjson.gz"))
+        writer = await self._export(name, path)
+
+        async with self.session_factory() as session:
+            await ArchiveRepository(session).record(
+                name, datetime.combine(start, datetime.min.time()),
+                datetime.combine(end, datetime.min.time()), path, writer,
+            )
+            await session.execute(text(f"DROP TABLE {name}"))
+            await session.commit()
+        archived_partitions.inc()
+        archived_rows.inc(writer.message_count)
+        archive_seconds.observe(time.perf_counter() - started)
+        print(f"Archived {writer.message_count} messages from {name} to {path}")
+
+    async def _export(self, name: str, path: str) -> ArchiveWriter:
+        """Stream a partition's rows, grouped by conversation, into an archive file."""
+        partition = table(name, *[column(c.key, c.type) for c in Message.__table__.columns])
+        statement = select(partition).order_by(
+            partition.c.conversation_id, partition.c.created_at, partition.c.id
+        )
+        writer = ArchiveWriter(path)
+        try:
+            async with self.session_factory() as session:
+                result = await session.stream(statement.execution_options(yield_per=self.fetch_size))
+                async for rows in result.partitions():
+                    await asyncio.to_thread(writer.write, [dict(row._mapping) for row in rows])
+            await asyncio.to_thread(writer.close)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer
+
+    @staticmethod
+    def _bounds(name: str) -> Tuple[date, date]:
+        year, month = MESSAGE_PARTITION_PATTERN.match(name).groups()
+        return message_partition_bounds(date(int(year), int(month), 1))
+
+
+# One archiver per shard, each with its own archive directory
+message_archivers = [
+    MessageArchiver(
+        session_factory,
+        os.path.join(settings.message_archive_dir, f"shard{index}")
+        if shards.enabled
+        else settings.message_archive_dir,
+        settings.message_archive_after_months,
+        months_ahead=settings.message_partitions_ahead,
+        interval=settings.message_archive_interval_seconds,
+        fetch_size=settings.export_fetch_size,
+    )
+    for index, session_factory in enumerate(shards.session_factories)
+]
@@ -0,0 +1,31 @@
+import asyncio
+from typing import Any, List, Tuple
+
+
+async def next_batch(
+    queue: asyncio.Queue, batch_size: int, window: float, stop: object
+) -> Tuple[List[Any], bool]:
+    """Collect up to `batch_size` items from `queue`.
+
+    Waits for the first item, then keeps collecting until the batch is full or
+    `window` seconds have passed. Returns the batch and whether the `stop`
+    sentinel was seen, in which case no more items should be read.
+    """
+    loop = asyncio.get_running_loop()
+    item = await queue.get()
+    if item is stop:
+        return [], True
+    batch = [item]
+    deadline = loop.time() + window
+    while len(batch) < batch_size:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            item = await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            break
+        if item is stop:
+            return batch, True
+        batch.append(item)
+    return batch, False
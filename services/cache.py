@@ -0,0 +1,86 @@
+import hashlib
+import json
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import registry
+
+cache_hits = registry.counter("llm_cache_hits_total", "LLM responses served from the response cache")
+cache_misses = registry.counter("llm_cache_misses_total", "LLM response cache lookups that missed")
+cache_evictions = registry.counter(
+    "llm_cache_evictions_total", "Entries evicted from the LLM response cache"
+)
+cache_bytes = registry.gauge("llm_cache_bytes", "Approximate size of the LLM response cache")
+cache_entries = registry.gauge("llm_cache_entries", "Entries in the LLM response cache")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt so trivially different spellings share a cache entry."""
+    return " ".join(unicodedata.normalize("NFKC", prompt).split())
+
+
+def response_cache_key(
+    model: str, system_prompt: str, prompt: str, history: Sequence[Dict[str, str]] = ()
+) -> str:
+    """Key a completion on everything the model sees: model, system prompt, prior turns and prompt."""
+    turns: List[List[str]] = [[m["role"], m["content"]] for m in history]
+    payload = json.dumps([model, system_prompt, turns, normalize_prompt(prompt)])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: str) -> None:
+        pass
+
+
+class InMemoryLRUCache(ResponseCache):
+    """Process-local LRU cache bounded by total size in bytes, with a per-entry TTL."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            cache_misses.inc()
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            cache_misses.inc()
+            return None
+        self._entries.move_to_end(key)
+        cache_hits.inc()
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        size = len(key) + len(value.encode())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            cache_evictions.inc()
+        cache_bytes.set(self.size)
+        cache_entries.set(len(self._entries))
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+        cache_bytes.set(self.size)
+        cache_entries.set(len(self._entries))
@@ -0,0 +1,142 @@
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional
+from weakref import WeakSet
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metrics import registry
+from repositories.messages import MessageRepository
+from services.tokens import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+context_hits = registry.counter(
+    "llm_context_cache_hits_total", "Context assemblies served from the conversation history cache"
+)
+context_misses = registry.counter(
+    "llm_context_cache_misses_total", "Context assemblies that loaded history from the database"
+)
+context_tokens = registry.histogram(
+    "llm_context_tokens",
+    "Tokens in the assembled prompt context",
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+context_turns = registry.histogram(
+    "llm_context_turns",
+    "Previous turns included in the assembled prompt context",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class Turn(NamedTuple):
+    prompt: str
+    response: str
+    tokens: int
+
+
+# Every context cache in the process, so a delete can drop a conversation from all of them
+_caches: "WeakSet[ConversationContextCache]" = WeakSet()
+
+
+def invalidate_context(conversation_id: Optional[int] = None) -> None:
+    """Forget cached history after a conversation or its messages were deleted or changed."""
+    for cache in list(_caches):
+        cache.invalidate(conversation_id)
+
+
+class ConversationContextCache:
+    """Assembles multi-turn chat context within a token budget.
+
+    Keeps the most recent turns of up to `max_conversations` conversations in an
+    LRU, so a turn only reads history from the database the first time its
+    conversation is seen. `append` keeps the cache current as messages are stored.
+    `session_factory` opens a session on a conversation's database.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[int], AsyncSession],
+        token_budget: int = 3000,
+        max_turns: int = 20,
+        max_conversations: int = 10000,
+        model: str = "gpt-3.5-turbo",
+    ) -> None:
+        self.session_factory = session_factory
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.max_conversations = max_conversations
+        self.model = model
+        self._turns: "OrderedDict[int, Deque[Turn]]" = OrderedDict()
+        _caches.add(self)
+
+    def turn_tokens(self, prompt: str, response: str) -> int:
+        return (
+            count_tokens(prompt, self.model)
+            + count_tokens(response, self.model)
+            + 2 * MESSAGE_OVERHEAD_TOKENS
+        )
+
+    async def history(self, conversation_id: int) -> Deque[Turn]:
+        turns = self._turns.get(conversation_id)
+        if turns is not None:
+            self._turns.move_to_end(conversation_id)
+            context_hits.inc()
+            return turns
+        context_misses.inc()
+        async with self.session_factory(conversation_id) as session:
+            messages = await MessageRepository(session).list_recent_by_conversation(
+                conversation_id, self.max_turns
+            )
+        turns = deque(
+            (
+                Turn(m.prompt_content, m.response_content, self.turn_tokens(m.prompt_content, m.response_content))
+                for m in messages
+            ),
+            maxlen=self.max_turns,
+        )
+        self._store(conversation_id, turns)
+        return turns
+
+    async def build(
+        self, conversation_id: int, system_prompt: str, prompt: str
+    ) -> List[Dict[str, str]]:
+        """Return chat messages for `prompt`, preceded by as much recent history as fits the budget."""
+        budget = (
+            self.token_budget
+            - count_tokens(system_prompt, self.model)
+            - count_tokens(prompt, self.model)
+            - 2 * MESSAGE_OVERHEAD_TOKENS
+        )
+        used = self.token_budget - budget
+        selected: List[Turn] = []
+        for turn in reversed(await self.history(conversation_id)):
+            if turn.tokens > budget:
+                break
+            budget -= turn.tokens
+            used += turn.tokens
+            selected.append(turn)
+        context_tokens.observe(used)
+        context_turns.observe(len(selected))
+
+        messages = [{"role": "system", "content": system_prompt}]
+        for turn in reversed(selected):
+            messages.append({"role": "user", "content": turn.prompt})
+            messages.append({"role": "assistant", "content": turn.response})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def append(self, conversation_id: int, prompt: str, response: str) -> None:
+        """Record a completed turn for a conversation whose history is cached."""
+        turns = self._turns.get(conversation_id)
+        if turns is not None:
+            turns.append(Turn(prompt, response, self.turn_tokens(prompt, response)))
+
+    def invalidate(self, conversation_id: Optional[int] = None) -> None:
+        if conversation_id is None:
+            self._turns.clear()
+        else:
+            self._turns.pop(conversation_id, None)
+
+    def _store(self, conversation_id: int, turns: Deque[Turn]) -> None:
+        self._turns[conversation_id] = turns
+        self._turns.move_to_end(conversation_id)
+        while len(self._turns) > self.max_conversations:
+            self._turns.popitem(last=False)
@@ -0,0 +1,112 @@
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import settings
+from metrics import registry
+from models import Conversation
+from repositories.conversations import ConversationRepository
+from schemas import ConversationOut
+
+lookups = registry.counter(
+    "conversation_lookups_total", "Conversation lookups by where they were answered from"
+)
+queries_saved = registry.counter(
+    "conversation_lookup_queries_saved_total", "SELECTs avoided by the conversation lookup caches"
+)
+
+# Per-request identity cache, installed by RequestScopeMiddleware
+_request_cache: ContextVar[Optional[Dict[int, ConversationOut]]] = ContextVar(
+    "conversation_request_cache", default=None
+)
+
+
+class RequestScopeMiddleware:
+    """Gives every HTTP/WebSocket request its own conversation identity cache."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        token = _request_cache.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_cache.reset(token)
+
+
+class ConversationLookup:
+    """Conversation metadata lookups that skip the database when they can.
+
+    Lookups are deduplicated within a request and served from a process-wide
+    LRU of `ConversationOut` snapshots. Entries expire after `ttl_seconds` and
+    are invalidated explicitly when a conversation is updated or deleted in this
+    process; the TTL bounds staleness for changes made by other processes.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[ConversationOut, float]]" = OrderedDict()
+
+    async def get(
+        self, conversation_id: int, session: AsyncSession
+    ) -> Optional[ConversationOut]:
+        request_cache = _request_cache.get()
+        if request_cache is not None and conversation_id in request_cache:
+            lookups.inc(source="request")
+            queries_saved.inc()
+            return request_cache[conversation_id]
+
+        snapshot = self._get_cached(conversation_id)
+        if snapshot is not None:
+            lookups.inc(source="process")
+            queries_saved.inc()
+        else:
+            lookups.inc(source="database")
+            conversation = await ConversationRepository(session).get(conversation_id)
+            if conversation is None:
+                return None
+            snapshot = self.put(conversation)
+
+        if request_cache is not None:
+            request_cache[conversation_id] = snapshot
+        return snapshot
+
+    def put(self, conversation: Conversation) -> ConversationOut:
+        snapshot = ConversationOut.model_validate(conversation)
+        if self.max_entries > 0:
+            self._entries[conversation.id] = (snapshot, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(conversation.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, conversation_id: int) -> None:
+        self._entries.pop(conversation_id, None)
+        request_cache = _request_cache.get()
+        if request_cache is not None:
+            request_cache.pop(conversation_id, None)
+
+    def _get_cached(self, conversation_id: int) -> Optional[ConversationOut]:
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        snapshot, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[conversation_id]
+            return None
+        self._entries.move_to_end(conversation_id)
+        return snapshot
+
+
+conversation_lookup = ConversationLookup(
+    max_entries=settings.conversation_cache_size,
+    ttl_seconds=settings.conversation_cache_ttl_seconds,
+)
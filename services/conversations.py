@@ -1,12 +1,121 @@
-from models import Message
+from models import Conversation, Message
 from repositories.conversations import ConversationRepository
-from sqlalchemy import select
-from typing import List
+from repositories.messages import MessageRepository
+from repositories.pagination import encode_rank_cursor, next_cursor
+from repositories.search import SearchRepository
+from schemas import ConversationCreate, ConversationOut, ConversationUpdate
+from services.context import invalidate_context
+from services.conversation_lookup import conversation_lookup
+from sharding import merge_sorted, shards
+from sqlalchemy import Row
+from typing import List, Optional, Tuple, Union
 
 
 class ConversationService(ConversationRepository):
+    async def lookup(self, conversation_id: int) -> Optional[ConversationOut]:
+        """Conversation metadata, served from the lookup caches when possible."""
+        return await conversation_lookup.get(conversation_id, self.session)
+
+    async def create(self, conversation: Union[ConversationCreate, Conversation]) -> Conversation:
+        new_conversation = await super().create(conversation)
+        conversation_lookup.put(new_conversation)
+        return new_conversation
+
+    async def update(
+        self, conversation_id: int, updated_conversation: ConversationUpdate
+    ) -> Optional[Conversation]:
+        conversation_lookup.invalidate(conversation_id)
+        conversation = await super().update(conversation_id, updated_conversation)
+        if conversation:
+            conversation_lookup.put(conversation)
+            invalidate_context(conversation_id)
+        return conversation
+
+    async def delete(self, conversation_id: int) -> None:
+        conversation_lookup.invalidate(conversation_id)
+        await super().delete(conversation_id)
+        # The id may be reused (SQLite), and must not inherit the deleted history
+        invalidate_context(conversation_id)
+
     async def list_messages(self, conversation_id: int) -> List[Message]:
-        result = await self.session.execute(
-            select(Message).where(Message.conversation_id == conversation_id)
+        return await MessageRepository(self.session).list_by_conversation(conversation_id)
+
+    async def list_messages_page(
+        self, conversation_id: int, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Message], Optional[str]]:
+        return await MessageRepository(self.session).list_page_by_conversation(
+            conversation_id, limit, cursor
         )
-        return [m for m in result.scalars().all()]
+
+    async def list_messages_page_rows(
+        self, conversation_id: int, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Row], Optional[str]]:
+        return await MessageRepository(self.session).list_page_rows_by_conversation(
+            conversation_id, limit, cursor
+        )
+
+    async def search(
+        self, query: str, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Row], Optional[str]]:
+        return await SearchRepository(self.session).search(query, limit, cursor)
+
+
+async def create_conversation(conversation: Union[ConversationCreate, Conversation]) -> Conversation:
+    """Create a conversation on its shard."""
+    if isinstance(conversation, ConversationCreate):
+        conversation = Conversation(**conversation.model_dump())
+    async with shards.new_conversation() as (conversation_id, session):
+        if conversation_id is not None:
+            conversation.id = conversation_id
+        return await ConversationService(session).create(conversation)
+
+
+async def list_conversation_rows(skip: int, take: int) -> List[Row]:
+    """`list_rows` across shards; each shard returns its first `skip + take` rows."""
+    pages = await shards.fan_out(
+        "list_conversations",
+        lambda session: ConversationRepository(session).list_rows(0, skip + take),
+    )
+    rows = merge_sorted(pages, key=lambda row: (row.updated_at, row.id), reverse=True)
+    return rows[skip:skip + take]
+
+
+async def list_conversation_page_rows(
+    limit: int, cursor: Optional[str] = None
+) -> Tuple[List[Row], Optional[str]]:
+    """`list_page_rows` across shards: every shard's next `limit + 1` rows, merged.
+
+    (updated_at, id) orders conversations the same way on every shard, and ids
+    are unique across shards, so one cursor pages through all of them.
+    """
+    pages = await shards.fan_out(
+        "list_conversations",
+        lambda session: ConversationRepository(session).list_page_rows(limit + 1, cursor),
+    )
+    rows = merge_sorted(
+        [page for page, _ in pages], key=lambda row: (row.updated_at, row.id), reverse=True
+    )[:limit + 1]
+    return rows, next_cursor(rows, limit, "updated_at")
+
+
+async def search_conversations(
+    query: str, limit: int, cursor: Optional[str] = None
+) -> Tuple[List[Row], Optional[str]]:
+    """Full-text search across shards, merging every shard's next `limit + 1` hits.
+
+    Ranks are computed per shard, so across shards they are comparable only as
+    far as the shards hold similar data, which hashing conversation ids makes likely.
+    """
+    pages = await shards.fan_out(
+        "search",
+        lambda session: SearchRepository(session).search(query, limit + 1, cursor),
+    )
+    rows = merge_sorted(
+        [page for page, _ in pages],
+        key=lambda row: (-row.rank, row.kind, -row.conversation_id, -row.uid),
+    )
+    if len(rows) <= limit:
+        return rows, None
+    del rows[limit:]
+    last = rows[-1]
+    return rows, encode_rank_cursor(last.rank, last.kind, last.conversation_id, last.uid)
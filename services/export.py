@@ -0,0 +1,121 @@
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Callable, Optional, Sequence, Type
+
+from pydantic import BaseModel
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Conversation, Message
+from repositories.archive import ArchiveRepository
+from repositories.projections import schema_columns
+from schemas import ConversationOut, MessageOut
+from settings import get_settings
+
+settings = get_settings()
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def stream_ndjson(
+    session_factory: Callable[[], AsyncSession],
+    statement: Select,
+    schema: Type[BaseModel],
+    fetch_size: int,
+    record_type: str = None,
+) -> AsyncIterator[bytes]:
+    """Stream the rows of `statement` as NDJSON through a server-side cursor.
+
+    Rows are fetched `fetch_size` at a time and serialized as they arrive, so
+    memory use does not depend on how many rows the statement returns. With
+    `record_type`, each line is wrapped as {"type": ..., "data": ...}.
+    """
+    async with session_factory() as session:
+        async for chunk in _stream_rows(session, statement, schema, fetch_size, record_type):
+            yield chunk
+
+
+async def _stream_rows(
+    session: AsyncSession,
+    statement: Select,
+    schema: Type[BaseModel],
+    fetch_size: int,
+    record_type: Optional[str],
+) -> AsyncIterator[bytes]:
+    result = await session.stream(statement.execution_options(yield_per=fetch_size))
+    async for rows in result.partitions():
+        lines = []
+        for row in rows:
+            data = schema.model_validate(row).model_dump_json()
+            if record_type:
+                data = f'{{"type":"{record_type}","data":{data}}}'
+            lines.append(data)
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def _begin_snapshot(session: AsyncSession) -> None:
+    """Start the session's transaction so that all its later reads see one snapshot."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    elif dialect == "sqlite":
+        # The driver only opens transactions before writes; a read transaction
+        # keeps its snapshot from its first read until it ends.
+        connection = await session.connection()
+        await connection.exec_driver_sql("BEGIN")
+
+
+async def stream_conversation_messages(
+    session_factory: Callable[[], AsyncSession], conversation_id: int, fetch_size: int
+) -> AsyncIterator[bytes]:
+    """Stream a conversation's messages: archived ones from the cold tier first, then the rest.
+
+    Archived messages are read one segment (one archived month) at a time.
+    """
+    if settings.messages_partitioned:
+        async with session_factory() as session:
+            segments = await ArchiveRepository(session).segments(conversation_id)
+        for segment in segments:
+            archived = await ArchiveRepository.read(segment)
+            for start in range(0, len(archived), fetch_size):
+                lines = [
+                    MessageOut.model_validate(message).model_dump_json()
+                    for message in archived[start:start + fetch_size]
+                ]
+                yield ("\n".join(lines) + "\n").encode()
+    statement = (
+        select(*schema_columns(Message, MessageOut))
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at, Message.id)
+    )
+    async for chunk in stream_ndjson(session_factory, statement, MessageOut, fetch_size):
+        yield chunk
+
+
+async def stream_database(
+    session_factories: Sequence[Callable[[], AsyncSession]], fetch_size: int
+) -> AsyncIterator[bytes]:
+    """Export every conversation, then every message, as typed NDJSON records for backups.
+
+    With several databases (shards), each is exported in turn: all conversations
+    still come before any message. Each database is read in one transaction, so
+    its conversations and messages come from the same snapshot; the snapshots
+    of different shards are taken one after the other.
+    """
+    conversations = select(*schema_columns(Conversation, ConversationOut)).order_by(Conversation.id)
+    messages = select(*schema_columns(Message, MessageOut)).order_by(Message.id)
+    async with AsyncExitStack() as stack:
+        sessions = []
+        for session_factory in session_factories:
+            session = await stack.enter_async_context(session_factory())
+            await _begin_snapshot(session)
+            sessions.append(session)
+        for session in sessions:
+            async for chunk in _stream_rows(
+                session, conversations, ConversationOut, fetch_size, "conversation"
+            ):
+                yield chunk
+        for session in sessions:
+            async for chunk in _stream_rows(
+                session, messages, MessageOut, fetch_size, "message"
+            ):
+                yield chunk
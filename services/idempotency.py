@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional
+
+from metrics import registry
+from services.streaming import ErrorChunk
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+idempotent_requests = registry.counter(
+    "idempotency_requests_total",
+    "Requests carrying an Idempotency-Key, by outcome (started, joined, replayed, conflict)",
+)
+idempotency_evictions = registry.counter(
+    "idempotency_evictions_total", "Completed results evicted from the idempotency store"
+)
+idempotency_entries = registry.gauge("idempotency_entries", "Entries in the idempotency store")
+idempotency_bytes = registry.gauge("idempotency_bytes", "Approximate size of stored idempotent results")
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request."""
+
+
+def request_fingerprint(endpoint: str, *values) -> str:
+    """Hash of what a retry must repeat exactly for its key to be honoured."""
+    payload = json.dumps([endpoint, *values], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Flight:
+    """One generation, shared by every request that carries its key."""
+
+    def __init__(self, fingerprint: str) -> None:
+        self.fingerprint = fingerprint
+        self.chunks: List[str] = []
+        self.size = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        # An ErrorChunk was produced: followers see it, but the result is not kept
+        self.failed = False
+        self.expires_at = float("inf")
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _append(self, chunk: str) -> None:
+        if isinstance(chunk, ErrorChunk):
+            self.failed = True
+        self.chunks.append(chunk)
+        self.size += len(chunk.encode())
+        self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Replay the chunks produced so far, then continue live until the generation ends."""
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class IdempotencyStore:
+    """Single-flight generations keyed by Idempotency-Key, with a bounded result store.
+
+    The first request with a key starts its generation as a detached task, so it
+    keeps running if that client disconnects; every request with the key, the
+    first included, follows the shared chunks. Completed results are kept for
+    `ttl_seconds` and evicted least recently used first beyond `max_entries` or
+    `max_bytes`; generations still running are never evicted. A generation that
+    fails, by raising or by producing an `ErrorChunk`, is forgotten once it ends,
+    so a retry starts over.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size = 0
+        self._entries: "OrderedDict[str, Flight]" = OrderedDict()
+
+    def lookup(self, key: str, fingerprint: str) -> Optional[Flight]:
+        """The running or completed flight for `key`, if any."""
+        flight = self._entries.get(key)
+        if flight is not None and flight.done and flight.expires_at <= time.monotonic():
+            self._remove(key)
+            flight = None
+        if flight is None:
+            return None
+        if flight.fingerprint != fingerprint:
+            idempotent_requests.inc(outcome="conflict")
+            raise IdempotencyConflict(f"Idempotency key {key!r} was used for a different request")
+        self._entries.move_to_end(key)
+        idempotent_requests.inc(outcome="replayed" if flight.done else "joined")
+        return flight
+
+    def start(self, key: str, fingerprint: str, source: AsyncIterator[str]) -> Flight:
+        """Run `source` as the flight for `key`; call after `lookup` found none."""
+        flight = Flight(fingerprint)
+        self._entries[key] = flight
+        flight.task = asyncio.create_task(self._produce(key, flight, source))
+        idempotent_requests.inc(outcome="started")
+        idempotency_entries.set(len(self._entries))
+        return flight
+
+    async def _produce(self, key: str, flight: Flight, source: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in source:
+                flight._append(chunk)
+        except BaseException as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight._notify()
+            if flight.error is not None or flight.failed:
+                if self._entries.get(key) is flight:
+                    self._remove(key)
+            elif self._entries.get(key) is flight:
+                flight.expires_at = time.monotonic() + self.ttl_seconds
+                self.size += flight.size
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = len(self._entries)
+        size = self.size
+        victims = []
+        for key, flight in self._entries.items():
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            if flight.done:
+                victims.append(key)
+                entries -= 1
+                size -= flight.size
+        for key in victims:
+            self._remove(key)
+            idempotency_evictions.inc()
+        idempotency_bytes.set(self.size)
+        idempotency_entries.set(len(self._entries))
+
+    def _remove(self, key: str) -> None:
+        flight = self._entries.pop(key)
+        if flight.done and flight.error is None and not flight.failed:
+            self.size -= flight.size
+        idempotency_bytes.set(self.size)
+        idempotency_entries.set(len(self._entries))
@@ -0,0 +1,177 @@
+import codecs
+import csv
+import json
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List
+
+from pydantic import ValidationError
+
+from metrics import registry
+from repositories.conversations import ConversationRepository
+from repositories.messages import MessageRepository
+from schemas import (
+    BulkConversationsOut,
+    ConversationCreate,
+    ImportBatchResult,
+    ImportReport,
+    MessageImportRow,
+)
+from services.tokens import count_tokens
+from sharding import ShardRouter
+
+imported_rows = registry.counter("bulk_import_rows_total", "Rows written by bulk import, by table")
+import_failed_rows = registry.counter(
+    "bulk_import_failed_rows_total", "Rows rejected by bulk import, by table"
+)
+
+CSV_MEDIA_TYPE = "text/csv"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into text lines without reading it all into memory."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield line  # Rejected by validation and reported with its batch
+
+
+async def iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, str]]:
+    """Parse CSV with a header row; quoted fields may span lines."""
+    header = None
+    record = ""
+    async for line in iter_lines(chunks):
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue  # Inside a quoted field that continues on the next line
+        if record.strip():
+            values = next(csv.reader([record]))
+            if header is None:
+                header = values
+            else:
+                yield dict(zip(header, values))
+        record = ""
+
+
+def message_row(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate an imported message and fill in every column, as COPY requires."""
+    row = MessageImportRow.model_validate(data)
+    prompt_tokens = row.prompt_tokens if row.prompt_tokens is not None else count_tokens(row.prompt_content)
+    response_tokens = row.response_tokens if row.response_tokens is not None else count_tokens(row.response_content)
+    created_at = row.created_at or datetime.now()
+    return {
+        "conversation_id": row.conversation_id,
+        "prompt_content": row.prompt_content,
+        "response_content": row.response_content,
+        "prompt_tokens": prompt_tokens,
+        "response_tokens": response_tokens,
+        "total_tokens": row.total_tokens if row.total_tokens is not None else prompt_tokens + response_tokens,
+        "is_success": row.is_success,
+        "status_code": row.status_code,
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+class BulkImporter:
+    """Batched bulk creation of conversations and messages, e.g. for migrations.
+
+    With sharding, each batch is split by shard into one insert per shard.
+    """
+
+    def __init__(self, shards: ShardRouter, batch_size: int = 1000) -> None:
+        self.shards = shards
+        self.batch_size = batch_size
+
+    async def create_conversations(
+        self, conversations: List[ConversationCreate]
+    ) -> BulkConversationsOut:
+        started = time.perf_counter()
+        ids: List[int] = []
+        for start in range(0, len(conversations), self.batch_size):
+            ids.extend(await self._create_conversations(conversations[start:start + self.batch_size]))
+        imported_rows.inc(len(ids), table="conversations")
+        seconds = time.perf_counter() - started
+        return BulkConversationsOut(
+            ids=ids, seconds=seconds, rows_per_second=len(ids) / seconds if seconds else 0.0
+        )
+
+    async def _create_conversations(self, conversations: List[ConversationCreate]) -> List[int]:
+        ids = await self.shards.allocate_ids(len(conversations))
+        if ids is None:
+            async with self.shards.session_factory(0)() as session:
+                return await ConversationRepository(session).create_many(conversations)
+        rows = list(zip(ids, conversations))
+        for index, group in self.shards.group(rows, lambda row: row[0]).items():
+            async with self.shards.session_factory(index)() as session:
+                await ConversationRepository(session).create_many(
+                    [conversation for _, conversation in group],
+                    ids=[conversation_id for conversation_id, _ in group],
+                )
+        return ids
+
+    async def import_messages(self, records: AsyncIterator[Dict[str, Any]]) -> ImportReport:
+        """Load messages batch by batch; a failing batch is reported and skipped."""
+        started = time.perf_counter()
+        batches: List[ImportBatchResult] = []
+        batch: List[Dict[str, Any]] = []
+        invalid: List[str] = []
+
+        async def flush() -> None:
+            result = ImportBatchResult(batch=len(batches), rows=len(batch) + len(invalid), inserted=0)
+            errors = list(invalid)
+            groups = self.shards.group(batch, lambda row: row["conversation_id"])
+            for index, rows in groups.items():
+                try:
+                    async with self.shards.session_factory(index)() as session:
+                        await MessageRepository(session).copy_many(rows)
+                    result.inserted += len(rows)
+                except Exception as e:
+                    errors.append(str(e).splitlines()[0])
+            if errors:
+                result.error = "; ".join(errors)
+            imported_rows.inc(result.inserted, table="messages")
+            import_failed_rows.inc(result.rows - result.inserted, table="messages")
+            batches.append(result)
+            batch.clear()
+            invalid.clear()
+
+        line = 0
+        async for data in records:
+            line += 1
+            try:
+                batch.append(message_row(data))
+            except ValidationError as e:
+                invalid.append(f"record {line}: {e.errors()[0]['loc']} {e.errors()[0]['msg']}")
+            if len(batch) + len(invalid) >= self.batch_size:
+                await flush()
+        if batch or invalid:
+            await flush()
+
+        seconds = time.perf_counter() - started
+        inserted = sum(b.inserted for b in batches)
+        total = sum(b.rows for b in batches)
+        return ImportReport(
+            total_rows=total,
+            inserted_rows=inserted,
+            failed_rows=total - inserted,
+            seconds=seconds,
+            rows_per_second=inserted / seconds if seconds else 0.0,
+            batches=batches,
+        )
@@ -1,72 +1,218 @@
-from openai import AsyncOpenAI
-from settings import AppSettings
+import asyncio
+import time
+from typing import Dict, List, Optional
+from settings import get_settings
+from metrics import registry
 from models import Conversation
 from repositories.conversations import ConversationRepository
+from services.admission import AdmissionController, AIMDLimit, Priority
+from services.cache import InMemoryLRUCache, ResponseCache, response_cache_key
+from services.context import ConversationContextCache
+from services.routing import ModelRouter
+from services.streaming import ErrorChunk
+from services.tokens import count_tokens
 from sqlalchemy.ext.asyncio import AsyncSession
 
-settings = AppSettings()
+settings = get_settings()
+
+llm_time_to_first_token = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time from request to the first streamed token, by model"
+)
+llm_tokens_per_second = registry.histogram(
+    "llm_tokens_per_second",
+    "Streaming rate after the first token, counted in content chunks, by model",
+    buckets=(5, 10, 20, 40, 60, 80, 120, 200, 400),
+)
+llm_stream_duration = registry.histogram(
+    "llm_stream_duration_seconds",
+    "Total upstream stream duration, by model and outcome (ok, error, cancelled)",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+llm_errors = registry.counter("llm_errors_total", "Failed LLM calls, by operation and error type")
+
+PLACEHOLDER_TITLE = "New Conversation"
+SYSTEM_PROMPT = "You are a helpful AI assistant. Provide clear, concise, and accurate responses."
+TITLE_PROMPT = "Suggest a short, descriptive title (max 50 characters) for the conversation based on the user prompt. Return only the title, nothing else."
+TITLE_MAX_TOKENS = 50
+
+def is_throttled(error: Exception) -> bool:
+    """Whether the upstream API asked us to slow down"""
+    return getattr(error, "status_code", None) in (429, 503)
 
 class LLMService:
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key)
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        context: Optional[ConversationContextCache] = None,
+        admission: Optional[AdmissionController] = None,
+        router: Optional[ModelRouter] = None,
+    ):
+        self.router = router or ModelRouter.from_settings(settings)
+        if cache is None and settings.llm_cache_enabled:
+            cache = InMemoryLRUCache(
+                max_bytes=settings.llm_cache_max_bytes,
+                ttl_seconds=settings.llm_cache_ttl_seconds,
+            )
+        self.cache = cache
+        if context is None and settings.llm_context_enabled:
+            # Imported here so the service can be built without a database configured
+            from sharding import shards
+
+            context = ConversationContextCache(
+                shards.session,
+                token_budget=settings.llm_context_token_budget,
+                max_turns=settings.llm_context_max_turns,
+                max_conversations=settings.llm_context_cache_conversations,
+            )
+        self.context = context
+        if admission is None:
+            admission = AdmissionController(
+                requests_per_minute=settings.llm_requests_per_minute,
+                tokens_per_minute=settings.llm_tokens_per_minute,
+                limit=AIMDLimit(
+                    initial=settings.llm_concurrency_initial,
+                    minimum=settings.llm_concurrency_min,
+                    maximum=settings.llm_concurrency_max,
+                    latency_target=settings.llm_latency_target_ms / 1000,
+                ),
+                max_queue=settings.llm_queue_max,
+                max_wait=settings.llm_queue_max_wait_ms / 1000,
+            )
+        self.admission = admission
+    
+    def check_admission(self, prompt: str) -> None:
+        """Fail fast with `Overloaded` if an interactive call for `prompt` would be rejected"""
+        self.admission.check(
+            Priority.INTERACTIVE, count_tokens(prompt) + settings.llm_expected_response_tokens
+        )
     
     async def generate_conversation_title(self, initial_prompt: str) -> str:
         """Generate a title for the conversation based on the initial prompt"""
+        endpoint = self.router.primary()
+        tokens = count_tokens(TITLE_PROMPT) + count_tokens(initial_prompt) + TITLE_MAX_TOKENS
         try:
-            completion = await self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Suggest a short, descriptive title (max 50 characters) for the conversation based on the user prompt. Return only the title, nothing else.",
-                    },
-                    {
-                        "role": "user",
-                        "content": initial_prompt,
-                    },
-                ],
-                model="gpt-3.5-turbo",
-                max_tokens=50,
-            )
+            async with self.admission.slot(Priority.BACKGROUND, tokens) as slot:
+                try:
+                    completion = await endpoint.client.chat.completions.create(
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": TITLE_PROMPT,
+                            },
+                            {
+                                "role": "user",
+                                "content": initial_prompt,
+                            },
+                        ],
+                        model=endpoint.model,
+                        max_tokens=TITLE_MAX_TOKENS,
+                    )
+                except Exception as e:
+                    slot.throttled = is_throttled(e)
+                    raise
+                slot.first_token()
             return completion.choices[0].message.content.strip()
         except Exception as e:
+            llm_errors.inc(operation="title", error=type(e).__name__)
             print(f"Error generating title: {e}")
-            return "New Conversation"
+            return PLACEHOLDER_TITLE
     
-    async def create_conversation_with_title(
-        self, initial_prompt: str, session: AsyncSession
+    async def create_conversation_with_placeholder_title(
+        self, session: AsyncSession, conversation_id: Optional[int] = None
     ) -> Conversation:
-        """Create a new conversation with an AI-generated title"""
-        title = await self.generate_conversation_title(initial_prompt)
-        
+        """Create a new conversation right away; its title is generated in the background"""
         conversation = Conversation(
-            title=title,
-            model_type="gpt-3.5-turbo"
+            id=conversation_id,
+            title=PLACEHOLDER_TITLE,
+            model_type=settings.default_model,
+            title_pending=True,
         )
         
         return await ConversationRepository(session).create(conversation)
     
-    async def stream_response(self, prompt: str, conversation_id: int = None):
-        """Stream response from OpenAI"""
-        try:
-            stream = await self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful AI assistant. Provide clear, concise, and accurate responses.",
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    },
-                ],
-                model="gpt-3.5-turbo",
-                stream=True,
-            )
-            
-            async for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+    async def replay_response(self, content: str):
+        """Replay a cached response as a fast synthetic stream"""
+        size = settings.llm_cache_replay_chunk_size
+        for start in range(0, len(content), size):
+            yield content[start:start + size]
+            await asyncio.sleep(0)
+    
+    async def build_messages(self, prompt: str, conversation_id: int = None) -> List[Dict[str, str]]:
+        """Build the chat messages for a turn, including recent conversation history"""
+        if conversation_id is not None and self.context is not None:
+            try:
+                return await self.context.build(conversation_id, SYSTEM_PROMPT, prompt)
+            except Exception as e:
+                print(f"Error loading conversation context: {e}")
+        return [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT,
+            },
+            {
+                "role": "user",
+                "content": prompt,
+            },
+        ]
+    
+    def remember_turn(self, conversation_id: int, prompt: str, response: str) -> None:
+        """Keep the conversation history cache current after a turn is stored"""
+        if self.context is not None:
+            self.context.append(conversation_id, prompt, response)
+    
+    async def stream_response(
+        self,
+        prompt: str,
+        conversation_id: int = None,
+        use_cache: bool = True,
+        model_type: Optional[str] = None,
+    ):
+        """Stream response from the conversation's model, serving exact repeats from the response cache"""
+        model = self.router.route_name(model_type)
+        messages = await self.build_messages(prompt, conversation_id)
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = response_cache_key(model, SYSTEM_PROMPT, prompt, messages[1:-1])
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                async for chunk in self.replay_response(cached):
+                    yield chunk
+                return
+        
+        upstream_model = self.router.primary(model).model
+        prompt_tokens = sum(count_tokens(m["content"], upstream_model) for m in messages)
+        reserved = prompt_tokens + settings.llm_expected_response_tokens
+        # Raises Overloaded before anything is yielded, so callers can answer 429/503
+        async with self.admission.slot(Priority.INTERACTIVE, reserved) as slot:
+            chunks: List[str] = []
+            started = time.perf_counter()
+            first_token_at = None
+            outcome = "cancelled"
+            try:
+                async for content in self.router.stream(model, messages):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        llm_time_to_first_token.observe(first_token_at - started, model=model)
+                        slot.first_token()
+                    chunks.append(content)
+                    yield content
+                outcome = "ok"
                     
-        except Exception as e:
-            print(f"Error streaming response: {e}")
-            yield f"Error: {str(e)}" 
\ No newline at end of file
+            except Exception as e:
+                outcome = "error"
+                slot.throttled = is_throttled(e)
+                llm_errors.inc(operation="stream", error=type(e).__name__)
+                print(f"Error streaming response: {e}")
+                yield ErrorChunk(str(e))
+                return
+            finally:
+                finished = time.perf_counter()
+                slot.used_tokens = prompt_tokens + len(chunks)
+                llm_stream_duration.observe(finished - started, model=model, outcome=outcome)
+                if first_token_at is not None and len(chunks) > 1 and finished > first_token_at:
+                    llm_tokens_per_second.observe(
+                        (len(chunks) - 1) / (finished - first_token_at), model=model
+                    )
+        
+        if cache_key is not None:
+            await self.cache.set(cache_key, "".join(chunks))
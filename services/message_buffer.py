@@ -0,0 +1,136 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database import settings
+from metrics import registry
+from models import Message
+from repositories.messages import MessageRepository
+from services.batching import next_batch
+from sharding import ShardRouter, shards
+
+flush_seconds = registry.histogram(
+    "message_buffer_flush_seconds", "Time spent flushing one batch of buffered messages"
+)
+flushed_rows = registry.counter(
+    "message_buffer_flushed_rows_total", "Messages persisted by the write-behind buffer"
+)
+failed_rows = registry.counter(
+    "message_buffer_failed_rows_total", "Messages the write-behind buffer failed to persist"
+)
+backpressure_waits = registry.counter(
+    "message_buffer_backpressure_total", "Submissions that had to wait because the buffer was full"
+)
+pending_rows = registry.gauge(
+    "message_buffer_pending", "Messages waiting in the write-behind buffer"
+)
+
+_STOP = object()
+
+
+def message_values(message: Message) -> Dict[str, Any]:
+    """Column values of a transient Message, timestamped now rather than at flush time."""
+    now = datetime.now()
+    values = {}
+    for column in Message.__table__.columns:
+        if column.key == "id":
+            continue
+        value = getattr(message, column.key)
+        if value is None and column.default is not None and column.default.is_scalar:
+            value = column.default.arg
+        values[column.key] = value
+    values["created_at"] = values["created_at"] or now
+    values["updated_at"] = values["updated_at"] or now
+    return values
+
+
+class MessageWriteBuffer:
+    """In-process write-behind buffer for messages.
+
+    Rows are collected on an asyncio queue and flushed as one multi-row INSERT per shard once
+    `batch_size` rows are pending or `flush_interval` seconds have passed since the
+    first row of the batch arrived. The queue is bounded, so producers wait when the
+    database falls behind instead of growing memory without limit.
+    """
+
+    def __init__(
+        self,
+        shards: ShardRouter,
+        batch_size: int = 50,
+        flush_interval: float = 0.02,
+        max_pending: int = 5000,
+    ) -> None:
+        self.shards = shards
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, message: Message) -> None:
+        """Queue a message for persistence, waiting if the buffer is full."""
+        values = message_values(message)
+        if not self.running:
+            # Not started (or already shut down): write through.
+            await self._flush([values])
+            return
+        if self._queue.full():
+            backpressure_waits.inc()
+        await self._queue.put(values)
+        pending_rows.set(self._queue.qsize())
+
+    async def close(self) -> None:
+        """Flush everything still pending and stop the background task."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = await next_batch(
+                self._queue, self.batch_size, self.flush_interval, _STOP
+            )
+            pending_rows.set(self._queue.qsize())
+            if batch:
+                for group in self.shards.group(batch, lambda values: values["conversation_id"]).values():
+                    await self._flush(group)
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        """Insert rows that all belong to one shard."""
+        started = time.perf_counter()
+        try:
+            async with self.shards.session(batch[0]["conversation_id"]) as session:
+                await MessageRepository(session).create_many(batch)
+            flushed_rows.inc(len(batch))
+        except Exception as e:
+            print(f"Error flushing {len(batch)} buffered messages: {e}")
+            if len(batch) > 1:
+                # Retry row by row so one bad row does not drop the whole batch.
+                for values in batch:
+                    await self._flush([values])
+            else:
+                failed_rows.inc()
+        finally:
+            flush_seconds.observe(time.perf_counter() - started)
+
+
+message_buffer = MessageWriteBuffer(
+    shards,
+    batch_size=settings.message_batch_size,
+    flush_interval=settings.message_batch_window_ms / 1000,
+    max_pending=settings.message_buffer_max_pending,
+)
@@ -0,0 +1,79 @@
+import time
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metrics import registry
+from repositories.conversations import ConversationRepository
+from repositories.messages import MessageRepository
+from schemas import PurgeProgress
+from services.context import invalidate_context
+from services.conversation_lookup import conversation_lookup
+from sharding import ShardRouter
+
+purged_rows = registry.counter("bulk_purge_rows_total", "Rows deleted by bulk purges, by table")
+
+
+class BulkPurger:
+    """Deletes old rows in fixed-size batches, one short transaction per batch.
+
+    Progress is yielded after every batch, so a long purge can be followed as it
+    runs and stopped between batches without leaving a half-applied transaction.
+    Shards are purged one after the other.
+    """
+
+    def __init__(self, shards: ShardRouter, batch_size: int = 1000) -> None:
+        self.shards = shards
+        self.batch_size = batch_size
+
+    def purge_conversations(self, before: datetime) -> AsyncIterator[PurgeProgress]:
+        """Delete conversations inactive since `before`, with their messages."""
+
+        async def delete_batch(session: AsyncSession) -> int:
+            ids = await ConversationRepository(session).delete_inactive(before, self.batch_size)
+            for conversation_id in ids:
+                conversation_lookup.invalidate(conversation_id)
+                invalidate_context(conversation_id)
+            return len(ids)
+
+        return self._purge(delete_batch, "conversations")
+
+    def purge_messages(self, before: datetime) -> AsyncIterator[PurgeProgress]:
+        """Delete messages created before `before`, keeping their conversations.
+
+        The history cache of every conversation that lost messages is dropped by
+        `MessageRepository.delete_older`.
+        """
+
+        async def delete_batch(session: AsyncSession) -> int:
+            return await MessageRepository(session).delete_older(before, self.batch_size)
+
+        return self._purge(delete_batch, "messages")
+
+    async def _purge(
+        self, delete_batch: Callable[[AsyncSession], Awaitable[int]], table: str
+    ) -> AsyncIterator[PurgeProgress]:
+        started = time.perf_counter()
+        total = 0
+        batch = 0
+        factories = self.shards.session_factories
+        for index, session_factory in enumerate(factories):
+            while True:
+                async with session_factory() as session:
+                    deleted = await delete_batch(session)
+                total += deleted
+                purged_rows.inc(deleted, table=table)
+                seconds = time.perf_counter() - started
+                shard_done = deleted < self.batch_size
+                yield PurgeProgress(
+                    batch=batch,
+                    deleted=deleted,
+                    total_deleted=total,
+                    seconds=seconds,
+                    rows_per_second=total / seconds if seconds else 0.0,
+                    done=shard_done and index == len(factories) - 1,
+                )
+                batch += 1
+                if shard_done:
+                    break
@@ -0,0 +1,264 @@
+import asyncio
+import functools
+import time
+from collections import deque
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from metrics import registry
+from settings import AppSettings, ModelRoute
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+hedges_fired = registry.counter(
+    "llm_hedges_total", "Hedged requests sent to a secondary endpoint, by model"
+)
+hedge_wins = registry.counter(
+    "llm_hedge_wins_total", "Streams served by each endpoint position, by model (0 = primary)"
+)
+
+
+class LLMClients:
+    """AsyncOpenAI clients, one per base URL and API key, created on first use.
+
+    Importing openai and setting up a client's connection pool is a large part
+    of a cold start, so neither happens before the first request that needs it.
+    """
+
+    def __init__(self) -> None:
+        self._clients: Dict[Tuple[Optional[str], str], "AsyncOpenAI"] = {}
+
+    def get(self, base_url: Optional[str], api_key: str) -> "AsyncOpenAI":
+        client = self._clients.get((base_url, api_key))
+        if client is None:
+            from openai import AsyncOpenAI
+
+            client = self._clients[(base_url, api_key)] = AsyncOpenAI(
+                api_key=api_key, base_url=base_url
+            )
+        return client
+
+
+class Endpoint:
+    """A client for one OpenAI-compatible endpoint, with its recent time-to-first-token.
+
+    Pass `client`, or `client_factory` to create the client on first use.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        client: Optional["AsyncOpenAI"],
+        model: str,
+        window: int = 200,
+        client_factory: Optional[Callable[[], "AsyncOpenAI"]] = None,
+    ) -> None:
+        self.name = name
+        self._client = client
+        self._client_factory = client_factory
+        self.model = model
+        self.ttft: "deque[float]" = deque(maxlen=window)
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    @client.setter
+    def client(self, client: "AsyncOpenAI") -> None:
+        self._client = client
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.ttft:
+            return None
+        ordered = sorted(self.ttft)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class _OpenedStream:
+    __slots__ = ("stream", "iterator", "first")
+
+    def __init__(self, stream, iterator, first: Optional[str]) -> None:
+        self.stream = stream
+        self.iterator = iterator
+        self.first = first
+
+
+async def _close(stream) -> None:
+    close = getattr(stream, "close", None)
+    if close is not None:
+        try:
+            await close()
+        except Exception:
+            pass
+
+
+def _content(chunk) -> Optional[str]:
+    return chunk.choices[0].delta.content if chunk.choices else None
+
+
+class ModelRouter:
+    """Maps each `model_type` to its endpoints and streams completions from them.
+
+    A stream starts on the primary endpoint. If it has produced no content by
+    the hedge deadline - the configured percentile of the primary's recent
+    time-to-first-token - or fails outright, the same request is sent to the
+    next endpoint; whichever produces content first is streamed and the other
+    attempts are cancelled.
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, List[Endpoint]],
+        default_model: str,
+        hedge: bool = True,
+        percentile: float = 95,
+        initial_delay: float = 2.0,
+        min_delay: float = 0.1,
+        min_samples: int = 20,
+    ) -> None:
+        self.routes = routes
+        self.default_model = default_model
+        self.hedge = hedge
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+
+    @classmethod
+    def from_settings(cls, settings: AppSettings) -> "ModelRouter":
+        clients = LLMClients()
+        routes: Dict[str, List[Endpoint]] = {}
+        route: ModelRoute
+        for model_type, route in settings.model_routes.items():
+            endpoints = []
+            for position, config in enumerate(route.endpoints):
+                base_url = config.base_url or settings.openai_base_url
+                api_key = config.api_key or settings.openai_api_key
+                # Endpoints sharing a base URL and key share one connection pool
+                endpoints.append(Endpoint(
+                    f"{model_type}[{position}]", None, config.model or model_type,
+                    window=settings.llm_hedge_window,
+                    client_factory=functools.partial(clients.get, base_url, api_key),
+                ))
+            routes[model_type] = endpoints
+        return cls(
+            routes,
+            settings.default_model,
+            hedge=settings.llm_hedge_enabled,
+            percentile=settings.llm_hedge_percentile,
+            initial_delay=settings.llm_hedge_initial_delay_ms / 1000,
+            min_delay=settings.llm_hedge_min_delay_ms / 1000,
+        )
+
+    def route_name(self, model_type: Optional[str]) -> str:
+        """The registry entry serving `model_type`; unknown types use the default model."""
+        return model_type if model_type in self.routes else self.default_model
+
+    def endpoints(self, model_type: Optional[str]) -> List[Endpoint]:
+        return self.routes[self.route_name(model_type)]
+
+    def primary(self, model_type: Optional[str] = None) -> Endpoint:
+        return self.endpoints(model_type)[0]
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        """Seconds to wait for the primary's first token before hedging."""
+        if len(endpoint.ttft) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, endpoint.percentile(self.percentile))
+
+    async def _open(self, endpoint: Endpoint, messages: List[Dict[str, str]]) -> _OpenedStream:
+        """Start a stream and read up to its first content chunk."""
+        started = time.monotonic()
+        stream = await endpoint.client.chat.completions.create(
+            messages=messages, model=endpoint.model, stream=True
+        )
+        iterator = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    first = _content(await iterator.__anext__())
+                except StopAsyncIteration:
+                    first = None
+                    break
+                if first is not None:
+                    break
+        except BaseException:
+            await _close(stream)
+            raise
+        endpoint.ttft.append(time.monotonic() - started)
+        return _OpenedStream(stream, iterator, first)
+
+    async def stream(
+        self, model_type: Optional[str], messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        """Stream content chunks for `messages`, hedging across the route's endpoints."""
+        endpoints = self.endpoints(model_type)
+        label = self.route_name(model_type)
+        attempts: Dict[asyncio.Task, int] = {}
+        started: Dict[asyncio.Task, float] = {}
+        next_position = 0
+        deadline = 0.0
+        winner: Optional[_OpenedStream] = None
+        last_error: Optional[BaseException] = None
+        loop = asyncio.get_running_loop()
+
+        def launch() -> None:
+            nonlocal next_position, deadline
+            task = asyncio.create_task(self._open(endpoints[next_position], messages))
+            attempts[task] = next_position
+            started[task] = loop.time()
+            deadline = loop.time() + self.hedge_delay(endpoints[next_position])
+            next_position += 1
+
+        try:
+            launch()
+            while winner is None:
+                can_hedge = self.hedge and next_position < len(endpoints)
+                timeout = max(0.0, deadline - loop.time()) if can_hedge else None
+                done, _ = await asyncio.wait(
+                    attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                failed = False
+                for task in done:
+                    position = attempts.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        failed = True
+                    elif winner is None:
+                        winner = task.result()
+                        hedge_wins.inc(model=label, position=str(position))
+                    else:
+                        await _close(task.result().stream)
+                if winner is not None:
+                    break
+                if next_position < len(endpoints) and (not done or failed):
+                    if done:
+                        # The attempt failed outright; fail over without waiting.
+                        launch()
+                    elif can_hedge:
+                        hedges_fired.inc(model=label)
+                        launch()
+                elif not attempts:
+                    raise last_error
+        finally:
+            for task, position in attempts.items():
+                task.cancel()
+                # A cancelled attempt was at least this slow; keep it in the percentile
+                endpoints[position].ttft.append(loop.time() - started[task])
+            if attempts:
+                await asyncio.gather(*attempts, return_exceptions=True)
+            for task in attempts:
+                if not task.cancelled() and task.exception() is None:
+                    await _close(task.result().stream)
+
+        try:
+            if winner.first is not None:
+                yield winner.first
+            async for chunk in winner.iterator:
+                content = _content(chunk)
+                if content is not None:
+                    yield content
+        finally:
+            await _close(winner.stream)
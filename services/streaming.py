@@ -0,0 +1,156 @@
+import asyncio
+import zlib
+from contextlib import aclosing
+from typing import AsyncGenerator, AsyncIterator, Optional
+
+from metrics import registry
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+class ErrorChunk(str):
+    """The text sent in place of a response when generation failed.
+
+    It is never merged with other chunks, so every stage can check for it:
+    producers record the failure instead of a completed response, and
+    responses report it as an error rather than as model output. The text is
+    "Error: <detail>"; `status_code` and `retry_after` say how to report it.
+    """
+
+    def __new__(
+        cls, detail: str, status_code: int = 502, retry_after: Optional[int] = None
+    ) -> "ErrorChunk":
+        chunk = super().__new__(cls, f"Error: {detail}")
+        chunk.detail = detail
+        chunk.status_code = status_code
+        chunk.retry_after = retry_after
+        return chunk
+
+chunks_in = registry.counter(
+    "llm_stream_chunks_in_total", "Text chunks produced for streamed responses, before coalescing"
+)
+chunks_out = registry.counter(
+    "llm_stream_chunks_out_total", "Writes sent to clients for streamed responses, by framing"
+)
+bytes_out = registry.counter(
+    "llm_stream_bytes_out_total", "Bytes sent to clients for streamed responses, by encoding"
+)
+bytes_uncompressed = registry.counter(
+    "llm_stream_bytes_uncompressed_total", "Bytes of streamed responses before compression, by encoding"
+)
+
+
+async def coalesce(
+    chunks: AsyncGenerator[str, None], max_bytes: int, max_delay: float
+) -> AsyncIterator[str]:
+    """Merge small chunks into one write of at least `max_bytes`, or whatever has
+    arrived `max_delay` seconds after the first buffered chunk.
+
+    The next chunk is awaited in its own task so the deadline can flush a partial
+    buffer while upstream is still silent. When the consumer goes away, that task
+    is cancelled and `chunks` closed, so its cleanup runs. An `ErrorChunk` flushes
+    the buffer and is passed on by itself.
+    """
+    iterator = chunks.__aiter__()
+    loop = asyncio.get_running_loop()
+    buffer = []
+    size = 0
+    deadline: Optional[float] = None
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                task, pending = pending, None
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    break
+                chunks_in.inc()
+                if isinstance(chunk, ErrorChunk):
+                    if buffer:
+                        yield "".join(buffer)
+                        buffer = []
+                        size = 0
+                    deadline = None
+                    yield chunk
+                    continue
+                if not buffer:
+                    deadline = loop.time() + max_delay
+                buffer.append(chunk)
+                size += len(chunk.encode())
+                if size < max_bytes:
+                    continue
+            if buffer:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+            deadline = None
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await chunks.aclose()
+
+
+async def passthrough(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Count chunks when coalescing is off, so the metrics stay comparable."""
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            chunks_in.inc()
+            yield chunk
+
+
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    """Frame text as one server-sent event; each line becomes a `data:` field."""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+async def encode(
+    chunks: AsyncIterator[str], sse: bool = False, gzip_level: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Frame and encode text chunks as the response body.
+
+    With `gzip_level`, the body is one gzip stream, sync-flushed after every
+    write so each chunk reaches the client as soon as it is produced. With `sse`,
+    an `ErrorChunk` is sent as an `error` event and ends the stream without the
+    `done` event.
+    """
+    framing = "sse" if sse else "plain"
+    encoding = "gzip" if gzip_level is not None else "identity"
+    compressor = (
+        zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        if gzip_level is not None
+        else None
+    )
+
+    def write(text: str) -> bytes:
+        data = text.encode()
+        bytes_uncompressed.inc(len(data), encoding=encoding)
+        if compressor is not None:
+            data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        bytes_out.inc(len(data), encoding=encoding)
+        chunks_out.inc(framing=framing)
+        return data
+
+    failed = False
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            if sse and isinstance(chunk, ErrorChunk):
+                failed = True
+                yield write(sse_event(chunk, event="error"))
+                break
+            yield write(sse_event(chunk) if sse else chunk)
+    if sse and not failed:
+        yield write(sse_event("[DONE]", event="done"))
+    if compressor is not None:
+        tail = compressor.flush()
+        bytes_out.inc(len(tail), encoding=encoding)
+        yield tail
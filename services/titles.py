@@ -0,0 +1,142 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, update
+
+from metrics import registry
+from models import Conversation
+from services.batching import next_batch
+from services.conversation_lookup import conversation_lookup
+from sharding import ShardRouter
+
+titles_generated = registry.counter(
+    "title_worker_generated_total", "Conversation titles generated in the background"
+)
+title_batch_seconds = registry.histogram(
+    "title_worker_batch_seconds", "Time to generate and store one batch of conversation titles"
+)
+
+_STOP = object()
+
+
+class TitleWorker:
+    """Generates conversation titles off the request path.
+
+    Conversations are created with a placeholder title and `title_pending` set.
+    The worker collects pending conversations into batches, generates their titles
+    concurrently and stores them with one bulk UPDATE per batch and shard. Callers in this
+    process can wait for a conversation's title with `wait_for_title`.
+    """
+
+    def __init__(
+        self,
+        llm_service,
+        shards: ShardRouter,
+        batch_size: int = 20,
+        batch_window: float = 0.05,
+        concurrency: int = 8,
+        max_pending: int = 10000,
+    ) -> None:
+        self.llm_service = llm_service
+        self.shards = shards
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._events: Dict[int, asyncio.Event] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, conversation_id: int, prompt: str) -> None:
+        """Schedule title generation for a conversation created with a placeholder title."""
+        self._events[conversation_id] = asyncio.Event()
+        if not self.running:
+            await self._process([(conversation_id, prompt)])
+            return
+        await self._queue.put((conversation_id, prompt))
+
+    def is_pending(self, conversation_id: int) -> bool:
+        return conversation_id in self._events
+
+    async def wait_for_title(self, conversation_id: int, timeout: float) -> None:
+        """Wait until the conversation's title has been stored, or `timeout` elapses."""
+        event = self._events.get(conversation_id)
+        if event is None:
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Finish the queued work, giving up after `timeout` seconds."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            print("Title worker did not drain in time; pending conversations keep their placeholder title")
+        self._task = None
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = await next_batch(
+                self._queue, self.batch_size, self.batch_window, _STOP
+            )
+            if batch:
+                await self._process(batch)
+
+    async def _process(self, batch: List[Tuple[int, str]]) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def generate(prompt: str) -> str:
+            async with semaphore:
+                return await self.llm_service.generate_conversation_title(prompt)
+
+        titles = await asyncio.gather(*(generate(prompt) for _, prompt in batch))
+        rows = [
+            {"b_id": conversation_id, "b_title": title}
+            for (conversation_id, _), title in zip(batch, titles)
+        ]
+        try:
+            for index, group in self.shards.group(rows, lambda row: row["b_id"]).items():
+                try:
+                    await self._store(index, group)
+                    titles_generated.inc(len(group))
+                except Exception as e:
+                    print(f"Error storing {len(group)} conversation titles: {e}")
+        finally:
+            for conversation_id, _ in batch:
+                conversation_lookup.invalidate(conversation_id)
+                event = self._events.pop(conversation_id, None)
+                if event is not None:
+                    event.set()
+            title_batch_seconds.observe(loop.time() - started)
+
+    async def _store(self, shard: int, rows: List[Dict[str, object]]) -> None:
+        async with self.shards.session_factory(shard)() as session:
+            # Skip conversations whose title was set explicitly in the meantime.
+            await session.execute(
+                update(Conversation.__table__)
+                .where(
+                    Conversation.__table__.c.id == bindparam("b_id"),
+                    Conversation.__table__.c.title_pending.is_(True),
+                )
+                .values(title=bindparam("b_title"), title_pending=False),
+                rows,
+            )
+            await session.commit()
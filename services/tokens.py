@@ -0,0 +1,39 @@
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is listed in requirements.txt
+    tiktoken = None
+
+# Tokens the chat format adds around every message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """Return the tiktoken encoding for `model`, or None if it cannot be loaded.
+
+    tiktoken downloads encodings on first use, so this can fail on hosts without
+    outbound network access; callers then fall back to an estimate.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Error loading tokenizer for {model}, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Count the tokens `text` encodes to for `model`."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        # Rough fallback of ~4 characters per token for English text
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
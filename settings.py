@@ -1,9 +1,27 @@
 from pydantic_settings import BaseSettings
-from pydantic import Field, validator
-from typing import Optional
+from pydantic import BaseModel, Field, validator
+from sqlalchemy.engine import make_url
+from typing import Dict, List, Optional
+from functools import lru_cache
 import os
 
 
+class LLMEndpoint(BaseModel):
+    """One OpenAI-compatible endpoint serving a model."""
+    
+    # Defaults to OPENAI_BASE_URL / OPENAI_API_KEY
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    # Model name at this endpoint; defaults to the route's model_type
+    model: Optional[str] = None
+
+
+class ModelRoute(BaseModel):
+    """Endpoints for one `model_type`: the first is the primary, the rest are hedges in order."""
+    
+    endpoints: List[LLMEndpoint] = Field(default_factory=lambda: [LLMEndpoint()])
+
+
 class AppSettings(BaseSettings):
     """Application settings with environment variable support and validation."""
     
@@ -18,9 +36,129 @@ class AppSettings(BaseSettings):
     db_name: str = Field(default="ChatbotApplicationDatabase", env="DB_NAME")
     db_user: str = Field(default="postgres", env="DB_USER")
     db_password: str = Field(default="", env="DB_PASSWORD")
+    # Optional read replica for list/read traffic
+    database_read_url: Optional[str] = Field(default=None, env="DATABASE_READ_URL")
+    
+    # Optional horizontal sharding: conversations and their messages are spread over
+    # these databases by conversation id, as a JSON list of URLs. Conversation ids
+    # are allocated from the primary database in blocks of SHARD_ID_BLOCK_SIZE.
+    database_shard_urls: List[str] = Field(default_factory=list, env="DATABASE_SHARD_URLS")
+    shard_id_block_size: int = Field(default=1000, env="SHARD_ID_BLOCK_SIZE")
+    
+    # Connection pool and driver settings
+    db_pool_size: int = Field(default=5, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, env="DB_MAX_OVERFLOW")
+    db_pool_timeout: int = Field(default=30, env="DB_POOL_TIMEOUT")
+    db_pool_pre_ping: bool = Field(default=True, env="DB_POOL_PRE_PING")
+    db_pool_recycle: int = Field(default=1800, env="DB_POOL_RECYCLE")
+    db_statement_cache_size: int = Field(default=100, env="DB_STATEMENT_CACHE_SIZE")
+    db_echo: bool = Field(default=False, env="DB_ECHO")
+    # On boot, upgrade databases that are behind the latest Alembic migration (one
+    # worker at a time); when off, the app refuses to start until `alembic upgrade head`
+    db_auto_migrate: bool = Field(default=True, env="DB_AUTO_MIGRATE")
     
     # OpenAI settings
     openai_api_key: str = Field(..., env="OPENAI_API_KEY")
+    # Point at any OpenAI-compatible server, e.g. the benchmark stand-in
+    openai_base_url: Optional[str] = Field(default=None, env="OPENAI_BASE_URL")
+    
+    # Model registry: one route per Conversation.model_type, as JSON in LLM_MODELS, e.g.
+    # {"gpt-4o-mini": {"endpoints": [{}, {"base_url": "https://backup/v1", "api_key": "..."}]}}
+    # Unknown model types use the DEFAULT_MODEL route.
+    default_model: str = Field(default="gpt-3.5-turbo", env="DEFAULT_MODEL")
+    llm_models: Dict[str, ModelRoute] = Field(default_factory=dict, env="LLM_MODELS")
+    
+    # Hedged requests: when the primary has not produced a first token by the given
+    # percentile of its recent time-to-first-token, the next endpoint is tried too
+    llm_hedge_enabled: bool = Field(default=True, env="LLM_HEDGE_ENABLED")
+    llm_hedge_percentile: float = Field(default=95, env="LLM_HEDGE_PERCENTILE")
+    llm_hedge_initial_delay_ms: int = Field(default=2000, env="LLM_HEDGE_INITIAL_DELAY_MS")
+    llm_hedge_min_delay_ms: int = Field(default=100, env="LLM_HEDGE_MIN_DELAY_MS")
+    llm_hedge_window: int = Field(default=200, env="LLM_HEDGE_WINDOW")
+    
+    # Message write-behind buffer: rows are batched into one multi-row INSERT
+    message_write_behind: bool = Field(default=True, env="MESSAGE_WRITE_BEHIND")
+    message_batch_size: int = Field(default=50, env="MESSAGE_BATCH_SIZE")
+    message_batch_window_ms: int = Field(default=20, env="MESSAGE_BATCH_WINDOW_MS")
+    message_buffer_max_pending: int = Field(default=5000, env="MESSAGE_BUFFER_MAX_PENDING")
+    
+    # Streaming: persist partial responses every N ms while streaming (0 disables)
+    stream_checkpoint_interval_ms: int = Field(default=0, env="STREAM_CHECKPOINT_INTERVAL_MS")
+    # Coalesce small deltas into writes of at least N bytes (0 disables), flushing
+    # whatever has arrived once the first buffered delta is this many ms old
+    stream_coalesce_max_bytes: int = Field(default=256, env="STREAM_COALESCE_MAX_BYTES")
+    stream_coalesce_max_delay_ms: int = Field(default=30, env="STREAM_COALESCE_MAX_DELAY_MS")
+    # gzip streamed responses for clients that accept it
+    stream_gzip_enabled: bool = Field(default=False, env="STREAM_GZIP_ENABLED")
+    stream_gzip_level: int = Field(default=6, env="STREAM_GZIP_LEVEL")
+    
+    # Conversations one chat WebSocket (/llm/chat) may join at a time
+    chat_ws_max_conversations: int = Field(default=32, env="CHAT_WS_MAX_CONVERSATIONS")
+    
+    # Monthly range partitioning of `messages` (PostgreSQL only, applied when the
+    # table is first created) and archival of old partitions to compressed NDJSON
+    # files. Archived conversations are still served, from the files.
+    messages_partitioned: bool = Field(default=False, env="MESSAGES_PARTITIONED")
+    message_partitions_ahead: int = Field(default=3, env="MESSAGE_PARTITIONS_AHEAD")
+    # Archive partitions older than this many whole months (0 disables archival)
+    message_archive_after_months: int = Field(default=0, env="MESSAGE_ARCHIVE_AFTER_MONTHS")
+    message_archive_dir: str = Field(default="archive", env="MESSAGE_ARCHIVE_DIR")
+    message_archive_interval_seconds: int = Field(default=3600, env="MESSAGE_ARCHIVE_INTERVAL_SECONDS")
+    
+    # Rows per batch for the bulk conversation and message import endpoints
+    bulk_batch_size: int = Field(default=1000, env="BULK_BATCH_SIZE")
+    # Rows deleted per transaction by the bulk purge endpoints
+    bulk_purge_batch_size: int = Field(default=1000, env="BULK_PURGE_BATCH_SIZE")
+    
+    # Rows each day and model's usage rollup is split over, so concurrent message
+    # writes do not all update one row; reads add them up
+    usage_rollup_slots: int = Field(default=16, env="USAGE_ROLLUP_SLOTS")
+    
+    # Rows fetched per round trip by the NDJSON streaming exports
+    export_fetch_size: int = Field(default=1000, env="EXPORT_FETCH_SIZE")
+    
+    # Idempotency-Key support on the generate endpoints: completed results are kept
+    # in-process for the TTL, bounded by entry count and size
+    idempotency_max_entries: int = Field(default=10000, env="IDEMPOTENCY_MAX_ENTRIES")
+    idempotency_max_bytes: int = Field(default=64 * 1024 * 1024, env="IDEMPOTENCY_MAX_BYTES")
+    idempotency_ttl_seconds: int = Field(default=3600, env="IDEMPOTENCY_TTL_SECONDS")
+    
+    # Conversation metadata cache used for existence checks
+    conversation_cache_size: int = Field(default=10000, env="CONVERSATION_CACHE_SIZE")
+    conversation_cache_ttl_seconds: int = Field(default=60, env="CONVERSATION_CACHE_TTL_SECONDS")
+    
+    # Exact-match LLM response cache
+    llm_cache_enabled: bool = Field(default=True, env="LLM_CACHE_ENABLED")
+    llm_cache_max_bytes: int = Field(default=64 * 1024 * 1024, env="LLM_CACHE_MAX_BYTES")
+    llm_cache_ttl_seconds: int = Field(default=3600, env="LLM_CACHE_TTL_SECONDS")
+    llm_cache_replay_chunk_size: int = Field(default=64, env="LLM_CACHE_REPLAY_CHUNK_SIZE")
+    
+    # Background conversation title generation
+    title_batch_size: int = Field(default=20, env="TITLE_BATCH_SIZE")
+    title_batch_window_ms: int = Field(default=50, env="TITLE_BATCH_WINDOW_MS")
+    title_concurrency: int = Field(default=8, env="TITLE_CONCURRENCY")
+    title_queue_max_pending: int = Field(default=10000, env="TITLE_QUEUE_MAX_PENDING")
+    
+    # Multi-turn context assembly
+    llm_context_enabled: bool = Field(default=True, env="LLM_CONTEXT_ENABLED")
+    llm_context_token_budget: int = Field(default=3000, env="LLM_CONTEXT_TOKEN_BUDGET")
+    llm_context_max_turns: int = Field(default=20, env="LLM_CONTEXT_MAX_TURNS")
+    llm_context_cache_conversations: int = Field(default=10000, env="LLM_CONTEXT_CACHE_CONVERSATIONS")
+    
+    # LLM admission control: rate budgets (0 = unlimited), adaptive concurrency
+    # limit and the bounded queue for interactive calls
+    llm_requests_per_minute: int = Field(default=3500, env="LLM_REQUESTS_PER_MINUTE")
+    llm_tokens_per_minute: int = Field(default=90000, env="LLM_TOKENS_PER_MINUTE")
+    llm_expected_response_tokens: int = Field(default=256, env="LLM_EXPECTED_RESPONSE_TOKENS")
+    llm_concurrency_initial: int = Field(default=16, env="LLM_CONCURRENCY_INITIAL")
+    llm_concurrency_min: int = Field(default=1, env="LLM_CONCURRENCY_MIN")
+    llm_concurrency_max: int = Field(default=128, env="LLM_CONCURRENCY_MAX")
+    llm_latency_target_ms: int = Field(default=5000, env="LLM_LATENCY_TARGET_MS")
+    llm_queue_max: int = Field(default=100, env="LLM_QUEUE_MAX")
+    llm_queue_max_wait_ms: int = Field(default=10000, env="LLM_QUEUE_MAX_WAIT_MS")
+    
+    # Metrics: in-process counters and histograms served at /metrics
+    metrics_enabled: bool = Field(default=True, env="METRICS_ENABLED")
     
     # (Removed vector DB features) Left intentionally blank to reflect current scope
     
@@ -37,6 +175,13 @@ class AppSettings(BaseSettings):
             raise ValueError("DB_PASSWORD is required when not using DATABASE_URL")
         return v
     
+    @property
+    def model_routes(self) -> Dict[str, ModelRoute]:
+        """The model registry, always including a route for the default model."""
+        routes = dict(self.llm_models)
+        routes.setdefault(self.default_model, ModelRoute())
+        return routes
+    
     @property
     def constructed_database_url(self) -> str:
         """Get database URL, constructing from components if needed."""
@@ -50,11 +195,7 @@ class AppSettings(BaseSettings):
     @property
     def pg_dsn(self) -> str:
         """Get synchronous PostgreSQL DSN for Alembic."""
-        db_url = self.constructed_database_url
-        # Convert asyncpg to psycopg2 for Alembic
-        if "asyncpg" in db_url:
-            return db_url.replace("asyncpg", "psycopg2")
-        return db_url
+        return sync_database_url(self.constructed_database_url)
     
     @property
     def is_production(self) -> bool:
@@ -66,4 +207,25 @@ class AppSettings(BaseSettings):
         env_file_encoding = "utf-8"
         case_sensitive = False
         # Allow extra fields from environment for flexibility
-        extra = "ignore" 
\ No newline at end of file
+        extra = "ignore" 
+
+
+# Async drivers and the synchronous ones Alembic runs migrations with
+_SYNC_DRIVERS = {"asyncpg": "psycopg2", "aiosqlite": "pysqlite"}
+
+
+def sync_database_url(url: str) -> str:
+    """`url` with its async driver swapped for the synchronous one, for Alembic."""
+    parsed = make_url(url)
+    driver = _SYNC_DRIVERS.get(parsed.get_driver_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(
+        hide_password=False
+    )
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> AppSettings:
+    """The process-wide settings, read from the environment once."""
+    return AppSettings()
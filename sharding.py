@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+from contextlib import asynccontextmanager
+from typing import (
+    Annotated,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from fastapi import Depends
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_read_session, async_session, settings, shard_sessions
+from metrics import registry
+from models import IdBlock
+
+T = TypeVar("T")
+
+id_blocks_reserved = registry.counter(
+    "shard_id_blocks_reserved_total", "Id blocks reserved on the primary database, by name"
+)
+fan_out_queries = registry.counter(
+    "shard_fan_out_total", "Operations sent to every shard and merged, by operation"
+)
+
+
+class HiLoAllocator:
+    """Hands out ids from blocks reserved on the primary database.
+
+    Reserving a block is one UPDATE of the `id_blocks` row for `name`; the ids
+    inside it are then handed out from memory, so the shared counter is touched
+    once per `block_size` ids and no two processes ever get the same id. Ids left
+    in a block when the process exits are skipped, not reused.
+    """
+
+    def __init__(
+        self, session_factory: Callable[[], AsyncSession], name: str, block_size: int = 1000
+    ) -> None:
+        self.session_factory = session_factory
+        self.name = name
+        self.block_size = block_size
+        self._next = 0
+        self._limit = 0
+        self._lock = asyncio.Lock()
+
+    async def allocate(self, count: int = 1) -> List[int]:
+        ids: List[int] = []
+        async with self._lock:
+            while len(ids) < count:
+                if self._next >= self._limit:
+                    hi = await self._reserve()
+                    self._next, self._limit = hi * self.block_size, (hi + 1) * self.block_size
+                take = min(count - len(ids), self._limit - self._next)
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+        return ids
+
+    async def _reserve(self) -> int:
+        """Claim the next block number; block 0 is never handed out."""
+        for _ in range(3):
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    update(IdBlock)
+                    .where(IdBlock.name == self.name)
+                    .values(next_hi=IdBlock.next_hi + 1)
+                    .returning(IdBlock.next_hi)
+                    .execution_options(synchronize_session=False)
+                )
+                next_hi = result.scalar()
+                if next_hi is None:
+                    next_hi = 2
+                    session.add(IdBlock(name=self.name, next_hi=next_hi))
+                try:
+                    await session.commit()
+                except IntegrityError:
+                    continue  # Another process created the row first; update it instead
+            id_blocks_reserved.inc(name=self.name)
+            return next_hi - 1
+        raise RuntimeError(f"Could not reserve an id block for {self.name!r}")
+
+
+class ShardRouter:
+    """Routes a conversation, and everything stored with it, to its database.
+
+    Unsharded there is a single shard: the primary, with reads on the replica
+    when one is configured, and conversation ids assigned by the database as
+    before. With shards, a conversation lives on shard `id % len(shards)` and
+    its id comes from a hi/lo allocator on the primary, so consecutive
+    conversations spread evenly and ids never collide across shards. Messages
+    keep per-shard ids; they are only unique together with their conversation.
+    """
+
+    def __init__(
+        self,
+        session_factories: Sequence[Callable[[], AsyncSession]],
+        read_session_factories: Optional[Sequence[Callable[[], AsyncSession]]] = None,
+        allocator: Optional[HiLoAllocator] = None,
+    ) -> None:
+        self.session_factories = list(session_factories)
+        self.read_session_factories = list(read_session_factories or session_factories)
+        self.allocator = allocator
+
+    @property
+    def enabled(self) -> bool:
+        return self.allocator is not None
+
+    def index(self, conversation_id: int) -> int:
+        return conversation_id % len(self.session_factories)
+
+    def session_factory(self, index: int) -> Callable[[], AsyncSession]:
+        return self.session_factories[index]
+
+    def session(self, conversation_id: int) -> AsyncSession:
+        """A session on the conversation's shard."""
+        return self.session_factories[self.index(conversation_id)]()
+
+    def read_session(self, conversation_id: int) -> AsyncSession:
+        """A session for reads on the conversation's shard; may lag behind it when unsharded."""
+        return self.read_session_factories[self.index(conversation_id)]()
+
+    def group(
+        self, items: Iterable[T], conversation_id: Callable[[T], int]
+    ) -> Dict[int, List[T]]:
+        """Items grouped by the shard index of their conversation, each group in input order."""
+        groups: Dict[int, List[T]] = {}
+        for item in items:
+            groups.setdefault(self.index(conversation_id(item)), []).append(item)
+        return groups
+
+    async def allocate_ids(self, count: int) -> Optional[List[int]]:
+        """Ids for `count` new conversations; None unsharded, where the database assigns them."""
+        if self.allocator is None:
+            return None
+        return await self.allocator.allocate(count)
+
+    @asynccontextmanager
+    async def new_conversation(self) -> AsyncIterator[Tuple[Optional[int], AsyncSession]]:
+        """The id for a new conversation and a session on its shard.
+
+        The id is None unsharded, where the database assigns it on insert.
+        """
+        ids = await self.allocate_ids(1)
+        conversation_id = ids[0] if ids is not None else None
+        async with self.session_factories[self.index(conversation_id or 0)]() as session:
+            yield conversation_id, session
+
+    async def fan_out(
+        self, operation: str, call: Callable[[AsyncSession], Awaitable[T]], read: bool = True
+    ) -> List[T]:
+        """Run `call` on every shard concurrently, each in its own session; results in shard order."""
+        factories = self.read_session_factories if read else self.session_factories
+
+        async def run(factory: Callable[[], AsyncSession]) -> T:
+            async with factory() as session:
+                return await call(session)
+
+        if len(factories) == 1:
+            return [await run(factories[0])]
+        fan_out_queries.inc(operation=operation)
+        return list(await asyncio.gather(*(run(factory) for factory in factories)))
+
+
+def merge_sorted(
+    results: Iterable[List[T]], key: Callable[[T], Any], reverse: bool = False
+) -> List[T]:
+    """Merge per-shard results that are each sorted by `key`."""
+    return list(heapq.merge(*results, key=key, reverse=reverse))
+
+
+if settings.database_shard_urls:
+    shards = ShardRouter(
+        shard_sessions,
+        allocator=HiLoAllocator(async_session, "conversations", settings.shard_id_block_size),
+    )
+else:
+    shards = ShardRouter([async_session], [async_read_session])
+
+
+async def get_shard_session(conversation_id: int):
+    """Session on the shard of the `conversation_id` path parameter."""
+    async with shards.session(conversation_id) as session:
+        yield session
+
+
+async def get_read_shard_session(conversation_id: int):
+    """Read session on the shard of the `conversation_id` path parameter."""
+    async with shards.read_session(conversation_id) as session:
+        yield session
+
+
+ShardSessionDep = Annotated[AsyncSession, Depends(get_shard_session)]
+ReadShardSessionDep = Annotated[AsyncSession, Depends(get_read_shard_session)]
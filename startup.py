@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Read from the environment directly: settings import pydantic, whose import is
+# one of the things being timed.
+ENABLED = os.getenv("STARTUP_PROFILE", "").lower() in ("1", "true", "yes", "on")
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _TimedLoader:
+    """Wraps a module loader to time `exec_module`; everything else is passed through."""
+
+    def __init__(self, loader, profiler: "StartupProfiler", component: str) -> None:
+        self._loader = loader
+        self._profiler = profiler
+        self._component = component
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        with self._profiler.importing(self._component):
+            self._loader.exec_module(module)
+
+    def __getattr__(self, name: str):
+        return getattr(self._loader, name)
+
+
+class StartupProfiler:
+    """Import and initialization time per component, for a cold start.
+
+    Imports are timed by a finder at the front of `sys.meta_path` that wraps each
+    module's loader. A module's own time excludes the modules it imports in turn,
+    so the report adds up: first-party modules are listed by name, everything
+    else by top-level package. Initialization steps are timed with `step`.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.steps: List[Tuple[str, float]] = []
+        # Time spent in nested imports, per module being executed
+        self._stack: List[float] = []
+
+    def component(self, name: str, origin: Optional[str]) -> str:
+        if origin and os.path.abspath(origin).startswith(PROJECT_DIR + os.sep) and (
+            "site-packages" not in origin
+        ):
+            return name
+        return name.partition(".")[0]
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, self, self.component(name, spec.origin))
+            return spec
+        return None
+
+    @contextmanager
+    def importing(self, component: str):
+        started = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.imports[component] = self.imports.get(component, 0.0) + elapsed - nested
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - started))
+
+    def report(self, top: int = 25) -> str:
+        total_imports = sum(self.imports.values())
+        total_steps = sum(elapsed for _, elapsed in self.steps)
+        lines = [f"Startup profile: {time.perf_counter() - self.started:.3f}s since profiling began"]
+        lines.append(f"  imports {total_imports:.3f}s")
+        ranked = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)
+        for component, elapsed in ranked[:top]:
+            lines.append(f"    {elapsed:8.3f}s  {component}")
+        if len(ranked) > top:
+            rest = sum(elapsed for _, elapsed in ranked[top:])
+            lines.append(f"    {rest:8.3f}s  ({len(ranked) - top} more)")
+        lines.append(f"  initialization {total_steps:.3f}s")
+        for name, elapsed in self.steps:
+            lines.append(f"    {elapsed:8.3f}s  {name}")
+        return "\n".join(lines)
+
+
+profiler: Optional[StartupProfiler] = None
+
+
+def install() -> None:
+    """Start timing imports when STARTUP_PROFILE is set; call before importing the app."""
+    global profiler
+    if ENABLED and profiler is None:
+        profiler = StartupProfiler()
+        sys.meta_path.insert(0, profiler)
+
+
+@contextmanager
+def step(name: str):
+    """Time one initialization step; does nothing unless profiling."""
+    if profiler is None:
+        yield
+        return
+    with profiler.step(name):
+        yield
+
+
+def finish() -> None:
+    """Stop timing imports, print the report and publish it as gauges."""
+    global profiler
+    if profiler is None:
+        return
+    sys.meta_path.remove(profiler)
+    print(profiler.report())
+    from metrics import registry
+
+    import_seconds = registry.gauge(
+        "startup_import_seconds", "Import time at startup, by component (STARTUP_PROFILE)"
+    )
+    step_seconds = registry.gauge(
+        "startup_step_seconds", "Initialization time at startup, by step (STARTUP_PROFILE)"
+    )
+    for component, elapsed in profiler.imports.items():
+        import_seconds.set(elapsed, component=component)
+    for name, elapsed in profiler.steps:
+        step_seconds.set(elapsed, step=name)
+    profiler = None
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The app reads its settings at import; the tests build their own databases
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from services.admission import AdmissionController, AIMDLimit, Overloaded, Priority
+
+
+def controller(slots: int = 1, max_queue: int = 100, max_wait: float = 10.0, **rates):
+    limit = AIMDLimit(slots, minimum=1, maximum=slots, latency_target=10.0)
+    return AdmissionController(
+        rates.get("requests_per_minute", 0), rates.get("tokens_per_minute", 0),
+        limit, max_queue=max_queue, max_wait=max_wait,
+    )
+
+
+def test_queued_calls_are_admitted_by_priority_then_arrival():
+    async def run():
+        admission = controller()
+        order = []
+
+        async def call(name, priority):
+            async with admission.slot(priority, 1):
+                order.append(name)
+
+        async with admission.slot(Priority.INTERACTIVE, 1):
+            tasks = []
+            for name, priority in [
+                ("background", Priority.BACKGROUND),
+                ("first", Priority.INTERACTIVE),
+                ("second", Priority.INTERACTIVE),
+            ]:
+                tasks.append(asyncio.create_task(call(name, priority)))
+                await asyncio.sleep(0)
+            assert admission.in_flight == 1
+        await asyncio.gather(*tasks)
+        assert order == ["first", "second", "background"]
+        assert admission.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_interactive_call_times_out_in_the_queue():
+    async def run():
+        admission = controller(max_wait=0.05)
+        async with admission.slot(Priority.INTERACTIVE, 1):
+            with pytest.raises(Overloaded) as error:
+                async with admission.slot(Priority.INTERACTIVE, 1):
+                    pass
+        assert (error.value.status_code, error.value.reason) == (503, "queue timeout")
+        # The abandoned waiter is neither counted nor admitted later
+        assert admission._queued[Priority.INTERACTIVE] == 0
+        assert admission.in_flight == 0
+        async with admission.slot(Priority.INTERACTIVE, 1):
+            assert admission.in_flight == 1
+
+    asyncio.run(run())
+
+
+def test_full_queue_and_exhausted_rate_budget_are_rejected_up_front():
+    async def run():
+        admission = controller(max_queue=1)
+
+        async def queued():
+            async with admission.slot(Priority.INTERACTIVE, 1):
+                pass
+
+        async with admission.slot(Priority.INTERACTIVE, 1):
+            waiting = asyncio.create_task(queued())
+            await asyncio.sleep(0)
+            with pytest.raises(Overloaded) as error:
+                admission.check(Priority.INTERACTIVE, 1)
+            assert error.value.status_code == 503
+            # Background calls are never rejected
+            admission.check(Priority.BACKGROUND, 1)
+        await waiting
+
+        limited = controller(slots=4, requests_per_minute=1)
+        async with limited.slot(Priority.INTERACTIVE, 1):
+            pass
+        with pytest.raises(Overloaded) as error:
+            limited.check(Priority.INTERACTIVE, 1)
+        assert error.value.status_code == 429
+        assert error.value.retry_after > 0
+
+    asyncio.run(run())
+
+
+def test_aimd_limit_grows_additively_and_backs_off_once_per_cooldown():
+    limit = AIMDLimit(8, minimum=2, maximum=9, latency_target=1.0, backoff=0.5, cooldown=60.0)
+    limit.succeeded(0.1)
+    assert limit.limit == pytest.approx(8.125)
+    limit.throttled()
+    assert limit.limit == pytest.approx(4.0625)
+    # A slow call inside the cooldown is part of the same burst
+    limit.succeeded(5.0)
+    assert limit.limit == pytest.approx(4.0625)
+
+    floor = AIMDLimit(3, minimum=2, maximum=9, latency_target=1.0, backoff=0.5, cooldown=0.0)
+    floor.throttled()
+    floor.throttled()
+    assert floor.limit == 2
+    for _ in range(100):
+        floor.succeeded(0.1)
+    assert floor.limit == 9
+
+
+def test_throttled_upstream_call_lowers_the_concurrency_limit():
+    async def run():
+        admission = AdmissionController(0, 0, AIMDLimit(4, 1, 4, latency_target=10.0, cooldown=60.0))
+        async with admission.slot(Priority.INTERACTIVE, 1) as slot:
+            slot.throttled = True
+        assert admission.limit.slots == 2
+
+    asyncio.run(run())
@@ -0,0 +1,45 @@
+import asyncio
+
+from services.cache import InMemoryLRUCache, normalize_prompt, response_cache_key
+
+
+def test_least_recently_used_entries_are_evicted_beyond_max_bytes():
+    async def run():
+        # Each entry is a 1-byte key plus a 10-byte value
+        cache = InMemoryLRUCache(max_bytes=33, ttl_seconds=60)
+        for key in "abc":
+            await cache.set(key, key * 10)
+        assert await cache.get("a") == "a" * 10
+        await cache.set("d", "d" * 10)
+        assert await cache.get("b") is None
+        assert [await cache.get(key) for key in "acd"] == ["a" * 10, "c" * 10, "d" * 10]
+        assert cache.size == 33
+
+        # Replacing an entry does not count it twice; an oversized value is not cached
+        await cache.set("a", "A" * 10)
+        assert cache.size == 33
+        await cache.set("huge", "x" * 100)
+        assert await cache.get("huge") is None
+        assert cache.size == 33
+
+    asyncio.run(run())
+
+
+def test_expired_entries_are_dropped_on_read():
+    async def run():
+        cache = InMemoryLRUCache(max_bytes=1024, ttl_seconds=0)
+        await cache.set("a", "value")
+        assert await cache.get("a") is None
+        assert cache.size == 0
+
+    asyncio.run(run())
+
+
+def test_cache_key_covers_model_history_and_normalized_prompt():
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    key = response_cache_key("gpt", "system", "What  is\tit?", history)
+    assert key == response_cache_key("gpt", "system", " What is it? ", history)
+    assert key != response_cache_key("other", "system", "What is it?", history)
+    assert key != response_cache_key("gpt", "system", "What is it?", history[:1])
+    assert key != response_cache_key("gpt", "system", "What is it?")
+    assert normalize_prompt("ｆｕｌｌ width") == "full width"
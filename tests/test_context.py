@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import create_engine_for
+from models import Base, Conversation, Message
+from repositories.messages import MessageRepository
+from services.context import ConversationContextCache, invalidate_context
+from services.conversations import ConversationService
+
+
+@pytest.fixture
+def context(tmp_path):
+    """A context cache over one SQLite database with conversations 1 and 2, one turn each."""
+    # The app's engine setup, so SQLite cascades deletes to the messages
+    engine = create_engine_for(f"sqlite+aiosqlite:///{tmp_path / 'context.db'}", "context")
+    factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    loads = []
+
+    def session_factory(conversation_id):
+        loads.append(conversation_id)
+        return factory()
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with factory() as session:
+            for conversation_id in (1, 2):
+                session.add(Conversation(id=conversation_id, title="chat", model_type="gpt-3.5-turbo"))
+                session.add(Message(
+                    conversation_id=conversation_id, prompt_content=f"question {conversation_id}",
+                    response_content="answer", prompt_tokens=1, response_tokens=1, total_tokens=2,
+                ))
+            await session.commit()
+
+    asyncio.run(setup())
+    cache = ConversationContextCache(session_factory, max_conversations=1)
+    yield cache, factory, loads
+    asyncio.run(engine.dispose())
+
+
+def prompts(turns):
+    return [turn.prompt for turn in turns]
+
+
+def test_history_is_loaded_once_then_kept_current(context):
+    cache, factory, loads = context
+
+    async def run():
+        assert prompts(await cache.history(1)) == ["question 1"]
+        cache.append(1, "follow-up", "answer")
+        messages = await cache.build(1, "system", "next")
+        assert [m["content"] for m in messages] == [
+            "system", "question 1", "answer", "follow-up", "answer", "next",
+        ]
+        assert loads == [1]
+
+    asyncio.run(run())
+
+
+def test_least_recently_used_conversation_is_evicted(context):
+    cache, factory, loads = context
+
+    async def run():
+        await cache.history(1)
+        await cache.history(2)
+        await cache.history(1)
+        assert loads == [1, 2, 1]
+
+    asyncio.run(run())
+
+
+def test_changing_or_deleting_messages_invalidates_the_history(context):
+    cache, factory, loads = context
+
+    async def run():
+        await cache.history(1)
+        async with factory() as session:
+            message = (await MessageRepository(session).list_by_conversation(1))[0]
+            message.prompt_content = "edited"
+            await MessageRepository(session).update(message.id, message)
+        assert prompts(await cache.history(1)) == ["edited"]
+
+        async with factory() as session:
+            await MessageRepository(session).delete(message.id)
+        assert prompts(await cache.history(1)) == []
+
+        await cache.history(1)
+        invalidate_context()
+        await cache.history(1)
+        assert loads == [1, 1, 1, 1]
+
+    asyncio.run(run())
+
+
+def test_deleting_a_conversation_invalidates_its_history(context):
+    cache, factory, loads = context
+
+    async def run():
+        assert prompts(await cache.history(1)) == ["question 1"]
+        async with factory() as session:
+            await ConversationService(session).delete(1)
+        assert prompts(await cache.history(1)) == []
+
+    asyncio.run(run())
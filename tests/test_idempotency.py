@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from services.idempotency import IdempotencyConflict, IdempotencyStore
+from services.streaming import ErrorChunk
+
+
+class Generation:
+    """A source that yields `chunks` one at a time, each once `step` is set."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.runs = 0
+        self.step = asyncio.Event()
+
+    async def stream(self):
+        self.runs += 1
+        for chunk in self.chunks:
+            await self.step.wait()
+            yield chunk
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def store(**limits):
+    return IdempotencyStore(
+        limits.get("max_entries", 100), limits.get("max_bytes", 1 << 20), limits.get("ttl", 60.0)
+    )
+
+
+def test_concurrent_requests_share_one_generation_and_a_retry_replays_it():
+    async def run():
+        results = store()
+        generation = Generation(["a", "b", "c"])
+        assert results.lookup("key", "fp") is None
+        first = asyncio.create_task(collect(results.start("key", "fp", generation.stream()).follow()))
+        await asyncio.sleep(0)
+        joined = results.lookup("key", "fp")
+        assert joined is not None and not joined.done
+        second = asyncio.create_task(collect(joined.follow()))
+        generation.step.set()
+        assert await first == await second == ["a", "b", "c"]
+
+        replayed = results.lookup("key", "fp")
+        assert replayed.done
+        assert await collect(replayed.follow()) == ["a", "b", "c"]
+        assert generation.runs == 1
+        assert results.size == 3
+        with pytest.raises(IdempotencyConflict):
+            results.lookup("key", "other fingerprint")
+
+    asyncio.run(run())
+
+
+def test_failed_generations_are_not_replayed():
+    async def run():
+        results = store()
+        failing = Generation(["partial", ErrorChunk("upstream down")])
+        failing.step.set()
+        chunks = await collect(results.start("key", "fp", failing.stream()).follow())
+        assert chunks == ["partial", "Error: upstream down"]
+        assert isinstance(chunks[-1], ErrorChunk)
+        assert results.lookup("key", "fp") is None
+        assert results.size == 0
+
+        async def broken():
+            yield "partial"
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await collect(results.start("key", "fp", broken()).follow())
+        assert results.lookup("key", "fp") is None
+        assert results.size == 0
+
+    asyncio.run(run())
+
+
+def test_completed_results_expire_and_are_evicted_least_recently_used_first():
+    async def run():
+        results = store(max_entries=2, ttl=60.0)
+        for key in ("a", "b"):
+            generation = Generation([key * 10])
+            generation.step.set()
+            await collect(results.start(key, "fp", generation.stream()).follow())
+        results.lookup("a", "fp")
+        generation = Generation(["c"])
+        generation.step.set()
+        await collect(results.start("c", "fp", generation.stream()).follow())
+        assert results.lookup("b", "fp") is None
+        assert results.lookup("a", "fp") is not None
+        assert results.size == 11
+
+        expiring = store(ttl=0.0)
+        generation = Generation(["x"])
+        generation.step.set()
+        await collect(expiring.start("x", "fp", generation.stream()).follow())
+        assert expiring.lookup("x", "fp") is None
+        assert expiring.size == 0
+
+    asyncio.run(run())
+
+
+def test_running_generations_are_never_evicted():
+    async def run():
+        results = store(max_entries=1)
+        running = Generation(["slow"])
+        flight = results.start("running", "fp", running.stream())
+        done = Generation(["fast"])
+        done.step.set()
+        await collect(results.start("done", "fp", done.stream()).follow())
+        assert results.lookup("running", "fp") is flight
+        running.step.set()
+        assert await collect(flight.follow()) == ["slow"]
+
+    asyncio.run(run())
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from models import Base, Conversation, Message
+from repositories.messages import MessageRepository
+from services.message_buffer import MessageWriteBuffer
+from sharding import ShardRouter
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """One SQLite shard holding conversation 1, and a log of the batches inserted."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'buffer.db'}")
+    factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with factory() as session:
+            session.add(Conversation(id=1, title="chat", model_type="gpt-3.5-turbo"))
+            await session.commit()
+
+    asyncio.run(setup())
+    batches = []
+    create_many = MessageRepository.create_many
+
+    async def logged(self, messages):
+        batches.append(len(messages))
+        await create_many(self, messages)
+
+    monkeypatch.setattr(MessageRepository, "create_many", logged)
+    yield ShardRouter([factory]), factory, batches
+    asyncio.run(engine.dispose())
+
+
+def message(prompt="hi") -> Message:
+    return Message(
+        conversation_id=1, prompt_content=prompt, response_content="answer",
+        prompt_tokens=1, response_tokens=1, total_tokens=2,
+    )
+
+
+async def stored(factory):
+    async with factory() as session:
+        result = await session.execute(select(Message.prompt_content).order_by(Message.id))
+        return list(result.scalars().all())
+
+
+def test_full_batch_is_flushed_as_one_insert(database):
+    shards, factory, batches = database
+
+    async def run():
+        buffer = MessageWriteBuffer(shards, batch_size=3, flush_interval=60.0)
+        await buffer.start()
+        for index in range(3):
+            await buffer.submit(message(f"m{index}"))
+        for _ in range(100):
+            if batches:
+                break
+            await asyncio.sleep(0.01)
+        assert batches == [3]
+        assert await stored(factory) == ["m0", "m1", "m2"]
+        await buffer.close()
+
+    asyncio.run(run())
+
+
+def test_partial_batch_is_flushed_after_the_window(database):
+    shards, factory, batches = database
+
+    async def run():
+        buffer = MessageWriteBuffer(shards, batch_size=100, flush_interval=0.05)
+        await buffer.start()
+        await buffer.submit(message("a"))
+        await buffer.submit(message("b"))
+        await asyncio.sleep(0.3)
+        assert batches == [2]
+        assert await stored(factory) == ["a", "b"]
+        await buffer.close()
+
+    asyncio.run(run())
+
+
+def test_close_flushes_pending_messages_and_later_submits_write_through(database):
+    shards, factory, batches = database
+
+    async def run():
+        buffer = MessageWriteBuffer(shards, batch_size=100, flush_interval=60.0)
+        await buffer.start()
+        await buffer.submit(message("pending"))
+        await buffer.close()
+        assert await stored(factory) == ["pending"]
+        await buffer.submit(message("direct"))
+        assert await stored(factory) == ["pending", "direct"]
+
+    asyncio.run(run())
+
+
+def test_failed_batch_is_retried_row_by_row(database):
+    shards, factory, batches = database
+
+    async def run():
+        buffer = MessageWriteBuffer(shards, batch_size=3, flush_interval=60.0)
+        await buffer.start()
+        await buffer.submit(message("good"))
+        await buffer.submit(message(None))
+        await buffer.submit(message("also good"))
+        await buffer.close()
+        # The batch fails on the NULL prompt; each row is then inserted on its own
+        assert batches == [3, 1, 1, 1]
+        assert await stored(factory) == ["good", "also good"]
+
+    asyncio.run(run())
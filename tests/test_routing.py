@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.routing import Endpoint, ModelRouter
+
+
+class FakeStream:
+    def __init__(self, words, delay: float) -> None:
+        self.words = words
+        self.delay = delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        await asyncio.sleep(self.delay)
+        for word in self.words:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeEndpoint:
+    """An OpenAI-compatible client whose first token takes `delay` seconds."""
+
+    def __init__(self, name: str, delay: float = 0.0, error: Exception = None) -> None:
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.streams = []
+
+    async def create(self, messages, model, stream=False, **kwargs):
+        if self.error is not None:
+            raise self.error
+        response = FakeStream([f"{self.name} ", "answer"], self.delay)
+        self.streams.append(response)
+        return response
+
+    def endpoint(self) -> Endpoint:
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self.create)))
+        return Endpoint(self.name, client, "model")
+
+
+def route(*fakes, **options) -> ModelRouter:
+    options.setdefault("initial_delay", 0.05)
+    return ModelRouter({"m": [fake.endpoint() for fake in fakes]}, "m", **options)
+
+
+async def collect(router: ModelRouter):
+    return "".join([chunk async for chunk in router.stream("m", [{"role": "user", "content": "hi"}])])
+
+
+def test_fast_primary_is_not_hedged():
+    primary, secondary = FakeEndpoint("primary"), FakeEndpoint("secondary")
+    assert asyncio.run(collect(route(primary, secondary))) == "primary answer"
+    assert secondary.streams == []
+    assert primary.streams[0].closed
+
+
+def test_slow_primary_is_hedged_and_the_losing_attempt_cancelled():
+    primary, secondary = FakeEndpoint("primary", delay=5.0), FakeEndpoint("secondary")
+    router = route(primary, secondary)
+
+    async def run():
+        started = asyncio.get_running_loop().time()
+        text = await collect(router)
+        return text, asyncio.get_running_loop().time() - started
+
+    text, elapsed = asyncio.run(run())
+    assert text == "secondary answer"
+    assert elapsed < 1.0
+    # The primary's attempt was cancelled and its stream closed, not left running
+    assert primary.streams[0].closed
+    # ...and it still counts towards the primary's time-to-first-token
+    assert len(router.primary("m").ttft) == 1
+
+
+def test_failed_primary_fails_over_without_waiting_for_the_hedge_delay():
+    primary = FakeEndpoint("primary", error=RuntimeError("down"))
+    secondary = FakeEndpoint("secondary")
+    router = route(primary, secondary, initial_delay=60.0)
+    assert asyncio.run(asyncio.wait_for(collect(router), 5)) == "secondary answer"
+
+
+def test_error_is_raised_when_every_endpoint_fails():
+    router = route(
+        FakeEndpoint("primary", error=RuntimeError("first")),
+        FakeEndpoint("secondary", error=RuntimeError("second")),
+    )
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(router))
+
+
+def test_hedge_delay_follows_the_primary_percentile_once_sampled():
+    router = route(FakeEndpoint("primary"), initial_delay=2.0, min_delay=0.1, min_samples=10)
+    endpoint = router.primary("m")
+    assert router.hedge_delay(endpoint) == 2.0
+    endpoint.ttft.extend([0.5] * 9 + [3.0])
+    assert router.hedge_delay(endpoint) == 3.0
+    endpoint.ttft.clear()
+    endpoint.ttft.extend([0.01] * 10)
+    assert router.hedge_delay(endpoint) == 0.1
@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import services.conversations as conversations
+from models import Base, Conversation, Message
+from sharding import HiLoAllocator, ShardRouter
+
+SHARDS = 3
+
+
+async def make_router(tmp_path, block_size: int = 4):
+    engines = [
+        create_async_engine(f"sqlite+aiosqlite:///{tmp_path / f'shard{index}.db'}")
+        for index in range(SHARDS)
+    ]
+    for engine in engines:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    factories = [
+        async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        for engine in engines
+    ]
+    router = ShardRouter(
+        factories, allocator=HiLoAllocator(factories[0], "conversations", block_size)
+    )
+    return router, engines
+
+
+async def populate(router: ShardRouter, count: int):
+    """`count` conversations, one message each, all with the same text."""
+    started = datetime(2026, 1, 1)
+    ids = await router.allocate_ids(count)
+    for position, conversation_id in enumerate(ids):
+        created_at = started + timedelta(minutes=position)
+        async with router.session(conversation_id) as session:
+            session.add(Conversation(
+                id=conversation_id, title=f"chat {position}", model_type="gpt-3.5-turbo",
+                created_at=created_at, updated_at=created_at,
+            ))
+            session.add(Message(
+                conversation_id=conversation_id, prompt_content="shared needle",
+                response_content="answer", prompt_tokens=2, response_tokens=1, total_tokens=3,
+                created_at=created_at, updated_at=created_at,
+            ))
+            await session.commit()
+    return ids
+
+
+async def page_through(fetch, limit: int):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = await fetch(limit, cursor)
+        seen.extend(rows)
+        if cursor is None:
+            return seen
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    async def setup():
+        router, engines = await make_router(tmp_path)
+        ids = await populate(router, 10)
+        return router, engines, ids
+
+    router, engines, ids = asyncio.run(setup())
+    monkeypatch.setattr(conversations, "shards", router)
+    yield router, ids
+    for engine in engines:
+        asyncio.run(engine.dispose())
+
+
+def test_allocated_ids_are_unique_and_spread_over_shards(tmp_path):
+    async def run():
+        router, engines = await make_router(tmp_path, block_size=3)
+        # A second process shares the primary's id_blocks row, but not the first one's block
+        other = HiLoAllocator(router.session_factory(0), "conversations", 3)
+        ids = await router.allocate_ids(5) + await other.allocate(5) + await router.allocate_ids(5)
+        for engine in engines:
+            await engine.dispose()
+        return router, ids
+
+    router, ids = asyncio.run(run())
+    assert len(set(ids)) == len(ids)
+    assert 0 not in ids
+    assert {router.index(conversation_id) for conversation_id in ids} == set(range(SHARDS))
+
+
+def test_listing_pages_merge_every_shard(sharded):
+    router, ids = sharded
+    newest_first = list(reversed(ids))
+
+    async def run():
+        full, _ = await conversations.list_conversation_page_rows(100)
+        pages = {
+            limit: await page_through(conversations.list_conversation_page_rows, limit)
+            for limit in (1, 2, 3)
+        }
+        offset = await conversations.list_conversation_rows(2, 3)
+        return full, pages, offset
+
+    full, pages, offset = asyncio.run(run())
+    assert [row.id for row in full] == newest_first
+    for rows in pages.values():
+        assert [row.id for row in rows] == newest_first
+    assert [row.id for row in offset] == newest_first[2:5]
+
+
+def test_search_pages_do_not_drop_hits_with_colliding_message_ids(sharded):
+    router, ids = sharded
+
+    def key(row):
+        return row.kind, row.conversation_id, row.message_id
+
+    async def run():
+        full, cursor = await conversations.search_conversations("needle", 100)
+        assert cursor is None
+        pages = {
+            limit: await page_through(
+                lambda limit, cursor: conversations.search_conversations("needle", limit, cursor),
+                limit,
+            )
+            for limit in (1, 2, 3)
+        }
+        return full, pages
+
+    full, pages = asyncio.run(run())
+    assert len(full) == len(ids)
+    # Every shard numbers its messages from 1
+    assert len({row.message_id for row in full}) < len(full)
+    for rows in pages.values():
+        assert [key(row) for row in rows] == [key(row) for row in full]
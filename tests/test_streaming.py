@@ -0,0 +1,67 @@
+import asyncio
+import gzip
+
+from services.streaming import ErrorChunk, coalesce, encode
+
+
+async def timed(*items):
+    """Yield strings; a number sleeps that many seconds first."""
+    for item in items:
+        if isinstance(item, (int, float)):
+            await asyncio.sleep(item)
+        else:
+            yield item
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_coalesce_flushes_once_max_bytes_have_arrived():
+    chunks = asyncio.run(collect(coalesce(timed("ab", "cd", "ef", "g"), 4, 60.0)))
+    assert chunks == ["abcd", "efg"]
+
+
+def test_coalesce_flushes_a_partial_buffer_after_max_delay():
+    chunks = asyncio.run(collect(coalesce(timed("a", "b", 0.2, "c"), 1024, 0.05)))
+    assert chunks == ["ab", "c"]
+
+
+def test_coalesce_passes_error_chunks_through_unmerged():
+    chunks = asyncio.run(collect(coalesce(timed("a", "b", ErrorChunk("boom")), 1024, 60.0)))
+    assert chunks == ["ab", "Error: boom"]
+    assert isinstance(chunks[1], ErrorChunk)
+    assert not isinstance(chunks[0], ErrorChunk)
+
+
+def test_coalesce_closes_the_source_when_the_consumer_stops():
+    closed = asyncio.Event()
+
+    async def source():
+        try:
+            yield "a"
+            await asyncio.sleep(60)
+            yield "b"
+        finally:
+            closed.set()
+
+    async def run():
+        chunks = coalesce(source(), 1, 60.0)
+        assert await chunks.__anext__() == "a"
+        await chunks.aclose()
+        assert closed.is_set()
+
+    asyncio.run(run())
+
+
+def test_encode_frames_server_sent_events_and_reports_errors():
+    body = b"".join(asyncio.run(collect(encode(timed("a\nb", "c"), sse=True))))
+    assert body == b"data: a\ndata: b\n\ndata: c\n\nevent: done\ndata: [DONE]\n\n"
+
+    body = b"".join(asyncio.run(collect(encode(timed("a", ErrorChunk("boom")), sse=True))))
+    assert body == b"data: a\n\nevent: error\ndata: Error: boom\n\n"
+
+
+def test_encode_gzip_stream_decompresses_to_the_chunks():
+    body = b"".join(asyncio.run(collect(encode(timed("hello ", "world"), gzip_level=6))))
+    assert gzip.decompress(body) == b"hello world"